@@ -0,0 +1 @@
+"""Benchmarks of the Report Portal client, not a part of the package."""
@@ -0,0 +1,116 @@
+"""Measure the memory the async mode holds for every queued test item.
+
+Run from the repository root::
+
+    python -m benchmarks.allocations --items 10000 --logs 2
+
+The items of a parameterised suite share their attributes and parameters.
+They are queued while the requests are held back, so the memory traced
+after queuing them is what a launch reported faster than the server takes
+it costs, divided by the number of items: the request tasks, the payloads
+and the bookkeeping of the service.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+from reportportal_client import ReportPortalService
+from tests.stub_server import StubServer
+
+
+def _timestamp():
+    return str(int(time.time() * 1000))
+
+
+class _Gate(object):
+    """Limiter which holds all the requests back until it is opened."""
+
+    def __init__(self):
+        self.opened = threading.Event()
+
+    def acquire(self):
+        self.opened.wait()
+        return time.time()
+
+    def release(self, started, latency, status=None, error=None, kind=None,
+                size=0):
+        pass
+
+    def snapshot(self):
+        return None
+
+
+def measure(items, logs, workers=4):
+    """Queue a suite of items and trace the memory it holds.
+
+    :param items:   number of test items
+    :param logs:    number of logs of every item
+    :param workers: number of async workers
+    :return dict:   bytes and memory blocks per item and the time per item
+    """
+    attributes = {"suite": "parameterised", "os": "linux", "python": "3"}
+    gate = _Gate()
+    with StubServer() as stub:
+        service = ReportPortalService(stub.endpoint, stub.project, "token",
+                                      async_requests=True,
+                                      async_workers=workers, limiter=gate)
+        service.start_launch(name="Allocations", start_time=_timestamp())
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        start = time.time()
+        for i in range(items):
+            item_id = service.start_test_item(
+                name="test[{0}]".format(i), start_time=_timestamp(),
+                item_type="STEP", attributes=dict(attributes),
+                parameters={"case": i % 10})
+            for j in range(logs):
+                service.log(time=_timestamp(), message="Log message",
+                            level="INFO", item_id=item_id)
+            service.finish_test_item(item_id=item_id, end_time=_timestamp(),
+                                     status="PASSED",
+                                     attributes=dict(attributes))
+        elapsed = time.time() - start
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        gate.opened.set()
+        service.finish_launch(end_time=_timestamp())
+        service.terminate()
+
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+    return {"items": items,
+            "logs_per_item": logs,
+            "bytes_per_item": size / float(items),
+            "blocks_per_item": blocks / float(items),
+            "us_per_item": elapsed / items * 1e6,
+            "requests": stub.request_count}
+
+
+def main(argv=None):
+    """Run the benchmark from the command line.
+
+    :param argv: command line arguments without the program name
+    :return int: exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.allocations")
+    parser.add_argument("--items", type=int, default=10000,
+                        help="number of test items")
+    parser.add_argument("--logs", type=int, default=2,
+                        help="number of logs of every item")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of async workers")
+    args = parser.parse_args(argv)
+
+    report = measure(args.items, args.logs, args.workers)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Measure the time it takes to import the client in a new interpreter.
+
+Run from the repository root::
+
+    python -m benchmarks.import_time --runs 20
+
+Every run starts a fresh Python process, as a test process or an xdist
+worker does, and times the import of the package. The modules the import
+loads are listed, heavy ones like pkg_resources must not be among them.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.workload import percentile
+
+MODULE = "reportportal_client"
+# modules which must only be imported when they are used
+LAZY_MODULES = ("pkg_resources",)
+
+_SCRIPT = """
+import json, sys, time
+start = time.time()
+import {module}
+elapsed = time.time() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module=MODULE, runs=10):
+    """Import the module in new interpreters and time it.
+
+    :param module: name of the module to import
+    :param runs:   number of interpreters to start
+    :return dict:  import times in seconds and the loaded lazy modules
+    """
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _SCRIPT.format(module=module)])
+        result = json.loads(output.decode("utf-8"))
+        times.append(result["elapsed"])
+        loaded.update(name for name in LAZY_MODULES
+                      if name in result["modules"])
+    return {"runs": runs,
+            "min_ms": min(times) * 1000,
+            "p50_ms": percentile(times, 0.5) * 1000,
+            "max_ms": max(times) * 1000,
+            "eager_lazy_modules": sorted(loaded)}
+
+
+def main(argv=None):
+    """Run the benchmark from the command line.
+
+    :param argv: command line arguments without the program name
+    :return int: exit code, 1 if a lazy module was imported
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="number of interpreters to start")
+    parser.add_argument("--module", default=MODULE,
+                        help="module to import")
+    args = parser.parse_args(argv)
+
+    report = measure(args.module, args.runs)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 1 if report["eager_lazy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""Measure the cost of reporting a scripted launch to a stub server.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.workload --items 200 --logs 10 --attachments 1 \
+        --attachment-size 65536 --async --workers 8 --log-batch-size 20
+
+The launch is N items with M logs each, K of the logs carry an attachment
+of S bytes. The report lists the throughput of the server requests, the
+latency percentiles of every client call, the bytes sent and the peak RSS
+of the process, so the numbers of two releases can be compared.
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+from reportportal_client import ReportPortalService
+from tests.stub_server import StubServer
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def _timestamp():
+    return str(int(time.time() * 1000))
+
+
+def percentile(values, share):
+    """Get a percentile of the values with the nearest-rank method.
+
+    :param values: list of numbers
+    :param share:  percentile as a number between 0 and 1
+    :return:       value of the percentile, None for an empty list
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, int(round(share * len(values))) - 1)]
+
+
+def peak_rss():
+    """Get the peak resident set size of the process.
+
+    :return: size in bytes, None if it is not available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Timer(object):
+    """Collect the latency of the client calls by the call name."""
+
+    def __init__(self):
+        """Init the timer."""
+        self.latencies = collections.defaultdict(list)
+
+    def call(self, label, func, *args, **kwargs):
+        """Call the function and record its duration.
+
+        :param label: call name the duration is recorded for
+        :param func:  function to call
+        :return:      result of the function
+        """
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.latencies[label].append(time.time() - start)
+
+    def summary(self):
+        """Get the latency statistics of every call.
+
+        :return dict: call name to count, p50 and p99 in milliseconds
+        """
+        return dict(
+            (name, {"count": len(values),
+                    "p50_ms": percentile(values, 0.5) * 1000,
+                    "p99_ms": percentile(values, 0.99) * 1000})
+            for name, values in self.latencies.items())
+
+
+def run_workload(service, items, logs, attachments=0, attachment_size=0,
+                 timer=None):
+    """Report a launch of items with logs and attachments.
+
+    :param service:         ReportPortalService to report with
+    :param items:           number of test items
+    :param logs:            number of logs of every item
+    :param attachments:     number of the logs of an item with attachment
+    :param attachment_size: attachment size in bytes
+    :param timer:           Timer which records the client calls
+    :return:                the timer
+    """
+    timer = timer or Timer()
+    payload = os.urandom(attachment_size)
+    timer.call("start_launch", service.start_launch,
+               name="Benchmark", start_time=_timestamp())
+    for i in range(items):
+        item_id = timer.call("start_test_item", service.start_test_item,
+                             name="Test {0}".format(i),
+                             start_time=_timestamp(), item_type="STEP")
+        for j in range(logs):
+            attachment = None
+            if j < attachments:
+                attachment = {"name": "attachment-{0}.bin".format(j),
+                              "data": payload,
+                              "mime": "application/octet-stream"}
+            timer.call("log", service.log, time=_timestamp(),
+                       message="Log message {0}".format(j), level="INFO",
+                       attachment=attachment, item_id=item_id)
+        timer.call("finish_test_item", service.finish_test_item,
+                   item_id=item_id, end_time=_timestamp(), status="PASSED")
+    timer.call("finish_launch", service.finish_launch,
+               end_time=_timestamp(), status="PASSED")
+    timer.call("terminate", service.terminate)
+    return timer
+
+
+def benchmark(items, logs, attachments=0, attachment_size=0, latency=0.0,
+              error_rate=0.0, **service_options):
+    """Run the workload against a new stub server and measure it.
+
+    :param items:           number of test items
+    :param logs:            number of logs of every item
+    :param attachments:     number of the logs of an item with attachment
+    :param attachment_size: attachment size in bytes
+    :param latency:         delay of every server response in seconds
+    :param error_rate:      share of the server responses which fail
+    :param service_options: ReportPortalService keyword arguments
+    :return dict:           report of the run
+    """
+    with StubServer(latency=latency, error_rate=error_rate, seed=0) as stub:
+        service = ReportPortalService(stub.endpoint, stub.project, "token",
+                                      **service_options)
+        start = time.time()
+        timer = run_workload(service, items, logs, attachments,
+                             attachment_size)
+        elapsed = time.time() - start
+    return {
+        "elapsed_s": elapsed,
+        "requests": stub.request_count,
+        "failed_requests": stub.error_count,
+        "requests_per_s": stub.request_count / elapsed if elapsed else None,
+        "bytes_sent": stub.bytes_received,
+        "logs_received": stub.log_count,
+        "peak_rss_bytes": peak_rss(),
+        "attachment_bytes_saved": service.attachment_bytes_saved,
+        "limits": service.limits,
+        "calls": timer.summary(),
+    }
+
+
+def _print_report(report, out):
+    out.write("elapsed        {0:.3f} s\n".format(report["elapsed_s"]))
+    out.write("requests       {0} ({1} failed)\n".format(
+        report["requests"], report["failed_requests"]))
+    out.write("requests/s     {0:.1f}\n".format(report["requests_per_s"]))
+    out.write("bytes sent     {0}\n".format(report["bytes_sent"]))
+    out.write("logs received  {0}\n".format(report["logs_received"]))
+    out.write("peak RSS       {0}\n".format(report["peak_rss_bytes"]))
+    out.write("dedup saved    {0}\n".format(
+        report["attachment_bytes_saved"]))
+    if report["limits"]:
+        rate = report["limits"]["rate_limit"]
+        out.write("limits         {0} concurrent, {1} requests/s\n".format(
+            report["limits"]["concurrency_limit"],
+            "unlimited" if rate is None else "{0:.1f}".format(rate)))
+    out.write("\n{0:<18} {1:>8} {2:>10} {3:>10}\n".format(
+        "call", "count", "p50 ms", "p99 ms"))
+    for name, stats in sorted(report["calls"].items()):
+        out.write("{0:<18} {1:>8} {2:>10.3f} {3:>10.3f}\n".format(
+            name, stats["count"], stats["p50_ms"], stats["p99_ms"]))
+
+
+def main(argv=None):
+    """Run the benchmark from the command line.
+
+    :param argv: command line arguments without the program name
+    :return int: exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.workload")
+    parser.add_argument("--items", type=int, default=100,
+                        help="number of test items")
+    parser.add_argument("--logs", type=int, default=10,
+                        help="number of logs of every item")
+    parser.add_argument("--attachments", type=int, default=0,
+                        help="number of the logs of an item with attachment")
+    parser.add_argument("--attachment-size", type=int, default=1024,
+                        help="attachment size in bytes")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="delay of every server response in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of the server responses which fail")
+    parser.add_argument("--async", dest="async_requests",
+                        action="store_true", help="send requests in the "
+                        "background")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of concurrent requests in async mode")
+    parser.add_argument("--log-batch-size", type=int, default=None,
+                        help="batch the logs by this number of records")
+    parser.add_argument("--json-serializer", default=None,
+                        choices=("orjson", "ujson", "json"),
+                        help="JSON library, the fastest installed one by "
+                        "default")
+    parser.add_argument("--dedup", action="store_true",
+                        help="send a repeated attachment once per batch")
+    parser.add_argument("--compression", choices=("gzip", "deflate"),
+                        help="compress the request bodies")
+    parser.add_argument("--no-limiter", dest="limiter",
+                        action="store_false", default=None,
+                        help="do not adapt the request limits")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.items, args.logs,
+                       attachments=args.attachments,
+                       attachment_size=args.attachment_size,
+                       latency=args.latency,
+                       error_rate=args.error_rate,
+                       async_requests=args.async_requests,
+                       async_workers=args.workers,
+                       log_batch_size=args.log_batch_size,
+                       json_serializer=args.json_serializer,
+                       dedup_attachments=args.dedup,
+                       compression=args.compression,
+                       limiter=args.limiter)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        _print_report(report, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,8 +14,11 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from .multipart import FilePath
 from .service import ReportPortalService
 
-__all__ = ('ReportPortalService',)
+__all__ = ('FilePath', 'ReportPortalService')
 
+# Not used anymore, the retries of all the requests are configured with
+# ReportPortalService(retry_policy=RetryPolicy(...)).
 POST_LOGBATCH_RETRY_COUNT = 10
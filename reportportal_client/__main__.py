@@ -0,0 +1,192 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from .journal import Journal, replay
+from .junit import MAX_PENDING, import_junit
+from .service import ReportPortalService
+from .traffic import replay_traffic
+
+
+def _add_connection_arguments(parser, uploads=True):
+    """Add the arguments needed to connect to the server.
+
+    :param parser:  argparse parser of a command
+    :param uploads: option to add the arguments of the service uploads
+    """
+    parser.add_argument("--endpoint", default=os.environ.get("RP_ENDPOINT"),
+                        required="RP_ENDPOINT" not in os.environ,
+                        help="Report Portal URL, $RP_ENDPOINT by default")
+    parser.add_argument("--project", default=os.environ.get("RP_PROJECT"),
+                        required="RP_PROJECT" not in os.environ,
+                        help="project name, $RP_PROJECT by default")
+    parser.add_argument("--token", default=os.environ.get("RP_TOKEN"),
+                        required="RP_TOKEN" not in os.environ,
+                        help="API token, $RP_TOKEN by default")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="number of concurrent requests")
+    if uploads:
+        parser.add_argument("--log-batch-size", type=int, default=20,
+                            help="number of log records sent in one "
+                                 "request")
+    parser.add_argument("--no-verify-ssl", dest="verify_ssl",
+                        action="store_false",
+                        help="do not verify SSL certificates")
+
+
+def _service(args):
+    """Create the service for bulk uploads from the command arguments.
+
+    :param args: parsed command arguments
+    :return:     ReportPortalService in the async mode
+    """
+    return ReportPortalService(args.endpoint, args.project, args.token,
+                               verify_ssl=args.verify_ssl,
+                               async_requests=True,
+                               async_workers=args.workers,
+                               log_batch_size=args.log_batch_size)
+
+
+def replay_command(args):
+    """Upload a journal written by ReportPortalService(journal=...).
+
+    :param args: parsed command arguments
+    :return int: exit code
+    """
+    journal = Journal(args.journal)
+    if journal.complete and not args.force:
+        sys.stderr.write("The journal is already sent, use --force to send "
+                         "it again\n")
+        return 1
+    service = _service(args)
+    count = replay(journal, service, resume=not args.force)
+    service.terminate()
+    journal.close()
+    failed = service.failed_requests
+    if failed:
+        sys.stderr.write("{0} of the requests failed\n".format(failed))
+        return 1
+    journal.mark_complete()
+    sys.stdout.write("Replayed {0} calls\n".format(count))
+    return 0
+
+
+def _attributes(values):
+    """Convert key:value command arguments to launch attributes.
+
+    :param values: list of key:value strings
+    :return dict:  attributes, None if there are none
+    """
+    if not values:
+        return None
+    return dict(value.split(":", 1) if ":" in value else (value, None)
+                for value in values)
+
+
+def import_junit_command(args):
+    """Report JUnit/xUnit XML files as a new launch.
+
+    :param args: parsed command arguments
+    :return int: exit code
+    """
+    service = _service(args)
+    counts = import_junit(args.files, service, launch_name=args.launch_name,
+                          description=args.description,
+                          attributes=_attributes(args.attribute),
+                          max_pending=args.max_pending)
+    service.terminate()
+    failed = service.failed_requests
+    if failed:
+        sys.stderr.write("{0} of the requests failed\n".format(failed))
+        return 1
+    sys.stdout.write("Imported {tests} tests ({failed} failed, {skipped} "
+                     "skipped) in {suites} suites\n".format(**counts))
+    return 0
+
+
+def replay_traffic_command(args):
+    """Send a traffic recording to a server and report its performance.
+
+    :param args: parsed command arguments
+    :return int: exit code
+    """
+    report = replay_traffic(args.recording, args.endpoint, args.project,
+                            args.token, speed=args.speed or None,
+                            concurrency=args.workers,
+                            verify_ssl=args.verify_ssl)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 1 if report["errors"] else 0
+
+
+def main(argv=None):
+    """Run the command line interface.
+
+    :param argv: command line arguments without the program name
+    :return int: exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m reportportal_client")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print debug logs")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    replay_parser = commands.add_parser(
+        "replay", help="upload a journal of ReportPortalService calls")
+    replay_parser.add_argument("journal", help="journal directory")
+    replay_parser.add_argument("--force", action="store_true",
+                               help="send a journal already sent, all "
+                                    "of it")
+    _add_connection_arguments(replay_parser)
+    replay_parser.set_defaults(func=replay_command)
+
+    junit_parser = commands.add_parser(
+        "import-junit", help="report JUnit/xUnit XML files as a launch")
+    junit_parser.add_argument("files", nargs="+", help="XML reports")
+    junit_parser.add_argument("--launch-name", default="JUnit import",
+                              help="name of the launch")
+    junit_parser.add_argument("--description", help="launch description")
+    junit_parser.add_argument("--attribute", action="append",
+                              help="launch attribute key:value, repeatable")
+    junit_parser.add_argument("--max-pending", type=int,
+                              default=MAX_PENDING,
+                              help="number of queued requests before the "
+                                   "parser waits for them")
+    _add_connection_arguments(junit_parser)
+    junit_parser.set_defaults(func=import_junit_command)
+
+    traffic_parser = commands.add_parser(
+        "replay-traffic", help="load test a server with recorded requests")
+    traffic_parser.add_argument("recording",
+                                help="file written with record_traffic")
+    traffic_parser.add_argument("--speed", type=float, default=1.0,
+                                help="multiplier of the recorded pace, 0 "
+                                     "to send the requests without waiting")
+    _add_connection_arguments(traffic_parser, uploads=False)
+    traffic_parser.set_defaults(func=replay_traffic_command)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    """Thread-safe mapping which keeps the most recently used entries."""
+
+    def __init__(self, maxsize=1024):
+        """Init the cache.
+
+        :param maxsize: maximum number of entries, 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self._data)
+
+    def __contains__(self, key):
+        """Check whether the key is cached without touching the counters."""
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Get the cached value and mark it as recently used.
+
+        :param key:     cache key
+        :param default: value returned if the key is not cached
+        :return:        cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache the value, evicting the least recently used entries.
+
+        :param key:   cache key
+        :param value: value to cache
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries, the counters are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Get the cache statistics.
+
+        :return dict: hits, misses, size and maxsize of the cache
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize}
@@ -0,0 +1,131 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+import zlib
+
+from .multipart import CHUNK_SIZE
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+ENCODINGS = (GZIP, DEFLATE)
+# bodies with less compressible bytes are sent as is
+COMPRESSION_THRESHOLD = 1024
+# compressed bodies bigger than this are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/xml",
+                       "application/javascript", "application/x-ndjson",
+                       "application/x-yaml", "application/csv")
+_COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+
+def is_compressible(mime):
+    """Check whether content of the MIME type is worth compressing.
+
+    :param mime: content type, e.g. text/plain
+    :return bool: True for text, JSON, XML and similar types
+    """
+    if not mime:
+        return False
+    mime = mime.split(";", 1)[0].strip().lower()
+    return mime.startswith("text/") or mime in _COMPRESSIBLE_TYPES or \
+        mime.endswith(_COMPRESSIBLE_SUFFIXES)
+
+
+def _compressor(encoding):
+    """Create a zlib compressor for the content encoding.
+
+    :param encoding: gzip or deflate
+    :return:         zlib compress object
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown content encoding: {0}".format(encoding))
+    # HTTP deflate is the zlib format, gzip adds the gzip header
+    wbits = zlib.MAX_WBITS | 16 if encoding == GZIP else zlib.MAX_WBITS
+    return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding):
+    """Compress an in-memory body.
+
+    :param data:     bytes
+    :param encoding: gzip or deflate
+    :return:         compressed bytes
+    """
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressedBody(object):
+    """Request body compressed from a stream with bounded memory.
+
+    The stream is compressed chunk by chunk into a spooled temporary file,
+    which stays in memory up to ``spool_size`` bytes. The compressed size
+    is known before the request is sent, so it gets a Content-Length, and
+    the body can be rewound for a retry without compressing it again.
+    """
+
+    def __init__(self, stream, encoding, chunk_size=CHUNK_SIZE,
+                 spool_size=SPOOL_SIZE):
+        """Compress the stream.
+
+        :param stream:     object with read(size), e.g. MultipartEncoder
+        :param encoding:   gzip or deflate
+        :param chunk_size: maximum number of bytes read at once
+        :param spool_size: maximum compressed size kept in memory
+        """
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        compressor = _compressor(encoding)
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            self._file.write(compressor.compress(chunk))
+        self._file.write(compressor.flush())
+        self._size = self._file.tell()
+        self._file.seek(0)
+
+    def __len__(self):
+        """Return the compressed size in bytes."""
+        return self._size
+
+    def read(self, size=-1):
+        """Read the compressed body.
+
+        :param size: maximum number of bytes, -1 reads the rest
+        :return:     bytes, empty at the end of the body
+        """
+        return self._file.read(size)
+
+    def __iter__(self):
+        """Iterate over the compressed body in chunks."""
+        while True:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def rewind(self):
+        """Start reading the body from the beginning again."""
+        self._file.seek(0, os.SEEK_SET)
+
+    def close(self):
+        """Delete the compressed body."""
+        self._file.close()
@@ -0,0 +1,246 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import binascii
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from multiprocessing.connection import Client, Listener
+
+from .log_batcher import _materialize
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# calls whose result is sent back to the client, the others are one-way
+QUERIES = frozenset(["get_item_id_by_uuid", "get_project_settings",
+                     "launch_id"])
+
+
+class LaunchCoordinator(object):
+    """Serve ReportPortalService calls sent by other processes.
+
+    One process, usually the one which starts the launch, owns the service
+    with its HTTP connections and runs the coordinator. Worker processes
+    report with CoordinatorClient, which sends the calls over a local
+    socket. The service should be in the async mode, so a call blocks
+    neither the coordinator nor the workers; with log batching enabled the
+    logs of all the workers are batched together.
+    """
+
+    def __init__(self, service, address=None, authkey=None):
+        """Init the coordinator and start listening.
+
+        :param service: ReportPortalService which sends the calls
+        :param address: Unix socket path or (host, port) tuple to listen to
+        :param authkey: bytes the clients authenticate with, generated if
+                        not given
+        """
+        self.service = service
+        if authkey is None:
+            authkey = binascii.hexlify(os.urandom(16))
+        self.authkey = authkey
+        # a Unix socket in a private directory, removed on close()
+        self._directory = None
+        if address is None and hasattr(os, "fork"):
+            self._directory = tempfile.mkdtemp(prefix="rp-coordinator-")
+            address = os.path.join(self._directory, "sock")
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._lock = threading.Lock()
+        self._service_lock = threading.Lock()
+        self._connections = []
+        self._threads = []
+        self._closed = False
+        self._accept_thread = threading.Thread(target=self._accept,
+                                               name="rp-coordinator")
+        self._accept_thread.daemon = True
+        self._accept_thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except Exception:
+                if not self._closed:
+                    logger.exception("Failed to accept a coordinator client")
+                    continue
+                return
+            thread = threading.Thread(target=self._serve, args=(connection,),
+                                      name="rp-coordinator-client")
+            thread.daemon = True
+            with self._lock:
+                self._connections.append(connection)
+                self._threads.append(thread)
+            thread.start()
+
+    def _handle(self, call, args, kwargs):
+        if call == "launch_id":
+            return self.service.launch_id
+        with self._service_lock:
+            return getattr(self.service, call)(*args, **kwargs)
+
+    def _serve(self, connection):
+        while True:
+            try:
+                call, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                result = self._handle(call, args, kwargs)
+            except Exception as exc:
+                logger.exception("Coordinated call %s failed", call)
+                result, error = None, exc
+            else:
+                error = None
+            if call in QUERIES:
+                try:
+                    connection.send((result, error))
+                except (EOFError, OSError):
+                    break
+        connection.close()
+
+    def close(self):
+        """Stop serving the clients, the service is not terminated."""
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+        for thread in self._threads:
+            thread.join(1)
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+class CoordinatorClient(object):
+    """Report to a LaunchCoordinator with ReportPortalService signatures.
+
+    Item UUIDs are generated locally, so starting an item returns at once.
+    Only the query methods wait for an answer from the coordinator. The
+    client reconnects automatically in a forked child process.
+    """
+
+    def __init__(self, address, authkey):
+        """Init the client.
+
+        :param address: LaunchCoordinator.address
+        :param authkey: LaunchCoordinator.authkey
+        """
+        self.address = address
+        self.authkey = authkey
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _send(self, call, *args, **kwargs):
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                self._connection = Client(self.address, authkey=self.authkey)
+                self._pid = os.getpid()
+            self._connection.send((call, args, kwargs))
+            if call not in QUERIES:
+                return None
+            result, error = self._connection.recv()
+        if error is not None:
+            raise error
+        return result
+
+    @property
+    def launch_id(self):
+        """Return the UUID of the launch reported by the coordinator."""
+        return self._send("launch_id")
+
+    def start_test_item(self,
+                        name,
+                        start_time,
+                        item_type,
+                        description=None,
+                        attributes=None,
+                        parameters=None,
+                        parent_item_id=None,
+                        has_stats=True,
+                        **kwargs):
+        """Start a test item with the coordinator service.
+
+        The arguments are the ones of ReportPortalService.start_test_item.
+
+        :return: locally generated item UUID
+        """
+        kwargs.setdefault("uuid", str(uuid.uuid4()))
+        self._send("start_test_item", name, start_time, item_type,
+                   description=description, attributes=attributes,
+                   parameters=parameters, parent_item_id=parent_item_id,
+                   has_stats=has_stats, **kwargs)
+        return kwargs["uuid"]
+
+    def finish_test_item(self,
+                         item_id,
+                         end_time,
+                         status,
+                         issue=None,
+                         attributes=None,
+                         **kwargs):
+        """Finish a test item with the coordinator service.
+
+        The arguments are the ones of ReportPortalService.finish_test_item.
+        """
+        self._send("finish_test_item", item_id, end_time, status,
+                   issue=issue, attributes=attributes, **kwargs)
+
+    def update_test_item(self, item_uuid, attributes=None, description=None):
+        """Update a test item with the coordinator service."""
+        self._send("update_test_item", item_uuid, attributes=attributes,
+                   description=description)
+
+    def log(self, time, message, level=None, attachment=None, item_id=None):
+        """Create a log with the coordinator service."""
+        if attachment:
+            attachment = _materialize({"attachment": attachment})[
+                "attachment"]
+        self._send("log", time, message, level=level, attachment=attachment,
+                   item_id=item_id)
+
+    def log_batch(self, log_data, item_id=None):
+        """Create a batch of logs with the coordinator service."""
+        for record in log_data:
+            _materialize(record)
+        self._send("log_batch", log_data, item_id=item_id)
+
+    def get_item_id_by_uuid(self, uuid):
+        """Get a test item ID by UUID from the coordinator service.
+
+        :return: test item id
+        """
+        return self._send("get_item_id_by_uuid", uuid)
+
+    def get_project_settings(self):
+        """Get the project settings from the coordinator service.
+
+        :return: json body
+        """
+        return self._send("get_project_settings")
+
+    def terminate(self, *args, **kwargs):
+        """Close the connection to the coordinator."""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
@@ -35,3 +35,17 @@ class OperationCompletionError(ResponseError):
 
     No 'message' in the json response.
     """
+
+
+class CircuitOpenError(Error):
+    """Represents error in case requests are paused by the circuit breaker.
+
+    The server failed too many requests in a row.
+    """
+
+
+class RequestDroppedError(Error):
+    """Represents error in case a queued request is dropped.
+
+    The queued logs exceeded their memory bound.
+    """
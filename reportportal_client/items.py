@@ -0,0 +1,178 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class _Item(object):
+    """Open item of the tree."""
+
+    __slots__ = ("parent", "children", "name", "start_time")
+
+    def __init__(self, parent, name, start_time):
+        self.parent = parent
+        # created with the first child, most items have none
+        self.children = None
+        self.name = name
+        self.start_time = start_time
+
+
+class ItemTree(object):
+    """Thread-safe tree of the items started and not finished yet.
+
+    A finished item leaves the tree, its open children become roots. An
+    item whose parent is not in the tree, e.g. started by another process,
+    is a root too.
+    """
+
+    def __init__(self):
+        """Init the tree."""
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of open items."""
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        """Check whether the item is open."""
+        return item_id in self._items
+
+    @property
+    def open_count(self):
+        """Return the number of open items."""
+        return len(self._items)
+
+    def start(self, item_id, parent_id=None, name=None, start_time=None):
+        """Add a started item.
+
+        :param item_id:    item id
+        :param parent_id:  id of the parent item, None for a root
+        :param name:       item name
+        :param start_time: item start time
+        """
+        with self._lock:
+            self._items[item_id] = _Item(parent_id, name, start_time)
+            parent = self._items.get(parent_id)
+            if parent is not None:
+                if parent.children is None:
+                    parent.children = set()
+                parent.children.add(item_id)
+
+    def finish(self, item_id):
+        """Remove a finished item.
+
+        :param item_id: item id
+        :return:        id of its parent, None for a root or an item which
+                        is not in the tree
+        """
+        with self._lock:
+            item = self._items.pop(item_id, None)
+            if item is None:
+                return None
+            parent = self._items.get(item.parent)
+            if parent is not None and parent.children:
+                parent.children.discard(item_id)
+            return item.parent
+
+    def clear(self):
+        """Forget all the items."""
+        with self._lock:
+            self._items.clear()
+
+    def get(self, item_id):
+        """Get an open item.
+
+        :param item_id: item id
+        :return dict:   name, start_time, parent and children ids, None if
+                        the item is not open
+        """
+        with self._lock:
+            item = self._items.get(item_id)
+            if item is None:
+                return None
+            return {"name": item.name,
+                    "start_time": item.start_time,
+                    "parent": item.parent,
+                    "children": sorted(item.children or ())}
+
+    def _roots(self):
+        return [item_id for item_id, item in self._items.items()
+                if item.parent not in self._items]
+
+    def children(self, item_id=None):
+        """Get the open children of an item.
+
+        :param item_id: item id, None for the root items
+        :return list:   item ids
+        """
+        with self._lock:
+            if item_id is None:
+                return self._roots()
+            item = self._items.get(item_id)
+            return list(item.children or ()) if item is not None else []
+
+    def depth(self, item_id=None):
+        """Get the depth of an item or of the whole tree.
+
+        :param item_id: item id, None for the deepest open item
+        :return int:    1 for a root item, 0 if the item is not open or the
+                        tree is empty
+        """
+        with self._lock:
+            if item_id is not None:
+                depth = 0
+                while item_id in self._items:
+                    depth += 1
+                    item_id = self._items[item_id].parent
+                return depth
+            depth = 0
+            level = self._roots()
+            while level:
+                depth += 1
+                level = [child for parent in level
+                         for child in self._items[parent].children or ()]
+            return depth
+
+    def bottom_up(self, item_id=None):
+        """List the open descendants, every item after its children.
+
+        :param item_id: item id, None for the whole tree
+        :return list:   (item id, list of its open children ids) tuples
+        """
+        with self._lock:
+            if item_id is None:
+                stack = [(root, False) for root in self._roots()]
+            elif item_id in self._items:
+                stack = [(child, False) for child in
+                         self._items[item_id].children or ()]
+            else:
+                return []
+            # iterative post-order, the trees can be deep
+            result = []
+            while stack:
+                current, expanded = stack.pop()
+                children = list(self._items[current].children or ())
+                if expanded:
+                    result.append((current, children))
+                    continue
+                stack.append((current, True))
+                stack.extend((child, False) for child in children)
+            return result
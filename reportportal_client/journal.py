@@ -0,0 +1,352 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+import six
+from six.moves import collections_abc
+
+from .multipart import FilePath
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+ATTACHMENTS_DIR = "attachments"
+COMPLETE_MARKER = "COMPLETE"
+# positions of the entries whose requests reached the server, one per line
+ACKNOWLEDGED_FILE = "acknowledged"
+
+
+class Journal(object):
+    """Append-only journal of ReportPortalService calls on the local disk.
+
+    The journal is a directory of segment files with one JSON encoded call
+    per line, and an attachments directory with the attachment contents.
+    A segment is closed and a new one is started when it grows over
+    ``segment_size`` bytes. The position of an entry, its segment and line
+    number, is written to the acknowledged file once the requests of the
+    call are sent, so that a replay resumes after the sent ones.
+    """
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE, fsync=False):
+        """Init the journal, creating the directory if needed.
+
+        :param path:         journal directory
+        :param segment_size: maximum size of a segment file in bytes
+        :param fsync:        force every call to the disk before returning
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._segment = None
+        self._lines = 0
+        self._acknowledged = None
+        attachments = os.path.join(path, ATTACHMENTS_DIR)
+        if not os.path.isdir(attachments):
+            os.makedirs(attachments)
+
+    def segments(self):
+        """Get the segment file paths in the order they were written.
+
+        :return list: list of paths
+        """
+        names = sorted(name for name in os.listdir(self.path)
+                       if name.startswith(SEGMENT_PREFIX) and
+                       name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.path, name) for name in names]
+
+    def _open_segment(self):
+        segments = self.segments()
+        number = 1
+        if segments:
+            last = os.path.basename(segments[-1])
+            number = int(last[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1
+        name = "{0}{1:08d}{2}".format(SEGMENT_PREFIX, number, SEGMENT_SUFFIX)
+        self._segment = open(os.path.join(self.path, name), "ab")
+        self._lines = 0
+
+    def _store_attachment(self, attachment):
+        """Copy the attachment content into the journal.
+
+        :param attachment: attachment dict or content
+        :return dict:      attachment description with the blob name
+        """
+        if not isinstance(attachment, collections_abc.Mapping):
+            attachment = {"data": attachment}
+        blob = uuid.uuid4().hex
+        data = attachment["data"]
+        with open(os.path.join(self.path, ATTACHMENTS_DIR, blob), "wb") as f:
+            if isinstance(data, FilePath):
+                with open(data.path, "rb") as source:
+                    shutil.copyfileobj(source, f)
+            elif hasattr(data, "read"):
+                position = data.tell()
+                shutil.copyfileobj(data, f)
+                data.seek(position)
+            else:
+                if isinstance(data, six.text_type):
+                    data = data.encode("utf-8")
+                f.write(data)
+        stored = dict((key, value) for key, value in attachment.items()
+                      if key != "data")
+        stored["blob"] = blob
+        return stored
+
+    def _store_record(self, record):
+        if record.get("attachment"):
+            record = dict(record)
+            record["attachment"] = self._store_attachment(
+                record["attachment"])
+        return record
+
+    def append(self, call, arguments):
+        """Write the service call to the journal.
+
+        :param call:      name of the ReportPortalService method
+        :param arguments: dict of the keyword arguments of the call
+        :return:          position of the entry
+        """
+        arguments = dict(arguments)
+        if arguments.get("attachment"):
+            arguments["attachment"] = self._store_attachment(
+                arguments["attachment"])
+        if arguments.get("log_data"):
+            arguments["log_data"] = [self._store_record(record)
+                                     for record in arguments["log_data"]]
+        line = json.dumps({"call": call, "args": arguments}, default=str)
+        line = line.encode("utf-8") + b"\n"
+        with self._lock:
+            if self._segment is None or \
+                    self._segment.tell() >= self.segment_size:
+                self._close_segment()
+                self._open_segment()
+            self._segment.write(line)
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            position = _position(self._segment.name, self._lines)
+            self._lines += 1
+            return position
+
+    def acknowledge(self, position):
+        """Record that the requests of an entry reached the server.
+
+        :param position: position of the entry returned by append()
+        """
+        line = "{0}\n".format(position).encode("utf-8")
+        with self._lock:
+            if self._acknowledged is None:
+                self._acknowledged = open(
+                    os.path.join(self.path, ACKNOWLEDGED_FILE), "ab")
+            self._acknowledged.write(line)
+            self._acknowledged.flush()
+            if self.fsync:
+                os.fsync(self._acknowledged.fileno())
+
+    def acknowledged(self):
+        """Get the positions of the entries sent to the server.
+
+        :return set: positions of the entries
+        """
+        path = os.path.join(self.path, ACKNOWLEDGED_FILE)
+        if not os.path.exists(path):
+            return set()
+        with open(path, "rb") as f:
+            # a line cut by a crash is not a position of any entry
+            return set(line.decode("utf-8", "replace").strip()
+                       for line in f)
+
+    def _load_attachment(self, attachment):
+        attachment = dict(attachment)
+        attachment["data"] = FilePath(
+            os.path.join(self.path, ATTACHMENTS_DIR, attachment.pop("blob")))
+        return attachment
+
+    def _load_record(self, record):
+        if record.get("attachment"):
+            record["attachment"] = self._load_attachment(
+                record["attachment"])
+        return record
+
+    def __iter__(self):
+        """Iterate over the journaled calls.
+
+        Attachments are returned as FilePath objects pointing to the
+        journal copies, so they are streamed from the disk when sent.
+
+        :return: iterator of (call name, keyword arguments) tuples
+        """
+        for _, call, arguments in self.entries():
+            yield call, arguments
+
+    def entries(self):
+        """Iterate over the journaled calls with their positions.
+
+        :return: iterator of (position, call name, keyword arguments)
+                 tuples
+        """
+        for segment in self.segments():
+            with open(segment, "rb") as f:
+                for number, line in enumerate(f):
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        # the tail of the last segment written on a crash
+                        logger.warning("Skipping a broken journal line in "
+                                       "%s", segment)
+                        continue
+                    arguments = event["args"]
+                    if arguments.get("attachment"):
+                        arguments["attachment"] = self._load_attachment(
+                            arguments["attachment"])
+                    if arguments.get("log_data"):
+                        arguments["log_data"] = [
+                            self._load_record(record)
+                            for record in arguments["log_data"]]
+                    yield _position(segment, number), event["call"], \
+                        arguments
+
+    @property
+    def complete(self):
+        """Check whether the journaled calls were all sent to the server."""
+        return os.path.exists(os.path.join(self.path, COMPLETE_MARKER))
+
+    def mark_complete(self):
+        """Mark the journal as sent, so it is not replayed by mistake."""
+        with open(os.path.join(self.path, COMPLETE_MARKER), "w"):
+            pass
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def close(self):
+        """Close the current segment file and the acknowledged file."""
+        with self._lock:
+            self._close_segment()
+            if self._acknowledged is not None:
+                self._acknowledged.close()
+                self._acknowledged = None
+
+
+class _Acknowledgement(object):
+    """Acknowledge a journal entry once all the requests of its call are sent.
+
+    The call holds one reference while it submits the requests, every
+    request holds one until it is sent. A failed or dropped request never
+    releases its reference, so the entry is not acknowledged.
+    """
+
+    def __init__(self, journal, position):
+        self.journal = journal
+        self.position = position
+        self._references = 1
+        self._lock = threading.Lock()
+
+    def add(self):
+        """Take a reference for a request."""
+        with self._lock:
+            self._references += 1
+
+    def done(self):
+        """Release a reference, acknowledging the entry with the last."""
+        with self._lock:
+            self._references -= 1
+            if self._references:
+                return
+        try:
+            self.journal.acknowledge(self.position)
+        except Exception:
+            logger.exception("Failed to acknowledge the journal entry %s",
+                             self.position)
+
+
+def _position(segment, number):
+    """Make the position of a journal entry.
+
+    :param segment: segment file path
+    :param number:  line number in the segment, starting with 0
+    :return str:    position
+    """
+    return "{0}:{1}".format(os.path.basename(segment), number)
+
+
+def _skip(service, call, arguments):
+    """Restore the state a sent call left in the service without it.
+
+    The launch and the open items of the sent calls are known to the
+    service, so the calls replayed after them refer to them.
+
+    :param service:   ReportPortalService
+    :param call:      name of the sent call
+    :param arguments: keyword arguments of the call
+    """
+    if call == "start_launch":
+        service.launch_id = arguments.get("uuid")
+        service.items.clear()
+    elif call == "start_test_item" and arguments.get("uuid"):
+        service.items.start(arguments["uuid"],
+                            arguments.get("parent_item_id"),
+                            arguments.get("name"),
+                            arguments.get("start_time"))
+    elif call == "finish_test_item":
+        service.items.finish(arguments.get("item_id"))
+
+
+def replay(journal, service, resume=True):
+    """Send the journaled calls with the given service.
+
+    Use a service in the async mode with several workers and log batching
+    to upload the journal concurrently and in bulk. The launch and item
+    UUIDs recorded in the journal are reused. The calls sent are
+    acknowledged in the journal, so a replay interrupted or failed part
+    way is resumed by the next one.
+
+    :param journal: Journal object or journal directory path
+    :param service: ReportPortalService to send the calls with
+    :param resume:  skip the calls acknowledged as sent, False sends all
+                    of them, e.g. to another server
+    :return int:    number of replayed calls
+    """
+    if not isinstance(journal, Journal):
+        journal = Journal(journal)
+    acknowledged = journal.acknowledged() if resume else set()
+    # a service of another class replays without acknowledging the calls
+    acknowledging = getattr(type(service), "_acknowledging", None)
+    count = 0
+    for position, call, arguments in journal.entries():
+        if position in acknowledged:
+            _skip(service, call, arguments)
+            continue
+        if acknowledging is None:
+            getattr(service, call)(**arguments)
+        else:
+            with acknowledging(service, journal, position):
+                getattr(service, call)(**arguments)
+        count += 1
+    return count
@@ -0,0 +1,230 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import os
+import time
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# requests allowed in the queue of an async service while importing
+MAX_PENDING = 1000
+
+
+def _local_name(tag):
+    """Strip the XML namespace from a tag.
+
+    :param tag: element tag, e.g. {urn:x}testcase
+    :return:    tag without the namespace
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _duration(value):
+    """Convert a JUnit time attribute to milliseconds.
+
+    :param value: duration in seconds, e.g. 1.5 or 1,234.5
+    :return int:  duration in milliseconds, 0 if it is missing or invalid
+    """
+    try:
+        return max(0, int(float(value.replace(",", "")) * 1000))
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _text(element):
+    """Get the stripped text of an element.
+
+    :param element: XML element
+    :return:        text, None if it is empty
+    """
+    return (element.text or "").strip() or None
+
+
+class _Suite(object):
+    """Test suite item being imported."""
+
+    def __init__(self, item_id, start, duration):
+        self.item_id = item_id
+        self.start = start
+        self.duration = duration
+        # end time of the last child reported so far
+        self.clock = start
+
+
+class JUnitImporter(object):
+    """Report JUnit/xUnit XML reports to a launch.
+
+    The files are read with an iterative parser and every test case is
+    reported and dropped from the parsed tree as soon as it ends, so memory
+    use does not depend on the report size. With an async service with
+    several workers and log batching the requests of the suites are sent
+    concurrently while the files are parsed; the parser waits when more
+    than ``max_pending`` requests are queued.
+
+    Test suites become SUITE items and test cases STEP items. The items
+    are laid out one after another from the launch start by their
+    durations, because the server does not accept items started before
+    their parents.
+    """
+
+    def __init__(self, service, max_pending=MAX_PENDING):
+        """Init the importer.
+
+        :param service:     ReportPortalService with a started launch
+        :param max_pending: number of requests queued by an async service
+                            before the parser waits for them
+        """
+        self.service = service
+        self.max_pending = max_pending
+        self.clock = None
+        self.counts = {"suites": 0, "tests": 0, "failed": 0, "skipped": 0}
+
+    def _start_suite(self, element, parent, path):
+        start = parent.clock if parent else self.clock
+        name = element.get("name") or os.path.basename(path)
+        item_id = self.service.start_test_item(
+            name=name, start_time=str(start), item_type="SUITE",
+            parent_item_id=parent.item_id if parent else None)
+        self.counts["suites"] += 1
+        return _Suite(item_id, start, _duration(element.get("time")))
+
+    def _finish_suite(self, suite, parent):
+        end = max(suite.clock, suite.start + suite.duration)
+        self.service.finish_test_item(item_id=suite.item_id,
+                                      end_time=str(end), status=None)
+        if parent:
+            parent.clock = end
+        else:
+            self.clock = end
+
+    def _log(self, item_id, start, level, message):
+        if message:
+            self.service.log(time=str(start), message=message, level=level,
+                             item_id=item_id)
+
+    def _test_case(self, element, suite):
+        start = suite.clock if suite else self.clock
+        status = "PASSED"
+        logs = []
+        for child in element:
+            tag = _local_name(child.tag)
+            if tag in ("failure", "error"):
+                status = "FAILED"
+                header = ": ".join(value for value in (
+                    child.get("type"), child.get("message")) if value)
+                logs.append(("ERROR", "\n\n".join(
+                    text for text in (header, _text(child)) if text)))
+            elif tag == "skipped":
+                if status == "PASSED":
+                    status = "SKIPPED"
+                logs.append(("INFO", child.get("message") or _text(child)))
+            elif tag == "system-out":
+                logs.append(("INFO", _text(child)))
+            elif tag == "system-err":
+                logs.append(("WARN", _text(child)))
+
+        classname = element.get("classname")
+        item_id = self.service.start_test_item(
+            name=element.get("name") or "unnamed", start_time=str(start),
+            item_type="STEP",
+            attributes={"classname": classname} if classname else None,
+            parent_item_id=suite.item_id if suite else None)
+        for level, message in logs:
+            self._log(item_id, start, level, message)
+        end = start + _duration(element.get("time"))
+        self.service.finish_test_item(item_id=item_id, end_time=str(end),
+                                      status=status)
+        if suite:
+            suite.clock = end
+        else:
+            self.clock = end
+
+        self.counts["tests"] += 1
+        if status == "FAILED":
+            self.counts["failed"] += 1
+        elif status == "SKIPPED":
+            self.counts["skipped"] += 1
+        self.service.wait_queue(self.max_pending)
+
+    def import_file(self, path):
+        """Report the test suites of one XML file.
+
+        :param path: path or file object of the XML report
+        """
+        if self.clock is None:
+            self.clock = int(time.time() * 1000)
+        elements = []
+        suites = []
+        for event, element in ElementTree.iterparse(
+                path, events=("start", "end")):
+            tag = _local_name(element.tag)
+            if event == "start":
+                elements.append(element)
+                if tag == "testsuite":
+                    suites.append(self._start_suite(
+                        element, suites[-1] if suites else None,
+                        getattr(path, "name", path)))
+                continue
+
+            elements.pop()
+            parent = elements[-1] if elements else None
+            parent_tag = _local_name(parent.tag) if parent is not None \
+                else None
+            if tag == "testcase":
+                self._test_case(element, suites[-1] if suites else None)
+            elif tag == "testsuite":
+                suite = suites.pop()
+                self._finish_suite(suite, suites[-1] if suites else None)
+            elif tag in ("system-out", "system-err") and \
+                    parent_tag == "testsuite":
+                self._log(suites[-1].item_id, suites[-1].clock,
+                          "INFO" if tag == "system-out" else "WARN",
+                          _text(element))
+            if parent is not None and parent_tag != "testcase":
+                # reported, the elements of a test case go with it
+                element.clear()
+                parent.remove(element)
+
+
+def import_junit(paths, service, launch_name="JUnit import",
+                 description=None, attributes=None,
+                 max_pending=MAX_PENDING):
+    """Report JUnit/xUnit XML files as a new launch.
+
+    Use a service in the async mode with several workers and log batching
+    to upload big reports quickly, see JUnitImporter.
+
+    :param paths:       paths of the XML reports
+    :param service:     ReportPortalService to report with
+    :param launch_name: name of the launch
+    :param description: description of the launch
+    :param attributes:  launch attributes dict
+    :param max_pending: number of requests queued by an async service
+                        before the parser waits for them
+    :return dict:       number of suites, tests, failed and skipped tests
+    """
+    importer = JUnitImporter(service, max_pending)
+    importer.clock = int(time.time() * 1000)
+    service.start_launch(name=launch_name, start_time=str(importer.clock),
+                         description=description, attributes=attributes)
+    for path in paths:
+        logger.debug("Importing %s", path)
+        importer.import_file(path)
+    service.finish_launch(end_time=str(importer.clock))
+    return importer.counts
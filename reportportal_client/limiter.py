@@ -0,0 +1,283 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import threading
+import time
+
+from requests.exceptions import Timeout
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# responses of a server which is overloaded
+OVERLOAD_STATUSES = frozenset([429, 503])
+# the latency of the requests with a bigger body mostly depends on the
+# bandwidth of the client, not on the load of the server
+LARGE_BODY_SIZE = 64 * 1024
+
+
+def _latency_key(kind, size):
+    """Get the key the latency of a request is tracked by.
+
+    :param kind: kind of the request
+    :param size: request body size in bytes
+    :return:     the kind, with the power of two size class of a large body
+    """
+    if size < LARGE_BODY_SIZE:
+        return kind
+    return "{0}/{1}".format(kind, 1 << (size.bit_length() - 1))
+
+
+class AdaptiveLimiter(object):
+    """Limit concurrent requests and their rate by the server feedback.
+
+    Both limits follow AIMD, additive increase and multiplicative
+    decrease. The concurrency limit grows by one for every ``limit``
+    requests completed with a low latency while the limit was reached, so
+    it only grows as long as the client needs it. A 429 or 503 response,
+    a timeout or a latency over ``latency_tolerance`` times the usual one
+    cut it by ``backoff_ratio``, once per round of requests: the requests
+    sent before the previous cut do not cut it again. The latency is
+    tracked per kind of request, a log batch takes longer than an item
+    start without the server being overloaded. The latency of a request
+    with a body of ``LARGE_BODY_SIZE`` or more, e.g. an attachment upload,
+    is tracked per size class for monitoring and never cuts the limits:
+    it depends on the bandwidth of the client.
+
+    The request rate is not limited until the server reports an overload,
+    then it is limited to ``backoff_ratio`` of the recent rate and grows by
+    ``rate_increase`` requests per second for every round of requests
+    completed without an overload while the rate was the limit.
+    """
+
+    def __init__(self,
+                 initial_concurrency=8,
+                 min_concurrency=1,
+                 max_concurrency=256,
+                 min_rate=1.0,
+                 max_rate=None,
+                 rate_increase=1.0,
+                 backoff_ratio=0.5,
+                 latency_tolerance=3.0,
+                 min_latency=0.05,
+                 clock=time.time):
+        """Init the limiter.
+
+        :param initial_concurrency: number of concurrent requests at start
+        :param min_concurrency:     lowest concurrency limit
+        :param max_concurrency:     highest concurrency limit
+        :param min_rate:            lowest rate limit in requests/second
+        :param max_rate:            rate limit in requests/second, None
+                                    leaves the rate unlimited until the
+                                    server reports an overload
+        :param rate_increase:       requests/second added to the rate limit
+                                    per round of successful requests
+        :param backoff_ratio:       multiplier of the limits on overload
+        :param latency_tolerance:   ratio of the latency to the lowest one
+                                    considered as an overload
+        :param min_latency:         latency in seconds never considered as
+                                    an overload, for fast local servers
+        :param clock:               function returning the time in seconds
+        """
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.min_latency = min_latency
+        self.clock = clock
+
+        self.concurrency_limit = float(
+            max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.rate_limit = max_rate
+        self.in_flight = 0
+        self.overloads = 0
+        self._latencies = {}
+        self._tokens = 1.0
+        self._refilled = clock()
+        self._cut_at = 0.0
+        # whether requests waited for the rate limit, and the start times
+        # to estimate the recent rate
+        self._throttled = False
+        self._rate_credit = 0.0
+        self._window_start = self._refilled
+        self._window_count = 0
+        self._recent_rate = None
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate_limit is None:
+            return
+        self._tokens = min(max(1.0, self.rate_limit),
+                           self._tokens + (now - self._refilled) *
+                           self.rate_limit)
+        self._refilled = now
+
+    def _rate_delay(self, now):
+        if self.rate_limit is None or self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate_limit
+
+    def acquire(self):
+        """Wait until a request can be sent.
+
+        :return: start time of the request, pass it to release()
+        """
+        with self._cond:
+            while True:
+                now = self.clock()
+                self._refill(now)
+                if self.in_flight + 1 > self.concurrency_limit:
+                    self._cond.wait(0.1)
+                    continue
+                delay = self._rate_delay(now)
+                if delay > 0:
+                    self._throttled = True
+                    self._cond.wait(delay)
+                    continue
+                break
+            if self.rate_limit is not None:
+                self._tokens -= 1
+            self.in_flight += 1
+            self._count_start(now)
+            return now
+
+    def _count_start(self, now):
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._recent_rate = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+    def release(self, started, latency, status=None, error=None,
+                kind=None, size=0):
+        """Register the result of a request and adjust the limits.
+
+        :param started: value returned by acquire()
+        :param latency: time the request took in seconds
+        :param status:  response status code, None if there is no response
+        :param error:   exception raised by the request, if any
+        :param kind:    kind of the request to compare its latency with,
+                        e.g. the service method name
+        :param size:    request body size in bytes
+        """
+        with self._cond:
+            # the limit only grows while the requests reach it
+            saturated = self.in_flight >= int(self.concurrency_limit)
+            self.in_flight -= 1
+            slow = False
+            if error is None:
+                key = _latency_key(kind, size)
+                tracker = self._latencies.get(key)
+                if tracker is None:
+                    tracker = self._latencies[key] = _Latency()
+                tracker.observe(latency)
+                slow = size < LARGE_BODY_SIZE and \
+                    tracker.value > self.min_latency and \
+                    tracker.value > tracker.base * self.latency_tolerance
+            overloaded = status in OVERLOAD_STATUSES or \
+                isinstance(error, Timeout)
+            if overloaded or slow:
+                if started >= self._cut_at:
+                    self._cut(overloaded)
+            else:
+                self._increase(saturated)
+            self._cond.notify_all()
+
+    def _cut(self, overloaded):
+        self._cut_at = self.clock()
+        self.concurrency_limit = max(
+            float(self.min_concurrency),
+            self.concurrency_limit * self.backoff_ratio)
+        if overloaded:
+            self.overloads += 1
+            rate = self.rate_limit
+            if rate is None:
+                # by Little's law if there are no starts to count yet
+                latency = max([tracker.value for tracker in
+                               self._latencies.values()] or [1.0])
+                rate = self._recent_rate or \
+                    (self.in_flight + 1) / max(latency, 0.001)
+            self.rate_limit = max(self.min_rate, rate * self.backoff_ratio)
+            self._tokens = min(self._tokens, 1.0)
+        self._throttled = False
+        # forget the latencies which probably included queueing on the
+        # server
+        for tracker in self._latencies.values():
+            tracker.value = tracker.base
+        logger.debug("Request limits cut to %s concurrent, %s per second",
+                     int(self.concurrency_limit), self.rate_limit)
+
+    def _increase(self, saturated):
+        if saturated:
+            self.concurrency_limit = min(
+                float(self.max_concurrency),
+                self.concurrency_limit + 1.0 / self.concurrency_limit)
+        if self._throttled and self.rate_limit is not None:
+            self._rate_credit += 1
+            if self._rate_credit >= self.rate_limit:
+                self._rate_credit = 0.0
+                self._throttled = False
+                self.rate_limit += self.rate_increase
+                if self.max_rate is not None:
+                    self.rate_limit = min(self.rate_limit, self.max_rate)
+
+    def after_fork(self):
+        """Forget the requests in flight in a forked child process.
+
+        They are sent by the threads of the parent process, which never
+        release them in the child. The learned limits are kept.
+        """
+        # the lock may have been held by another thread at the fork
+        self._cond = threading.Condition()
+        self.in_flight = 0
+
+    def snapshot(self):
+        """Get the current limits for monitoring.
+
+        :return dict: concurrency_limit, in_flight, rate_limit (None if the
+                      rate is not limited), overloads and the smoothed and
+                      usual latency in seconds of every kind of requests
+        """
+        with self._cond:
+            return {"concurrency_limit": int(self.concurrency_limit),
+                    "in_flight": self.in_flight,
+                    "rate_limit": self.rate_limit,
+                    "overloads": self.overloads,
+                    "latency": dict(
+                        (kind, {"value": tracker.value,
+                                "base": tracker.base})
+                        for kind, tracker in self._latencies.items())}
+
+
+class _Latency(object):
+    """Smoothed and usual latency of a kind of requests."""
+
+    def __init__(self):
+        self.value = None
+        self.base = None
+
+    def observe(self, latency):
+        if self.value is None:
+            self.value = self.base = latency
+            return
+        self.value = 0.8 * self.value + 0.2 * latency
+        # the lowest latency seen, slowly following a lasting change
+        self.base = min(latency, self.base + 0.01 * (latency - self.base))
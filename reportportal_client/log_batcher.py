@@ -0,0 +1,252 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import threading
+import time
+
+from six.moves import collections_abc
+
+from .scheduler import BLOCK, DROP_OLDEST
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+LOG_BATCH_SIZE = 20
+LOG_BATCH_PAYLOAD_SIZE = 10 * 1024 * 1024
+LOG_BATCH_INTERVAL = 1.0
+MAX_LOG_BATCH_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+
+def _record_size(record):
+    """Estimate the number of bytes a log record adds to a batch.
+
+    :param record: log record dict
+    :return int:   approximate encoded size of the message and attachment
+    """
+    size = len(record.get("message") or "")
+    attachment = record.get("attachment")
+    if attachment:
+        if isinstance(attachment, collections_abc.Mapping):
+            attachment = attachment.get("data")
+        if attachment is not None:
+            size += len(attachment)
+    return size
+
+
+def _materialize(record):
+    """Read file-like attachment data so it outlives the caller's handle.
+
+    Buffered records can be sent long after log() returned, when the file
+    object passed by the caller may already be closed.
+
+    :param record: log record dict, updated in place
+    :return:       the same record
+    """
+    attachment = record.get("attachment")
+    if isinstance(attachment, collections_abc.Mapping):
+        data = attachment.get("data")
+        if hasattr(data, "read"):
+            attachment = dict(attachment)
+            attachment["data"] = data.read()
+            record["attachment"] = attachment
+    elif hasattr(attachment, "read"):
+        record["attachment"] = attachment.read()
+    return record
+
+
+def _discard(record):
+    """Remove the temporary file attached to a dropped log record.
+
+    :param record: log record dict
+    """
+    attachment = record.get("attachment")
+    if isinstance(attachment, collections_abc.Mapping):
+        attachment = attachment.get("data")
+    if hasattr(attachment, "remove"):
+        attachment.remove()
+
+
+class LogBatcher(object):
+    """Buffer log records in memory and send them in batches.
+
+    Records are handed over to the ``send`` callable, usually
+    ReportPortalService.log_batch, as soon as one of the thresholds is
+    reached: number of records, total payload size or the time passed
+    since the first record of the batch was buffered. Sending happens on a
+    background thread, so append() does not wait for the network unless
+    the buffer exceeds ``max_buffer_bytes`` with the BLOCK policy; with the
+    DROP_OLDEST policy the oldest records are dropped instead.
+    """
+
+    def __init__(self,
+                 send,
+                 batch_size=LOG_BATCH_SIZE,
+                 payload_size=LOG_BATCH_PAYLOAD_SIZE,
+                 flush_interval=LOG_BATCH_INTERVAL,
+                 max_buffer_bytes=None,
+                 overflow_policy=BLOCK):
+        """Init the batcher.
+
+        Args:
+            send: callable which takes a list of log records.
+            batch_size: maximum number of records in one batch.
+            payload_size: maximum approximate size of one batch in bytes.
+            flush_interval: maximum time in seconds a record is buffered.
+            max_buffer_bytes: maximum approximate size of the buffered
+                records while a batch is being sent, None for no limit.
+            overflow_policy: BLOCK or DROP_OLDEST.
+        """
+        self._send = send
+        self.batch_size = batch_size
+        self.payload_size = payload_size
+        self.flush_interval = flush_interval
+        self.max_buffer_bytes = max_buffer_bytes
+        self.overflow_policy = overflow_policy
+        self.dropped_count = 0
+        self._blocked = 0
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_started = None
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        """Return the number of buffered records."""
+        return len(self._batch)
+
+    def _is_full(self):
+        return (len(self._batch) >= self.batch_size or
+                self._batch_bytes >= self.payload_size or
+                self._blocked > 0)
+
+    def _make_room(self, size):
+        while self._batch and \
+                self._batch_bytes + size > self.max_buffer_bytes:
+            if self.overflow_policy == DROP_OLDEST:
+                record = self._batch.pop(0)
+                self._batch_bytes -= _record_size(record)
+                self.dropped_count += 1
+                _discard(record)
+                continue
+            self._blocked += 1
+            self._cond.notify_all()
+            try:
+                self._cond.wait()
+            finally:
+                self._blocked -= 1
+
+    def _start_thread(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name="rp-log-batcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, record):
+        """Buffer a log record.
+
+        :param record: log record dict accepted by log_batch()
+        """
+        _materialize(record)
+        size = _record_size(record)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Log batcher is stopped")
+            if self.max_buffer_bytes is not None:
+                self._make_room(size)
+                if self._stopped:
+                    raise RuntimeError("Log batcher is stopped")
+            if not self._batch:
+                self._batch_started = time.time()
+            self._batch.append(record)
+            self._batch_bytes += size
+            if self._thread is None:
+                self._start_thread()
+            if self._is_full():
+                self._cond.notify_all()
+
+    def _take(self):
+        batch = self._batch
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_started = None
+        # let the appenders waiting for room fill the next batch
+        self._cond.notify_all()
+        return batch
+
+    def _send_batch(self, batch):
+        try:
+            self._send(batch)
+        except Exception:
+            logger.exception("Failed to send a batch of %d log records",
+                             len(batch))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._is_full():
+                    if self._batch_started is None:
+                        self._cond.wait()
+                        continue
+                    left = (self._batch_started + self.flush_interval -
+                            time.time())
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                if self._stopped:
+                    return
+                batch = self._take()
+                self._in_flight += 1
+            try:
+                if batch:
+                    self._send_batch(batch)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def flush(self, item_id=None):
+        """Send all buffered records and wait for batches in flight.
+
+        :param item_id: item UUID to send the records only if some of them
+                        or a batch in flight may belong to the item, e.g.
+                        before the item is finished
+        """
+        with self._cond:
+            if item_id is not None and not self._in_flight and \
+                    not any(record.get("itemUuid") == item_id
+                            for record in self._batch):
+                return
+            batch = self._take()
+        if batch:
+            self._send_batch(batch)
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait()
+
+    def stop(self):
+        """Stop the background thread and send the remaining records."""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
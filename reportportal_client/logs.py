@@ -0,0 +1,235 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import logging
+import threading
+
+from .log_batcher import LOG_BATCH_INTERVAL, LOG_BATCH_SIZE
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7
+    ContextVar = None
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MAX_QUEUE_SIZE = 10000
+
+# logging levels and the Report Portal levels they are reported with
+LEVELS = ((logging.CRITICAL, "ERROR"),
+          (logging.ERROR, "ERROR"),
+          (logging.WARNING, "WARN"),
+          (logging.INFO, "INFO"),
+          (logging.DEBUG, "DEBUG"),
+          (logging.NOTSET, "TRACE"))
+
+# records of these loggers are emitted while sending the records
+IGNORED_LOGGERS = ("reportportal_client", "urllib3", "requests")
+
+if ContextVar is not None:
+    _current_item = ContextVar("rp_current_item", default=None)
+
+    def get_current_item():
+        """Get the id of the item logs of this context are sent to."""
+        return _current_item.get()
+
+    def set_current_item(item_id):
+        """Send the logs of this context to the item.
+
+        :param item_id: item id, None for the launch
+        :return:        id of the previous item
+        """
+        previous = _current_item.get()
+        _current_item.set(item_id)
+        return previous
+else:
+    _current_item = threading.local()
+
+    def get_current_item():
+        """Get the id of the item logs of this thread are sent to."""
+        return getattr(_current_item, "item_id", None)
+
+    def set_current_item(item_id):
+        """Send the logs of this thread to the item.
+
+        :param item_id: item id, None for the launch
+        :return:        id of the previous item
+        """
+        previous = get_current_item()
+        _current_item.item_id = item_id
+        return previous
+
+
+def _level_name(levelno):
+    """Get the Report Portal level of a logging level.
+
+    :param levelno: logging level number
+    :return str:    Report Portal level name
+    """
+    for threshold, name in LEVELS:
+        if levelno >= threshold:
+            return name
+    return "TRACE"
+
+
+class RPLogHandler(logging.Handler):
+    """Send log records to Report Portal in batches.
+
+    emit() only puts the record with the current item id on a queue, the
+    records are formatted, converted and sent with log_batch() on a
+    background thread once ``batch_size`` of them are queued or
+    ``flush_interval`` seconds passed. The item id is taken from
+    set_current_item(), a context variable where available and a thread
+    local otherwise. A record with an ``attachment`` attribute, e.g.
+    ``logger.info("screen", extra={"attachment": {...}})``, is sent with
+    it.
+
+    The records are kept as they are until sent, so arguments changed
+    after the call are logged changed. Call flush() before finishing the
+    item the records belong to.
+    """
+
+    def __init__(self,
+                 service,
+                 level=logging.NOTSET,
+                 batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_BATCH_INTERVAL,
+                 max_queue_size=MAX_QUEUE_SIZE,
+                 ignored_loggers=IGNORED_LOGGERS):
+        """Init the handler.
+
+        :param service:         ReportPortalService to send the records
+        :param level:           lowest level of the records to send
+        :param batch_size:      maximum number of records in one batch
+        :param flush_interval:  maximum time in seconds a record is queued
+        :param max_queue_size:  number of queued records over which new
+                                records are dropped
+        :param ignored_loggers: names of loggers whose records are not sent,
+                                with their children
+        """
+        super(RPLogHandler, self).__init__(level)
+        self.service = service
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.ignored_loggers = tuple(ignored_loggers)
+        self._ignored_prefixes = tuple(name + "." for name in
+                                       self.ignored_loggers)
+        self.dropped_count = 0
+        # deque appends and pops are atomic, emit() takes no lock
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        self._send_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _start_thread(self):
+        with self._thread_lock:
+            if self._thread is not None or self._stopped:
+                return
+            thread = threading.Thread(target=self._run,
+                                      name="rp-log-handler")
+            thread.daemon = True
+            thread.start()
+            self._thread = thread
+
+    def handle(self, record):
+        """Filter and queue the record without taking the handler lock.
+
+        :param record: logging.LogRecord
+        :return:       result of the filters
+        """
+        result = self.filter(record)
+        if result:
+            self.emit(record)
+        return result
+
+    def emit(self, record):
+        """Queue the record to be sent.
+
+        :param record: logging.LogRecord
+        """
+        if record.name in self.ignored_loggers or \
+                record.name.startswith(self._ignored_prefixes) or \
+                threading.current_thread() is self._thread:
+            return
+        if len(self._queue) >= self.max_queue_size:
+            self.dropped_count += 1
+            return
+        self._queue.append((record, get_current_item()))
+        if self._thread is None:
+            self._start_thread()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _convert(self, record, item_id):
+        """Make the log record dict of a logging record.
+
+        :param record:  logging.LogRecord
+        :param item_id: id of the item of the record
+        :return dict:   log record accepted by log_batch()
+        """
+        data = {"time": str(int(record.created * 1000)),
+                "message": self.format(record),
+                "level": _level_name(record.levelno)}
+        if item_id:
+            data["itemUuid"] = item_id
+        attachment = getattr(record, "attachment", None)
+        if attachment:
+            data["attachment"] = attachment
+        return data
+
+    def _send(self):
+        """Send the queued records in batches until the queue is empty."""
+        with self._send_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    record, item_id = self._queue.popleft()
+                    try:
+                        batch.append(self._convert(record, item_id))
+                    except Exception:
+                        self.handleError(record)
+                if not batch:
+                    continue
+                try:
+                    self.service.log_batch(batch)
+                except Exception:
+                    logger.exception("Failed to send a batch of %d log "
+                                     "records", len(batch))
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._send()
+
+    def flush(self):
+        """Send all queued records."""
+        self._send()
+
+    def close(self):
+        """Stop the background thread and send the remaining records."""
+        self._stopped = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+        super(RPLogHandler, self).close()
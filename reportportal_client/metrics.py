@@ -0,0 +1,304 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import logging
+import os
+import threading
+
+import six
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+                   5.0, 10.0)
+PROMETHEUS_PREFIX = "reportportal_client"
+
+
+def body_size(body):
+    """Get the size of a request or response body.
+
+    :param body: bytes, text, sized stream or None
+    :return:     size in bytes, 0 if it is unknown
+    """
+    if isinstance(body, six.text_type):
+        return len(body.encode("utf-8"))
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+class Histogram(object):
+    """Count observed values in buckets of fixed upper bounds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Init the histogram.
+
+        :param buckets: sorted bucket upper bounds, bigger values are only
+                        counted in the total
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Add a value to the histogram.
+
+        :param value: observed value
+        """
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, share):
+        """Estimate a quantile by the upper bound of its bucket.
+
+        :param share: quantile as a number between 0 and 1
+        :return:      estimated value, None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = share * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        """Get the histogram state.
+
+        :return dict: count, sum, max, p50, p99 and cumulative bucket counts
+        """
+        cumulative = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            cumulative.append((bound, seen))
+        return {"count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99),
+                "buckets": cumulative}
+
+
+class _MethodStats(object):
+    """Statistics of one service method."""
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.errors = 0
+        self.requests = 0
+        self.request_errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.blocked = Histogram(buckets)
+        self.latency = Histogram(buckets)
+
+    def snapshot(self):
+        return {"calls": self.calls,
+                "errors": self.errors,
+                "requests": self.requests,
+                "request_errors": self.request_errors,
+                "retries": self.retries,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "blocked": self.blocked.snapshot(),
+                "latency": self.latency.snapshot()}
+
+
+class Metrics(object):
+    """Statistics of the ReportPortalService calls and requests.
+
+    Two things are measured for every service method: the calls, with the
+    time the caller was blocked in them, and the HTTP requests the calls
+    result in, with their latency including retries, the bytes sent and
+    received and the errors. In the async mode and with log batching the
+    requests are sent in the background, so the caller is blocked much
+    shorter than the requests take.
+
+    Callbacks added with add_callback() are called with every measurement
+    as ``callback(metric, method, value)``, e.g. to forward them to StatsD.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Init the metrics.
+
+        :param buckets: upper bounds of the latency histogram buckets
+        """
+        self.buckets = buckets
+        self._methods = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call the callback with every measurement.
+
+        :param callback: callable(metric, method, value), metric is one of
+                         calls, errors, blocked_seconds, requests,
+                         request_errors, latency_seconds, retries,
+                         bytes_sent, bytes_received
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """Stop calling the callback.
+
+        :param callback: callable added with add_callback()
+        """
+        self._callbacks.remove(callback)
+
+    def _emit(self, method, values):
+        for callback in self._callbacks:
+            for metric, value in values:
+                try:
+                    callback(metric, method, value)
+                except Exception:
+                    logger.exception("Metrics callback %r failed", callback)
+
+    def _stats(self, method):
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = _MethodStats(self.buckets)
+        return stats
+
+    def record_call(self, method, blocked, error=False):
+        """Register a service method call.
+
+        :param method:  name of the service method
+        :param blocked: time the caller spent in the call in seconds
+        :param error:   whether the call raised an exception
+        """
+        with self._lock:
+            stats = self._stats(method)
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.blocked.observe(blocked)
+        values = [("calls", 1), ("blocked_seconds", blocked)]
+        if error:
+            values.append(("errors", 1))
+        self._emit(method, values)
+
+    def record_request(self, method, latency, retries=0, bytes_sent=0,
+                       bytes_received=0, error=False):
+        """Register an HTTP request sent for a service method.
+
+        :param method:         name of the service method
+        :param latency:        time until the final response in seconds
+        :param retries:        number of retried attempts
+        :param bytes_sent:     request body bytes of all the attempts
+        :param bytes_received: response body bytes
+        :param error:          whether the request failed
+        """
+        with self._lock:
+            stats = self._stats(method)
+            stats.requests += 1
+            stats.request_errors += int(error)
+            stats.retries += retries
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.latency.observe(latency)
+        values = [("requests", 1), ("latency_seconds", latency),
+                  ("bytes_sent", bytes_sent),
+                  ("bytes_received", bytes_received)]
+        if retries:
+            values.append(("retries", retries))
+        if error:
+            values.append(("request_errors", 1))
+        self._emit(method, values)
+
+    def snapshot(self):
+        """Get the current statistics.
+
+        :return dict: service method name to its statistics
+        """
+        with self._lock:
+            return dict((method, stats.snapshot())
+                        for method, stats in self._methods.items())
+
+    def reset(self):
+        """Forget all the statistics, the callbacks are kept."""
+        with self._lock:
+            self._methods = {}
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """Format the statistics in the Prometheus text exposition format.
+
+        :param prefix: prefix of the metric names
+        :return str:   metrics text
+        """
+        snapshot = self.snapshot()
+        lines = []
+        counters = ("calls", "errors", "requests", "request_errors",
+                    "retries", "bytes_sent", "bytes_received")
+        for counter in counters:
+            name = "{0}_{1}_total".format(prefix, counter)
+            lines.append("# TYPE {0} counter".format(name))
+            for method, stats in sorted(snapshot.items()):
+                lines.append('{0}{{method="{1}"}} {2}'.format(
+                    name, method, stats[counter]))
+        for histogram in ("blocked", "latency"):
+            name = "{0}_{1}_seconds".format(prefix, histogram)
+            lines.append("# TYPE {0} histogram".format(name))
+            for method, stats in sorted(snapshot.items()):
+                data = stats[histogram]
+                buckets = [(repr(bound), count)
+                           for bound, count in data["buckets"]]
+                buckets.append(("+Inf", data["count"]))
+                for bound, count in buckets:
+                    lines.append('{0}_bucket{{method="{1}",le="{2}"}} '
+                                 '{3}'.format(name, method, bound, count))
+                lines.append('{0}_sum{{method="{1}"}} {2!r}'.format(
+                    name, method, data["sum"]))
+                lines.append('{0}_count{{method="{1}"}} {2}'.format(
+                    name, method, data["count"]))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the statistics to a file.
+
+        A path ending with .prom gets the Prometheus text format, suitable
+        for the node exporter textfile collector, other paths get JSON. The
+        file is replaced atomically.
+
+        :param path: file path
+        """
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2, sort_keys=True)
+        temporary = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temporary, "w") as f:
+            f.write(content)
+        if hasattr(os, "replace"):
+            os.replace(temporary, path)
+        else:
+            # Python 2, not atomic on Windows
+            if os.path.exists(path) and os.name == "nt":
+                os.remove(path)
+            os.rename(temporary, path)
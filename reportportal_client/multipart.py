@@ -0,0 +1,351 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import io
+import os
+import uuid
+
+import six
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _to_bytes(value):
+    """Encode text to utf-8, leave bytes as is.
+
+    :param value: text or bytes
+    :return:      bytes
+    """
+    if isinstance(value, six.text_type):
+        return value.encode("utf-8")
+    return value
+
+
+def _is_text(fileobj):
+    """Check whether the file object reads text rather than bytes.
+
+    :param fileobj: file-like object
+    :return bool:   True for a text stream, e.g. io.StringIO
+    """
+    return isinstance(fileobj.read(0), six.text_type)
+
+
+def _text_size(fileobj, chunk_size=CHUNK_SIZE):
+    """Get the number of bytes left in a text stream once utf-8 encoded.
+
+    The size in characters tells nothing about the encoded size, so the
+    stream is read through in chunks and rewound.
+
+    :param fileobj:    text file-like object
+    :param chunk_size: maximum number of characters read at once
+    :return int:       number of bytes from the current position to the end
+    """
+    position = fileobj.tell()
+    size = 0
+    try:
+        for chunk in iter(lambda: fileobj.read(chunk_size), u""):
+            size += len(_to_bytes(chunk))
+    finally:
+        fileobj.seek(position)
+    return size
+
+
+def _stream_size(fileobj):
+    """Get the number of bytes left in the file object.
+
+    Text streams are counted in utf-8 encoded bytes, the way they are sent.
+
+    :param fileobj: file-like object
+    :return int:    number of bytes from the current position to the end
+    """
+    if _is_text(fileobj):
+        return _text_size(fileobj)
+    position = fileobj.tell()
+    try:
+        return os.fstat(fileobj.fileno()).st_size - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - position
+        fileobj.seek(position)
+        return size
+
+
+def _remove(path):
+    """Remove a file, ignoring a missing one.
+
+    :param path: file path
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _BytesSource(object):
+    """Part of the multipart body held in memory."""
+
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self._offset = 0
+
+    def read(self, size):
+        chunk = self.data[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        return chunk
+
+    def rewind(self):
+        self._offset = 0
+
+    def close(self):
+        pass
+
+
+class _FileSource(object):
+    """Part of the multipart body read from a file object in chunks."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.start = fileobj.tell()
+        self.size = _stream_size(fileobj)
+
+    def read(self, size):
+        return _to_bytes(self.fileobj.read(size))
+
+    def rewind(self):
+        self.fileobj.seek(self.start)
+
+    def close(self):
+        pass
+
+
+class _PathSource(object):
+    """Part of the multipart body read from a file system path.
+
+    The file is opened on the first read and closed once it is sent.
+    A temporary file is removed then.
+    """
+
+    def __init__(self, path, temporary=False):
+        self.path = path
+        self.temporary = temporary
+        self.size = os.path.getsize(path)
+        self._file = None
+
+    def read(self, size):
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        return self._file.read(size)
+
+    def rewind(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self.rewind()
+        if self.temporary:
+            _remove(self.path)
+
+
+def _source(data):
+    """Wrap part data into a source object.
+
+    :param data: bytes, text, file object or FilePath
+    :return:     source object with read(), rewind(), close() and size
+    """
+    if isinstance(data, FilePath):
+        return _PathSource(data.path, isinstance(data, TemporaryFilePath))
+    if hasattr(data, "read"):
+        return _FileSource(data)
+    return _BytesSource(_to_bytes(data))
+
+
+def content_digest(data, chunk_size=CHUNK_SIZE):
+    """Hash the part data, reading file objects and paths in chunks.
+
+    The position of a file object is restored afterwards.
+
+    :param data:       bytes, text, file object or FilePath
+    :param chunk_size: maximum number of bytes read into memory at once
+    :return str:       hex SHA-256 digest of the content
+    """
+    digest = hashlib.sha256()
+    source = _source(data)
+    try:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    finally:
+        # not close(), which removes a temporary file
+        source.rewind()
+    return digest.hexdigest()
+
+
+def data_size(data):
+    """Get the number of bytes the part data takes in the encoded body.
+
+    :param data: bytes, text, file object or FilePath
+    :return int: size in bytes
+    """
+    if hasattr(data, "read"):
+        return _stream_size(data)
+    if isinstance(data, six.text_type):
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+def part_header(boundary, name, filename=None, content_type=None):
+    """Build the boundary line and headers of a multipart part.
+
+    :param boundary:     multipart boundary
+    :param name:         form field name
+    :param filename:     file name of the part, if any
+    :param content_type: content type of the part, if any
+    :return:             bytes preceding the part data
+    """
+    disposition = 'form-data; name="{0}"'.format(name)
+    if filename is not None:
+        disposition += '; filename="{0}"'.format(
+            filename.replace('"', '\\"'))
+    headers = "--{0}\r\nContent-Disposition: {1}\r\n".format(boundary,
+                                                             disposition)
+    if content_type:
+        headers += "Content-Type: {0}\r\n".format(content_type)
+    return _to_bytes(headers + "\r\n")
+
+
+def part_size(field, boundary_size=32):
+    """Get the number of bytes the field takes in the encoded body.
+
+    :param field:         (name, (filename, data, content_type)) tuple
+    :param boundary_size: length of the multipart boundary
+    :return int:          size in bytes including the part headers
+    """
+    name, (filename, data, content_type) = field
+    header = part_header("-" * boundary_size, name, filename, content_type)
+    return len(header) + data_size(data) + 2
+
+
+def closing_size(boundary_size=32):
+    """Get the size of the closing boundary line.
+
+    :param boundary_size: length of the multipart boundary
+    :return int:          size in bytes
+    """
+    return boundary_size + 6
+
+
+class FilePath(object):
+    """Attachment data which is read from the given path when sent."""
+
+    def __init__(self, path):
+        """Init the file path wrapper.
+
+        :param path: path to the file in the local file system
+        """
+        self.path = path
+
+    def __len__(self):
+        """Return the file size in bytes."""
+        return os.path.getsize(self.path)
+
+
+class TemporaryFilePath(FilePath):
+    """FilePath of a temporary file removed once it is sent."""
+
+    def remove(self):
+        """Remove the file without sending it."""
+        _remove(self.path)
+
+
+class MultipartEncoder(object):
+    """Encode a multipart/form-data request body lazily.
+
+    The encoder is a file-like object with a known length, so requests
+    sends it with a Content-Length header, reading it chunk by chunk. Only
+    the part headers are kept in memory, file objects and paths are read
+    while the request is being sent.
+    """
+
+    def __init__(self, fields, boundary=None, chunk_size=CHUNK_SIZE):
+        """Init the encoder.
+
+        :param fields:     list of (name, (filename, data, content_type))
+                           tuples, the format of the requests 'files'
+                           argument. Data can be bytes, text, a file object
+                           or a FilePath
+        :param boundary:   multipart boundary, generated if not given
+        :param chunk_size: maximum size of a chunk read from a file
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._sources = []
+        for name, (filename, data, content_type) in fields:
+            self._sources.append(_BytesSource(part_header(
+                self.boundary, name, filename, content_type)))
+            self._sources.append(_source(data))
+            self._sources.append(_BytesSource(b"\r\n"))
+        self._sources.append(_BytesSource(
+            _to_bytes("--{0}--\r\n".format(self.boundary))))
+        self.size = sum(source.size for source in self._sources)
+        self._index = 0
+
+    @property
+    def content_type(self):
+        """Return the Content-Type header value for the body."""
+        return "multipart/form-data; boundary={0}".format(self.boundary)
+
+    def __len__(self):
+        """Return the size of the encoded body in bytes."""
+        return self.size
+
+    def read(self, size=-1):
+        """Read the next chunk of the encoded body.
+
+        :param size: maximum number of bytes, the whole rest if negative
+        :return:     bytes, empty at the end of the body
+        """
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(self.chunk_size), b""))
+        size = min(size, self.chunk_size)
+        while self._index < len(self._sources):
+            source = self._sources[self._index]
+            chunk = source.read(size)
+            if chunk:
+                return chunk
+            # releases an open file, close() is left for the final close
+            source.rewind()
+            self._index += 1
+        return b""
+
+    def __iter__(self):
+        """Iterate over the chunks of the encoded body."""
+        return iter(lambda: self.read(self.chunk_size), b"")
+
+    def rewind(self):
+        """Start reading the body from the beginning, e.g. to retry."""
+        for source in self._sources:
+            source.rewind()
+        self._index = 0
+
+    def close(self):
+        """Close the files opened by the encoder."""
+        for source in self._sources:
+            source.close()
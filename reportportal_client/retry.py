@@ -0,0 +1,287 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import calendar
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+from urllib3.exceptions import NewConnectionError
+
+from .errors import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# KeyError is raised by some requests versions on a dropped keep-alive
+# connection before the body is sent, log_batch() has always retried on it
+RETRY_EXCEPTIONS = (ConnectionError, Timeout, KeyError)
+# the statuses of a request the server has not processed, a request which
+# is not idempotent is retried on them only
+NOT_PROCESSED_STATUSES = frozenset([429, 503])
+
+
+def _not_sent(error):
+    """Check whether a request failed before it reached the server.
+
+    :param error: exception raised by the request
+    :return bool: True for connection and connect timeout errors, and the
+                  KeyError of a dropped keep-alive connection
+    """
+    if isinstance(error, (ConnectTimeout, KeyError)):
+        return True
+    if not isinstance(error, ConnectionError) or not error.args:
+        return False
+    return isinstance(getattr(error.args[0], "reason", None),
+                      NewConnectionError)
+
+
+def _retry_after(response):
+    """Get the delay requested by the Retry-After header.
+
+    :param response: Response object or None
+    :return:         delay in seconds or None
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate(value)
+        if parsed is None:
+            return None
+        return max(0.0, calendar.timegm(parsed) - time.time())
+
+
+class RetryBudget(object):
+    """Limit the number of retries, e.g. for the whole launch."""
+
+    def __init__(self, max_retries=100):
+        """Init the budget.
+
+        :param max_retries: number of retries allowed until reset()
+        """
+        self.max_retries = max_retries
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one retry from the budget.
+
+        :return bool: False if the budget is exhausted
+        """
+        with self._lock:
+            if self.spent >= self.max_retries:
+                return False
+            self.spent += 1
+            return True
+
+    def reset(self):
+        """Restore the whole budget."""
+        with self._lock:
+            self.spent = 0
+
+
+class CircuitBreaker(object):
+    """Stop sending requests to a server which keeps failing.
+
+    The breaker opens after ``failure_threshold`` consecutive failures.
+    While it is open no requests are allowed. After ``reset_timeout``
+    seconds one probe request is let through: its success closes the
+    breaker, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """Init the breaker.
+
+        :param failure_threshold: consecutive failures to open the breaker
+        :param reset_timeout:     seconds before a probe request is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = self.CLOSED
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        """Get the time left until a probe request is allowed.
+
+        :return: seconds, 0 if requests are allowed
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.time())
+
+    def allow(self):
+        """Check whether a request can be sent now.
+
+        :return bool: True if the request is allowed
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.retry_in() <= 0:
+                self.state = self.HALF_OPEN
+                return True
+            # only one probe request at a time in the half-open state
+            return False
+
+    def record_success(self):
+        """Register a successful request."""
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """Register a failed request."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Report Portal requests keep failing, "
+                                   "pausing them for %s seconds",
+                                   self.reset_timeout)
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+
+class RetryPolicy(object):
+    """Retry failed requests with exponential backoff and jitter.
+
+    Connection errors, timeouts and 429/5xx responses are retried. A
+    request which is not idempotent, e.g. a POST without a client UUID
+    which may have been processed before the server failed, is retried on
+    the errors connecting to the server and 429/503 responses only. The
+    delay is taken from the Retry-After header when the server sends it,
+    otherwise it is a random value between 0 and
+    ``backoff_factor * 2 ** attempt`` capped by ``max_backoff``.
+    """
+
+    def __init__(self,
+                 max_attempts=3,
+                 backoff_factor=0.5,
+                 max_backoff=30.0,
+                 statuses=RETRY_STATUSES,
+                 budget=None,
+                 breaker=None,
+                 sleep=time.sleep):
+        """Init the policy.
+
+        :param max_attempts:   maximum number of attempts of a request
+        :param backoff_factor: base delay between attempts in seconds
+        :param max_backoff:    maximum delay between attempts in seconds,
+                               a longer Retry-After stops retrying
+        :param statuses:       response status codes to retry
+        :param budget:         RetryBudget shared by the requests
+        :param breaker:        CircuitBreaker shared by the requests
+        :param sleep:          function used to wait between attempts
+        """
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.budget = budget
+        self.breaker = breaker
+        self.sleep = sleep
+        self.retries = 0
+
+    def backoff(self, attempt, response=None):
+        """Get the delay before the next attempt.
+
+        :param attempt:  number of the failed attempt, starting with 0
+        :param response: response of the failed attempt, if any
+        :return:         delay in seconds
+        """
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def _wait_for_breaker(self, wait):
+        if self.breaker is None:
+            return
+        while not self.breaker.allow():
+            if not wait:
+                raise CircuitOpenError(
+                    "Report Portal is not available, requests are paused "
+                    "for {0:.1f} seconds".format(self.breaker.retry_in()))
+            self.sleep(max(self.breaker.retry_in(), 0.1))
+
+    def call(self, send, wait=False, idempotent=True):
+        """Send the request, retrying it according to the policy.
+
+        :param send:       callable without arguments returning a Response
+        :param wait:       wait while the circuit breaker is open instead
+                           of raising CircuitOpenError
+        :param idempotent: whether the request can be sent again after
+                           the server may have processed it
+        :return:           Response of the last attempt
+        """
+        attempt = 0
+        while True:
+            self._wait_for_breaker(wait)
+            response = None
+            recorded = False
+            try:
+                try:
+                    response = send()
+                except RETRY_EXCEPTIONS as exc:
+                    error = exc
+                    retry = idempotent or _not_sent(exc)
+                else:
+                    if response.status_code not in self.statuses:
+                        if self.breaker is not None:
+                            self.breaker.record_success()
+                        recorded = True
+                        return response
+                    error = None
+                    retry = idempotent or \
+                        response.status_code in NOT_PROCESSED_STATUSES
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                recorded = True
+            finally:
+                # other errors, e.g. a broken response, must not leave a
+                # probe of the half-open breaker without an outcome
+                if not recorded and self.breaker is not None:
+                    self.breaker.record_failure()
+
+            delay = self.backoff(attempt, response)
+            attempt += 1
+            if not retry or attempt >= self.max_attempts or \
+                    delay > self.max_backoff or \
+                    (self.budget is not None and not self.budget.acquire()):
+                if error is not None:
+                    raise error
+                return response
+            self.retries += 1
+            logger.debug("Retrying the request in %.2f seconds after %s",
+                         delay, error or response.status_code)
+            self.sleep(delay)
@@ -0,0 +1,471 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+
+from .errors import RequestDroppedError
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# priority classes of the tasks, the lower the sooner they are executed
+LIFECYCLE = 0
+LOG = 1
+ATTACHMENT = 2
+PRIORITIES = (LIFECYCLE, LOG, ATTACHMENT)
+# a task of a lower class is executed at the latest after this number of
+# tasks of the higher classes
+STARVATION_LIMIT = 8
+
+# what schedule() does when the queued logs exceed their memory bound
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+
+
+class Task(object):
+    """Request scheduled for execution in the background.
+
+    A launch queues tens of thousands of tasks, so they have slots and
+    the event to wait for one is only created when a caller waits for it
+    before it is executed.
+    """
+
+    __slots__ = ("func", "args", "kwargs", "priority", "size", "discard",
+                 "result", "exception", "_name", "_finished", "_event",
+                 "_seq", "_running", "_waiting", "_deps", "_dependents")
+
+    # guards the creation of the events of all the tasks
+    _event_lock = threading.Lock()
+
+    def __init__(self, func, args=(), kwargs=None, priority=LIFECYCLE,
+                 size=0, discard=None):
+        """Init the task.
+
+        :param func:     callable which sends the request
+        :param args:     positional arguments for the callable
+        :param kwargs:   keyword arguments for the callable
+        :param priority: LIFECYCLE, LOG or ATTACHMENT
+        :param size:     payload size in bytes, counted against the memory
+                         bound of the queued logs
+        :param discard:  callable releasing the payload if the task is
+                         dropped instead of executed
+        """
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.priority = priority
+        self.size = size
+        self.discard = discard
+        self.result = None
+        self.exception = None
+        self._name = None
+        self._finished = False
+        self._event = None
+        # dependency bookkeeping, guarded by the scheduler lock
+        self._seq = 0
+        self._running = False
+        self._waiting = 0
+        self._deps = ()
+        self._dependents = []
+
+    @property
+    def name(self):
+        """Return the name of the task callable for logging."""
+        if self._name is not None:
+            return self._name
+        func = self.func
+        while hasattr(func, "func"):
+            func = func.func
+        return getattr(func, "__name__", repr(func))
+
+    def run(self):
+        """Execute the task and store its result or exception.
+
+        The callable and its arguments are released afterwards, the tasks
+        of a launch may be referenced until it is finished.
+        """
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception as exc:
+            self.exception = exc
+            logger.error("Background request %s failed: %s", self.name, exc)
+        finally:
+            self._release()
+
+    def _release(self):
+        self._name = self.name
+        self.func, self.args, self.kwargs = None, (), {}
+        self.discard = None
+        with self._event_lock:
+            self._finished = True
+            event = self._event
+        if event is not None:
+            event.set()
+
+    def drop(self, reason="the queue is full"):
+        """Mark the task as executed without calling it.
+
+        :param reason: why the task is dropped, for the exception message
+        """
+        self.exception = RequestDroppedError(
+            "Request {0} is dropped, {1}".format(self.name, reason))
+        if self.discard is not None:
+            try:
+                self.discard()
+            except Exception:
+                logger.exception("Failed to discard request %s", self.name)
+        self._release()
+
+    def done(self):
+        """Check whether the task has been executed."""
+        return self._finished
+
+    def wait(self, timeout=None):
+        """Wait for the task and return its result.
+
+        :param timeout: maximum time to wait in seconds
+        :return:        value returned by the task callable
+        """
+        if not self._finished:
+            with self._event_lock:
+                if not self._finished and self._event is None:
+                    self._event = threading.Event()
+                event = self._event
+            if event is not None and not event.wait(timeout):
+                raise RuntimeError("Task is not completed in time")
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+class RequestScheduler(object):
+    """Execute requests on a pool of background threads.
+
+    A task can depend on other tasks: it is not started before all of
+    them are executed. Independent tasks are executed concurrently by up
+    to ``workers`` threads.
+
+    Ready tasks are executed by their priority class, LIFECYCLE (launches
+    and items) before LOG before ATTACHMENT, in submission order within a
+    class. A ready task passed over ``starvation_limit`` times for tasks of
+    higher classes is executed next. The attachments an item request
+    depends on are promoted to the LOG class, so that an item is not
+    finished late because of the attachments of other items.
+
+    The payloads of the queued LOG and ATTACHMENT tasks are bounded by
+    ``max_log_bytes``: when a new one exceeds it, schedule() waits for
+    the queue to drain with the BLOCK policy, or drops the oldest ready
+    log tasks with the DROP_OLDEST policy. The log tasks an item request
+    waits for are never dropped.
+    """
+
+    def __init__(self, workers=1, starvation_limit=STARVATION_LIMIT,
+                 max_log_bytes=None, overflow_policy=BLOCK):
+        """Init the scheduler.
+
+        :param workers:          number of worker threads
+        :param starvation_limit: number of times a ready task can be passed
+                                 over for tasks of higher classes
+        :param max_log_bytes:    maximum payload bytes of the queued log
+                                 tasks, None for no limit
+        :param overflow_policy:  BLOCK or DROP_OLDEST
+        """
+        if overflow_policy not in (BLOCK, DROP_OLDEST):
+            raise ValueError(
+                "Unknown overflow policy: {0}".format(overflow_policy))
+        self.workers = max(1, workers)
+        self.starvation_limit = starvation_limit
+        self.max_log_bytes = max_log_bytes
+        self.overflow_policy = overflow_policy
+        self._cond = threading.Condition()
+        self._ready = [collections.deque() for _ in PRIORITIES]
+        self._passed_over = [0 for _ in PRIORITIES]
+        self._counter = itertools.count()
+        self._incomplete = set()
+        self._running = 0
+        self.log_bytes = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+        self._threads = []
+        self._stopped = False
+
+    @property
+    def queue_depth(self):
+        """Return the number of submitted tasks not executed yet."""
+        return len(self._incomplete)
+
+    @property
+    def ready_count(self):
+        """Return the number of tasks waiting for a free worker."""
+        with self._cond:
+            return sum(1 for priority, queue in enumerate(self._ready)
+                       for task in queue
+                       if task.priority == priority and not task.done())
+
+    @property
+    def running_count(self):
+        """Return the number of tasks being executed right now."""
+        return self._running
+
+    def _start_thread(self):
+        thread = threading.Thread(
+            target=self._run,
+            name="rp-request-scheduler-{0}".format(len(self._threads)))
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule the callable for execution without dependencies.
+
+        :param func: callable which sends the request
+        :return:     Task object
+        """
+        return self.schedule(Task(func, args, kwargs))
+
+    def reserve(self, size):
+        """Wait for room for a log payload in the queue.
+
+        Lets a caller wait for the memory bound of the queued logs before
+        it takes its own locks. The bytes are counted as queued until the
+        task is scheduled with ``reserved=True`` or they are released.
+
+        :param size: payload size in bytes
+        """
+        if self.max_log_bytes is None:
+            return
+        with self._cond:
+            self._make_room(size)
+            self.log_bytes += size
+
+    def release(self, size):
+        """Give back the room reserved for a task which is not scheduled.
+
+        :param size: payload size in bytes passed to reserve()
+        """
+        if self.max_log_bytes is None:
+            return
+        with self._cond:
+            self.log_bytes -= size
+            self._cond.notify_all()
+
+    def schedule(self, task, after=(), barrier=False, priority=None,
+                 size=0, discard=None, reserved=False):
+        """Schedule the task for execution.
+
+        :param task:     Task object or a callable without arguments
+        :param after:    tasks which must be executed before this one
+        :param barrier:  execute the task after all the tasks submitted
+                         before it
+        :param priority: priority class of a callable, LIFECYCLE by default
+        :param size:     payload size of a callable in bytes
+        :param discard:  callable releasing the payload of a callable if
+                         the task is dropped
+        :param reserved: whether the room for the payload of a log task is
+                         reserved with reserve() already
+        :return:         Task object
+        """
+        if not isinstance(task, Task):
+            task = Task(task, priority=LIFECYCLE if priority is None
+                        else priority, size=size, discard=discard)
+        bounded = task.priority != LIFECYCLE and \
+            self.max_log_bytes is not None
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Request scheduler is stopped")
+            if bounded and not reserved:
+                self._make_room(task.size)
+            if barrier:
+                deps = list(self._incomplete)
+            else:
+                deps = set(t for t in after if t in self._incomplete)
+            for dep in deps:
+                dep._dependents.append(task)
+                # item requests do not overtake other items this way
+                self._promote(dep, max(task.priority, LOG))
+            task._deps = deps
+            task._waiting = len(deps)
+            task._seq = next(self._counter)
+            if bounded:
+                if not reserved:
+                    self.log_bytes += task.size
+            else:
+                task.size = 0
+            self._incomplete.add(task)
+            if not deps:
+                self._enqueue(task)
+            if not self._threads:
+                for _ in range(self.workers):
+                    self._start_thread()
+        return task
+
+    def _enqueue(self, task):
+        self._ready[task.priority].append(task)
+        self._cond.notify()
+
+    def _promote(self, task, priority):
+        """Raise the class of a task and of the tasks it waits for.
+
+        A promoted ready task is queued again in its new class, its entry
+        left in the old class is skipped.
+        """
+        if task.priority <= priority or task._running or task.done():
+            return
+        task.priority = priority
+        if task._waiting:
+            for dep in task._deps:
+                self._promote(dep, priority)
+        else:
+            self._enqueue(task)
+
+    def _head(self, priority):
+        """Get the first ready task of the class.
+
+        The entries of promoted and dropped tasks are skipped.
+        """
+        queue = self._ready[priority]
+        while queue and (queue[0].priority != priority or queue[0].done()):
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _next_task(self):
+        heads = [self._head(priority) for priority in PRIORITIES]
+        classes = [priority for priority in PRIORITIES if heads[priority]]
+        if not classes:
+            return None
+        chosen = classes[0]
+        for priority in reversed(classes[1:]):
+            if self._passed_over[priority] >= self.starvation_limit:
+                chosen = priority
+                break
+        for priority in classes:
+            if priority > chosen:
+                self._passed_over[priority] += 1
+        self._passed_over[chosen] = 0
+        return self._ready[chosen].popleft()
+
+    def _make_room(self, size):
+        """Keep the queued log payloads under the bound.
+
+        :param size: payload size of the task being scheduled
+        """
+        while self.log_bytes and self.log_bytes + size > self.max_log_bytes:
+            if self.overflow_policy == DROP_OLDEST:
+                # the logs an item request waits for are kept
+                oldest = [next((task for task in self._ready[priority]
+                                if task.priority == priority and
+                                not task.done() and not task._dependents),
+                               None)
+                          for priority in (LOG, ATTACHMENT)]
+                oldest = [task for task in oldest if task is not None]
+                if oldest:
+                    task = min(oldest, key=lambda t: t._seq)
+                    logger.warning("Dropping request %s, %d bytes of logs "
+                                   "are queued", task.name, self.log_bytes)
+                    self.dropped_count += 1
+                    task.drop()
+                    self._complete(task)
+                    continue
+            self._cond.wait()
+
+    def _complete(self, task):
+        self._incomplete.discard(task)
+        self.log_bytes -= task.size
+        for dependent in task._dependents:
+            dependent._waiting -= 1
+            if not dependent._waiting:
+                self._enqueue(dependent)
+        task._dependents = []
+        task._deps = ()
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    task = self._next_task()
+                    if task is not None or (
+                            self._stopped and not self._incomplete):
+                        break
+                    self._cond.wait()
+                if task is None:
+                    return
+                task._running = True
+                self._running += 1
+            task.run()
+            with self._cond:
+                self._running -= 1
+                if task.exception is not None:
+                    self.failed_count += 1
+                self._complete(task)
+
+    def join(self, max_depth=0, timeout=None):
+        """Wait until all submitted tasks are executed.
+
+        :param max_depth: stop waiting once at most this number of tasks
+                          is not executed, to limit the queue of a producer
+        :param timeout:   maximum time to wait in seconds, None for no limit
+        :return bool:     whether at most max_depth tasks are left
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while len(self._incomplete) > max_depth:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+            return True
+
+    def stop(self, timeout=None):
+        """Execute the pending tasks and stop the background threads.
+
+        The tasks not started within the timeout are dropped, the ones
+        being executed are left to the daemon threads.
+
+        :param timeout: maximum time to wait in seconds, None for no limit
+        :return int:    number of tasks not executed
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if not self.join(timeout=timeout):
+            return self._cancel()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        return 0
+
+    def _cancel(self):
+        """Drop the tasks which are not being executed.
+
+        :return int: number of the tasks not executed, running ones too
+        """
+        with self._cond:
+            left = len(self._incomplete)
+            for task in sorted(self._incomplete, key=lambda t: t._seq):
+                if not task._running and not task.done():
+                    task.drop("it is not sent before the deadline")
+                    self._complete(task)
+            logger.warning("%d requests are not sent before the deadline",
+                           left)
+            return left
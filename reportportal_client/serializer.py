@@ -0,0 +1,73 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# serializers in the order of preference when none is requested
+SERIALIZERS = ("orjson", "ujson", "json")
+
+
+def _json_dumps(obj):
+    """Encode the object with the standard library.
+
+    :param obj: JSON serializable object
+    :return:    compact JSON as utf-8 bytes
+    """
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _load(name):
+    """Import a serializer.
+
+    :param name: one of SERIALIZERS
+    :return:     callable encoding an object to JSON bytes
+    """
+    if name == "json":
+        return _json_dumps
+    if name == "orjson":
+        import orjson
+        return orjson.dumps
+    if name == "ujson":
+        import ujson
+
+        def dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+        return dumps
+    raise ValueError("Unknown JSON serializer: {0}".format(name))
+
+
+def get_serializer(serializer=None):
+    """Get the function encoding the request payloads.
+
+    :param serializer: one of SERIALIZERS, a callable returning JSON bytes
+                       or None for the fastest installed one
+    :return:           callable encoding an object to JSON bytes
+    """
+    if callable(serializer):
+        return serializer
+    if serializer is not None:
+        return _load(serializer)
+    for name in SERIALIZERS:
+        try:
+            dumps = _load(name)
+        except ImportError:
+            continue
+        logger.debug("Using %s to encode JSON", name)
+        return dumps
@@ -14,22 +14,79 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import collections
+import atexit
+import contextlib
 import json
+import os
 import requests
+from functools import partial, wraps
 import uuid
 import logging
-import pkg_resources
 import platform
+import signal
+import socket
+import tempfile
+import threading
+import time
+import weakref
 
 import six
-from requests.adapters import HTTPAdapter
-
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from six.moves import collections_abc
+from six.moves.urllib.parse import urlencode
+from urllib3.connection import HTTPConnection
+
+from .cache import LRUCache
+from .compression import (
+    COMPRESSION_THRESHOLD,
+    CompressedBody,
+    compress,
+    is_compressible
+)
 from .errors import ResponseError, EntryCreatedError, OperationCompletionError
+from .items import ItemTree
+from .journal import Journal, _Acknowledgement
+from .limiter import AdaptiveLimiter
+from .metrics import Metrics, body_size
+from .log_batcher import (
+    LogBatcher,
+    LOG_BATCH_INTERVAL,
+    LOG_BATCH_PAYLOAD_SIZE,
+    MAX_LOG_BATCH_PAYLOAD_SIZE,
+    _materialize
+)
+from .multipart import (
+    CHUNK_SIZE,
+    MultipartEncoder,
+    TemporaryFilePath,
+    closing_size,
+    content_digest,
+    data_size,
+    part_size
+)
+from .retry import CircuitBreaker, RetryBudget, RetryPolicy
+from .scheduler import ATTACHMENT, BLOCK, LOG, RequestScheduler
+from .serializer import get_serializer
+from .traffic import TrafficRecorder
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+# log messages longer than this number of characters are sent as attachments
+MAX_MESSAGE_SIZE = 1024 * 1024
+MESSAGE_PREVIEW_SIZE = 4096
+# number of items in the async mode bookkeeping to look for finished ones
+ITEM_TASKS_LIMIT = 1024
+# log batches with this many attachment bytes are sent after the other logs
+LARGE_ATTACHMENT_SIZE = 64 * 1024
+# seconds terminate() waits for the queued requests at the interpreter exit
+EXIT_TIMEOUT = 30.0
+# key of the journal entry of a log record buffered for batching, it is
+# removed from the record before the record is encoded
+_ACKNOWLEDGEMENT = "_rp_acknowledgement"
+# converted attribute and parameter dicts, the items of a suite share them
+_payload_cache = LRUCache(256)
+
 
 def _convert_string(value):
     """Support and convert strings in py2 and py3.
@@ -46,14 +103,31 @@ def _convert_string(value):
 def _dict_to_payload(dictionary):
     """Convert dict to list of dicts.
 
+    The result is cached by the dict items and shared by the calls with
+    equal dicts, it must not be modified.
+
     :param dictionary: initial dict
     :return list: list of dicts
     """
-    system = dictionary.pop("system", False)
-    return [
+    try:
+        # with the types, 1 and True are equal but converted differently
+        cache_key = frozenset((key, type(value), value)
+                              for key, value in dictionary.items())
+    except TypeError:
+        # unhashable values
+        cache_key = None
+    else:
+        payload = _payload_cache.get(cache_key)
+        if payload is not None:
+            return payload
+    system = dictionary.get("system", False)
+    payload = [
         {"key": key, "value": _convert_string(value), "system": system}
-        for key, value in sorted(dictionary.items())
+        for key, value in sorted(dictionary.items()) if key != "system"
     ]
+    if cache_key is not None:
+        _payload_cache.put(cache_key, payload)
+    return payload
 
 
 def _get_id(response):
@@ -141,6 +215,139 @@ def _get_messages(data):
     return error_messages
 
 
+def _split_log_batch(entries, limit):
+    """Pack log records into as few batches as possible under the limit.
+
+    First fit decreasing packing is used: the biggest records are placed
+    first, each into the first batch with enough room left. A record bigger
+    than the limit gets a batch of its own. Records keep their original
+    order inside a batch.
+
+    :param entries: list of (log record, attachment field or None) tuples,
+                    optionally with the encoded JSON of the record as the
+                    third item
+    :param limit:   maximum encoded size of a batch request in bytes
+    :return list:   list of lists of entries
+    """
+    overhead = (part_size(("json_request_part",
+                           (None, "[]", "application/json"))) +
+                closing_size())
+    capacity = limit - overhead
+    sizes = []
+    for entry in entries:
+        log_item, field = entry[:2]
+        if len(entry) > 2:
+            size = len(entry[2]) + 1
+        else:
+            size = len(json.dumps(log_item)) + 2
+        if field:
+            size += part_size(field)
+        sizes.append(size)
+    if sum(sizes) <= capacity:
+        return [entries]
+
+    batches = []
+    room = []
+    for index in sorted(range(len(entries)), key=lambda i: -sizes[i]):
+        for number, left in enumerate(room):
+            if sizes[index] <= left:
+                batches[number].append(index)
+                room[number] -= sizes[index]
+                break
+        else:
+            batches.append([index])
+            room.append(max(0, capacity - sizes[index]))
+    batches.sort(key=min)
+    return [[entries[index] for index in sorted(batch)] for batch in batches]
+
+
+def _instrumented(method):
+    """Record the calls of a service method in the service metrics.
+
+    :param method: ReportPortalService method
+    :return:       wrapped method
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.time()
+        error = True
+        try:
+            result = method(self, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            self.metrics.record_call(method.__name__, time.time() - start,
+                                     error)
+    return wrapper
+
+
+def _acknowledged(method):
+    """Acknowledge the journal entry of a service call once it is sent.
+
+    :param method: ReportPortalService method writing a journal entry
+    :return:       wrapped method
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._journal is None or self._journal_only:
+            return method(self, *args, **kwargs)
+        with self._acknowledging():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _AcknowledgedRequest(object):
+    """Request releasing its journal entries once it is sent."""
+
+    __slots__ = ("func", "acknowledgements")
+
+    def __init__(self, func, acknowledgements):
+        self.func = func
+        self.acknowledgements = acknowledgements
+
+    def __call__(self):
+        result = self.func()
+        for acknowledgement in self.acknowledgements:
+            acknowledgement.done()
+        return result
+
+
+def _agent_distribution(agent_name):
+    """Get the name and version of an installed distribution.
+
+    importlib.metadata is used where available, pkg_resources, which is
+    slow to import with many distributions installed, is the fallback.
+
+    :param agent_name: distribution name
+    :return:           'name version' string, None if it is not installed
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            metadata = None
+    if metadata is not None:
+        try:
+            distribution = metadata.distribution(agent_name)
+        except metadata.PackageNotFoundError:
+            return None
+        return "{0} {1}".format(distribution.metadata["Name"],
+                                distribution.version)
+
+    import pkg_resources
+    try:
+        return str(pkg_resources.get_distribution(agent_name))
+    except pkg_resources.DistributionNotFound:
+        return None
+
+
+# get_system_information() results by agent name, platform.processor() may
+# run a subprocess
+_system_information = {}
+
+
 def uri_join(*uri_parts):
     """Join uri parts.
 
@@ -158,8 +365,151 @@ def uri_join(*uri_parts):
     return '/'.join(str(s).strip('/').strip('\\') for s in uri_parts)
 
 
+_forkable_services = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    """Prepare all the existing services for use in a forked process."""
+    for service in list(_forkable_services):
+        service._after_fork()
+
+
+def _register_at_fork(service):
+    """Reset the service in forked child processes.
+
+    Nothing is done on Python versions without os.register_at_fork().
+
+    :param service: ReportPortalService instance
+    """
+    if not _forkable_services and hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+    _forkable_services.add(service)
+
+
+# services to terminate at the interpreter exit, and the previous handlers
+# of the signals they are terminated on
+_exiting_services = weakref.WeakSet()
+_signal_handlers = {}
+
+
+def _terminate_at_exit():
+    """Terminate the services which are not terminated yet."""
+    for service in list(_exiting_services):
+        try:
+            service.terminate(timeout=service.exit_timeout)
+        except Exception:
+            logger.exception("Failed to terminate the service at exit")
+
+
+atexit.register(_terminate_at_exit)
+
+
+def _terminate_on_signal(signum, frame):
+    """Terminate the services, then handle the signal as before.
+
+    The signal may interrupt a thread holding a lock of a service, so the
+    services are terminated on another thread which is waited for within
+    their exit timeouts only.
+
+    :param signum: signal number
+    :param frame:  interrupted stack frame
+    """
+    timeouts = [service.exit_timeout for service in list(_exiting_services)]
+    thread = threading.Thread(target=_terminate_at_exit, name="rp-terminate")
+    thread.daemon = True
+    thread.start()
+    thread.join(None if None in timeouts else sum(timeouts))
+    previous = _signal_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def _register_at_exit(service, signals=()):
+    """Terminate the service at the interpreter exit and on the signals.
+
+    :param service: ReportPortalService instance
+    :param signals: signal numbers, their handlers are installed once and
+                    call the handlers installed before them
+    """
+    _exiting_services.add(service)
+    for signum in signals:
+        if signum in _signal_handlers:
+            continue
+        try:
+            previous = signal.signal(signum, _terminate_on_signal)
+        except ValueError:
+            logger.warning("Signal %s handler can only be installed in the "
+                           "main thread", signum)
+            continue
+        _signal_handlers[signum] = previous
+
+
+def _run_until(func, deadline):
+    """Call the function, in another thread if there is a deadline.
+
+    :param func:     callable without arguments
+    :param deadline: time to stop waiting for it at, None for no limit
+    :return bool:    whether the function returned in time
+    """
+    if deadline is None:
+        func()
+        return True
+    thread = threading.Thread(target=func, name="rp-deadline")
+    thread.daemon = True
+    thread.start()
+    thread.join(max(0.0, deadline - time.time()))
+    return not thread.is_alive()
+
+
+class _NoLock(object):
+    """Context manager standing in for a lock which is not needed."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_LOCK = _NoLock()
+# probe idle pooled connections, so that the ones dropped by a firewall or a
+# load balancer are detected instead of hanging the next request
+_KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+class _PoolAdapter(HTTPAdapter):
+    """HTTP adapter with TCP keep-alive on the pooled connections."""
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["keep_alive"]
+
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super(_PoolAdapter, self).__init__(**kwargs)
+
+    def _socket_options(self, kwargs):
+        if self.keep_alive:
+            kwargs.setdefault("socket_options", _KEEPALIVE_SOCKET_OPTIONS)
+        return kwargs
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(_PoolAdapter, self).init_poolmanager(
+            *args, **self._socket_options(kwargs))
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        return super(_PoolAdapter, self).proxy_manager_for(
+            proxy, **self._socket_options(proxy_kwargs))
+
+
 class ReportPortalService(object):
-    """Service class with report portal event callbacks."""
+    """Service class with report portal event callbacks.
+
+    The service is thread-safe: the threads of a launch may start, log to
+    and finish items concurrently, sharing the pooled connections.
+    """
 
     def __init__(self,
                  endpoint,
@@ -168,6 +518,35 @@ class ReportPortalService(object):
                  is_skipped_an_issue=True,
                  verify_ssl=True,
                  retries=None,
+                 log_batch_size=None,
+                 log_batch_payload_size=LOG_BATCH_PAYLOAD_SIZE,
+                 log_batch_interval=LOG_BATCH_INTERVAL,
+                 async_requests=False,
+                 async_workers=1,
+                 upload_chunk_size=CHUNK_SIZE,
+                 max_log_batch_payload_size=MAX_LOG_BATCH_PAYLOAD_SIZE,
+                 item_id_cache_size=1024,
+                 journal=None,
+                 journal_only=False,
+                 retry_policy=None,
+                 metrics_file=None,
+                 json_serializer=None,
+                 dedup_attachments=False,
+                 compression=None,
+                 compression_threshold=COMPRESSION_THRESHOLD,
+                 max_message_size=MAX_MESSAGE_SIZE,
+                 message_preview_size=MESSAGE_PREVIEW_SIZE,
+                 limiter=None,
+                 timeout=None,
+                 keep_alive=True,
+                 pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=None,
+                 max_queued_log_bytes=None,
+                 log_overflow_policy=BLOCK,
+                 exit_timeout=EXIT_TIMEOUT,
+                 exit_signals=(),
+                 auto_finish_items=True,
+                 record_traffic=None,
                  **kwargs):
         """Init the service class.
 
@@ -178,6 +557,100 @@ class ReportPortalService(object):
             is_skipped_an_issue: option to mark skipped tests as not
                 'To Investigate' items on Server side.
             verify_ssl: option to not verify ssl certificates
+            log_batch_size: option to buffer log() calls and send them
+                with log_batch() in batches of this many records.
+            log_batch_payload_size: send the buffered logs once their
+                approximate size reaches this number of bytes.
+            log_batch_interval: send the buffered logs at least once in
+                this number of seconds.
+            async_requests: option to generate launch and item UUIDs on
+                the client side and send all requests in the background.
+                Start methods return the generated UUIDs immediately, the
+                other methods return None.
+            async_workers: number of threads sending requests in the async
+                mode. Independent requests are sent concurrently, while an
+                item is always started after its parent and before its logs
+                and finish, and a launch is finished after everything else.
+            upload_chunk_size: maximum number of bytes of an attachment
+                read into memory at once while log_batch() sends it.
+            max_log_batch_payload_size: maximum size of a log_batch()
+                request accepted by the server, bigger batches are split.
+            item_id_cache_size: number of item UUID to ID mappings cached
+                for the current launch, 0 disables the cache.
+            journal: path of a directory to write every call to before it
+                is sent, or a Journal object. Implies async_requests. A
+                journal which is not sent completely can be uploaded later
+                with 'python -m reportportal_client replay <journal>'.
+            journal_only: option to only write the calls to the journal
+                without sending anything, to upload them later.
+            retry_policy: RetryPolicy for all the requests. By default
+                failed requests are retried with exponential backoff within
+                a budget of retries per launch, and a circuit breaker stops
+                sending requests to a server which keeps failing: the calls
+                raise CircuitOpenError, in the async mode the requests wait
+                in the queue instead.
+            metrics_file: path to write the metrics to on terminate(), in
+                the Prometheus text format if it ends with .prom, as JSON
+                otherwise. The metrics are always available as
+                service.metrics.
+            json_serializer: 'orjson', 'ujson', 'json' or a callable
+                encoding the request payloads to JSON bytes. By default
+                the fastest installed library is used.
+            dedup_attachments: option to hash the attachment contents and
+                send every content once per log batch request. Records
+                with a repeated content refer to the attachment sent with
+                the first one, under its name. attachment_bytes_saved
+                counts the bytes not sent.
+            compression: 'gzip' or 'deflate' to compress the request
+                bodies with this Content-Encoding. The server, or a proxy
+                in front of it, must accept compressed requests.
+            compression_threshold: minimum number of compressible bytes
+                of a request to compress it: the JSON payload, or the JSON
+                part and the text, JSON and XML attachments of a log batch.
+            max_message_size: maximum number of characters of a log
+                message. A longer message is written to a temporary file
+                and sent as a text/plain attachment, the log message is
+                its beginning. None disables it.
+            message_preview_size: number of characters of a long message
+                kept in the log message.
+            limiter: AdaptiveLimiter of the concurrent requests and their
+                rate, it may be shared by several services. By default the
+                concurrency grows while the latency stays low and both
+                limits are cut on 429/503 responses, timeouts and growing
+                latency. False disables it. The current limits are
+                available as service.limits.
+            timeout: timeout of the requests in seconds, a number or a
+                (connect timeout, read timeout) tuple. None waits forever.
+            keep_alive: option to reuse the connections, with TCP
+                keep-alive probes on the idle ones. False closes every
+                connection after its request.
+            pool_connections: number of connection pools cached, one per
+                host and scheme.
+            pool_maxsize: maximum number of connections kept open to a
+                host, by default 10 or async_workers if it is more. Set it
+                to the number of threads calling the service concurrently,
+                the connections over it are closed after their request.
+            max_queued_log_bytes: maximum approximate size of the logs and
+                attachments waiting to be sent in the async mode, and of
+                the ones buffered by log batching. None for no limit.
+            log_overflow_policy: 'block' to make the log calls wait for
+                room in the queue, 'drop_oldest' to drop the oldest queued
+                logs instead. Launch and item requests are never dropped
+                nor wait. dropped_logs counts the dropped log records.
+            exit_timeout: seconds to wait for the queued requests when
+                the service is terminated at the interpreter exit, without
+                terminate() called before. None waits for all of them.
+            exit_signals: signal numbers to terminate the service on, e.g.
+                [signal.SIGTERM] which kills a process without running the
+                exit handlers. The handlers installed before are called
+                afterwards. They can only be installed in the main thread.
+            auto_finish_items: option to finish the items left open, e.g.
+                by a crashed test, with the INTERRUPTED status before the
+                launch is finished. service.items tracks the open items.
+            record_traffic: path of a file to record the requests to, or a
+                TrafficRecorder, to replay them later against another
+                server with 'python -m reportportal_client replay-traffic'.
+                The log messages are not recorded, only their size.
         """
         super(ReportPortalService, self).__init__()
         self.endpoint = endpoint
@@ -186,19 +659,529 @@ class ReportPortalService(object):
         self.is_skipped_an_issue = is_skipped_an_issue
         self.base_url_v1 = uri_join(self.endpoint, "api/v1", self.project)
         self.base_url_v2 = uri_join(self.endpoint, "api/v2", self.project)
-
-        self.session = requests.Session()
-        if retries:
-            self.session.mount('https://', HTTPAdapter(max_retries=retries))
-            self.session.mount('http://', HTTPAdapter(max_retries=retries))
-        self.session.headers["Authorization"] = "bearer {0}".format(self.token)
+        # url prefixes of the frequent calls, item ids are appended to them
+        self._launch_url = uri_join(self.base_url_v2, "launch")
+        self._item_url = uri_join(self.base_url_v2, "item")
+        self._item_url_v1 = uri_join(self.base_url_v1, "item")
+        self._log_url = uri_join(self.base_url_v2, "log")
+        self._dumps = get_serializer(json_serializer)
+        self.dedup_attachments = dedup_attachments
+        self.attachments_deduplicated = 0
+        self.attachment_bytes_saved = 0
+        # guards the counters updated by the sending threads
+        self._counters_lock = threading.Lock()
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_message_size = max_message_size
+        self.message_preview_size = message_preview_size
+
+        self.retries = retries
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.pool_connections = pool_connections
+        if pool_maxsize is None:
+            pool_maxsize = max(DEFAULT_POOLSIZE, async_workers)
+        self.pool_maxsize = pool_maxsize
+        self.session = self._create_session()
         self.launch_id = None
         self.verify_ssl = verify_ssl
+        self.upload_chunk_size = upload_chunk_size
+        self.max_log_batch_payload_size = max_log_batch_payload_size
+        self.item_id_cache = LRUCache(item_id_cache_size)
+        self.items = ItemTree()
+        self.auto_finish_items = auto_finish_items
+        if retry_policy is None:
+            retry_policy = RetryPolicy(budget=RetryBudget(),
+                                       breaker=CircuitBreaker())
+        self.retry_policy = retry_policy
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+        self.limiter = limiter or None
+        self.metrics = Metrics()
+        self._metrics_file = metrics_file
+        if record_traffic is not None and \
+                not isinstance(record_traffic, TrafficRecorder):
+            record_traffic = TrafficRecorder(record_traffic)
+        self.recorder = record_traffic
+
+        self._journal = None
+        self._journal_only = journal_only
+        if journal is not None:
+            if not isinstance(journal, Journal):
+                journal = Journal(journal)
+            self._journal = journal
+            async_requests = True
+        # the journal entry of the call being made by every thread
+        self._acks = threading.local()
+
+        self._scheduler = None
+        self._scheduler_options = {"workers": async_workers,
+                                   "max_log_bytes": max_queued_log_bytes,
+                                   "overflow_policy": log_overflow_policy}
+        self._dropped_logs = 0
+        # guards the async mode bookkeeping below, so that the service can
+        # be called from several threads; the sync mode has none
+        self._bookkeeping_lock = _NO_LOCK
+        if async_requests:
+            self._scheduler = RequestScheduler(**self._scheduler_options)
+            self._bookkeeping_lock = threading.RLock()
+        self._log_batch_options = None
+        if log_batch_size:
+            self._log_batch_options = {"batch_size": log_batch_size,
+                                       "payload_size": log_batch_payload_size,
+                                       "flush_interval": log_batch_interval,
+                                       "max_buffer_bytes":
+                                           max_queued_log_bytes,
+                                       "overflow_policy": log_overflow_policy}
+        # async mode bookkeeping: the launch start task, the last task of
+        # every item and pending log/update/child tasks to finish an item
+        # after; the parents are in the item tree
+        self._launch_task = None
+        self._item_tasks = {}
+        self._item_tasks_limit = ITEM_TASKS_LIMIT
+        self._item_pending = {}
+        self._log_batcher = None
+        if self._log_batch_options:
+            self._log_batcher = LogBatcher(self._log_batch,
+                                           **self._log_batch_options)
+        self.exit_timeout = exit_timeout
+        # report of terminate(), it is done once
+        self._termination = None
+        self._terminate_lock = threading.Lock()
+        _register_at_fork(self)
+        _register_at_exit(self, exit_signals)
+
+    def _create_session(self):
+        """Create the HTTP session with the service settings.
+
+        One session is shared by all the threads: its connection pools are
+        thread-safe and every thread takes its own connection from them.
+
+        :return: requests.Session object
+        """
+        session = requests.Session()
+        for scheme in ("https://", "http://"):
+            adapter = _PoolAdapter(keep_alive=self.keep_alive,
+                                   pool_connections=self.pool_connections,
+                                   pool_maxsize=self.pool_maxsize,
+                                   max_retries=self.retries or 0)
+            session.mount(scheme, adapter)
+        session.headers["Authorization"] = "bearer {0}".format(self.token)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def _after_fork(self):
+        """Reset the connections and background threads in a child process.
+
+        The pooled connections of the parent process must not be shared,
+        and the threads sending the requests do not exist in the child.
+        The requests and logs queued by the parent are left to the parent,
+        and so are the journal and the traffic recording.
+        """
+        self.session = self._create_session()
+        if isinstance(self.limiter, AdaptiveLimiter):
+            self.limiter.after_fork()
+        if self._scheduler is not None:
+            self._scheduler = RequestScheduler(**self._scheduler_options)
+            # the lock may have been held by another thread at the fork
+            self._bookkeeping_lock = threading.RLock()
+            self._item_pending.clear()
+        # the locks may have been held by other threads at the fork too
+        self.items = ItemTree()
+        self._counters_lock = threading.Lock()
+        self._terminate_lock = threading.Lock()
+        self._acks = threading.local()
+        # the files are the parent's, the lines of both would interleave
+        self.recorder = None
+        if self._journal is not None:
+            # the child would write its entries at the positions of the
+            # parent ones and could mark the parent journal complete
+            if self._journal_only:
+                logger.warning("The journal is not written in a forked "
+                               "child process, its calls are dropped")
+            self._journal = None
+        if self._log_batcher is not None:
+            self._log_batcher = LogBatcher(self._log_batch,
+                                           **self._log_batch_options)
+
+    def flush(self, timeout=None):
+        """Send the buffered logs and wait for the queued requests.
+
+        :param timeout: maximum time to wait in seconds, None for no limit
+        :return dict:   report of the requests, see terminate()
+        """
+        started = time.time()
+        deadline = None if timeout is None else started + timeout
+        pending = 0
+        if self._log_batcher is not None and \
+                not _run_until(self._log_batcher.flush, deadline):
+            pending += len(self._log_batcher)
+        if self._scheduler is not None and not self._scheduler.join(
+                timeout=None if deadline is None else
+                max(0.0, deadline - time.time())):
+            pending += self._scheduler.queue_depth
+        return self._report(pending, started)
+
+    def terminate(self, timeout=None, *args, **kwargs):
+        """Call this to terminate the service.
+
+        The buffered logs and the queued requests are sent concurrently by
+        the workers, the ones not sent within the timeout are dropped. The
+        service is terminated once, later calls return the same report. It
+        is called at the interpreter exit with exit_timeout if it is not
+        called before.
+
+        :param timeout: maximum time to wait in seconds, None for no limit
+        :return dict:   sent, retried and failed requests, dropped logs,
+                        pending requests not sent in time and elapsed
+                        seconds
+        """
+        with self._terminate_lock:
+            if self._termination is not None:
+                return self._termination
+            started = time.time()
+            deadline = None if timeout is None else started + timeout
+            pending = 0
+            if self._log_batcher is not None and \
+                    not _run_until(self._log_batcher.stop, deadline):
+                pending += len(self._log_batcher)
+            if self._scheduler is not None:
+                pending += self._scheduler.stop(
+                    timeout=None if deadline is None else
+                    max(0.0, deadline - time.time()))
+            if self._journal is not None:
+                if not self._journal_only and not self.failed_requests \
+                        and not self.dropped_logs and not pending:
+                    self._journal.mark_complete()
+                self._journal.close()
+            if self._metrics_file:
+                self.metrics.dump(self._metrics_file)
+            if self.recorder is not None:
+                self.recorder.close()
+            self._termination = self._report(pending, started)
+            _exiting_services.discard(self)
+            if pending or self._termination["dropped"]:
+                logger.warning("Terminated with %(pending)d requests not "
+                               "sent and %(dropped)d logs dropped",
+                               self._termination)
+            return self._termination
+
+    def _report(self, pending, started):
+        """Sum up the requests of the service.
+
+        :param pending: number of requests not sent in time
+        :param started: time the waiting started at
+        :return dict:   sent, retried, failed, dropped, pending and elapsed
+        """
+        stats = self.metrics.snapshot().values()
+        failed = sum(method["request_errors"] for method in stats)
+        return {"sent": sum(method["requests"] for method in stats) - failed,
+                "retried": sum(method["retries"] for method in stats),
+                "failed": failed,
+                "dropped": self.dropped_logs,
+                "pending": pending,
+                "elapsed": time.time() - started}
+
+    def _request(self, method, url, handler, call="request", **kwargs):
+        """Send the request and process the response.
+
+        :param method:  name of the session method: get, post, put
+        :param url:     request url
+        :param handler: callable which extracts the result from the response
+        :param call:    name of the service method the metrics are recorded
+                        for
+        :param kwargs:  other arguments for the session method
+        :return:        value returned by the handler
+        """
+        body = kwargs.get("json")
+        if "json" in kwargs:
+            data = self._dumps(kwargs.pop("json"))
+            headers = {"Content-Type": "application/json"}
+            if self.compression and \
+                    len(data) >= self.compression_threshold:
+                data = compress(data, self.compression)
+                headers["Content-Encoding"] = self.compression
+            kwargs["data"] = data
+            kwargs["headers"] = headers
+        send = partial(getattr(self.session, method), url=url,
+                       verify=self.verify_ssl, timeout=self.timeout, **kwargs)
+        # a POST creates an entry again unless it has a client UUID
+        idempotent = method != "post" or \
+            (isinstance(body, dict) and bool(body.get("uuid")))
+        if self.recorder is None:
+            return handler(self._send(call, send, idempotent))
+        started = time.time()
+        response = None
+        try:
+            response = self._send(call, send, idempotent)
+        finally:
+            self._record(call, method, url, started, response,
+                         body_size(kwargs.get("data")), body=body,
+                         params=kwargs.get("params"))
+        return handler(response)
+
+    def _record(self, call, method, url, started, response, sent,
+                body=None, files=None, params=None):
+        """Record a request to the traffic recording.
+
+        :param call:     name of the service method
+        :param method:   HTTP method
+        :param url:      request url
+        :param started:  time the request was started at
+        :param response: Response, None if the request failed
+        :param sent:     request body size in bytes
+        :param body:     JSON payload
+        :param files:    multipart parts of a log batch request
+        :param params:   query parameters
+        """
+        api = "v2" if url.startswith(self.base_url_v2) else "v1"
+        base = self.base_url_v2 if api == "v2" else self.base_url_v1
+        path = url[len(base):].lstrip("/")
+        if params:
+            path += "?" + urlencode(params, doseq=True)
+        try:
+            self.recorder.record(call, method, api, path, started,
+                                 response=response, sent=sent, body=body,
+                                 files=files)
+        except Exception:
+            logger.exception("Failed to record the %s request", call)
+
+    def _send(self, call, send, idempotent=True):
+        """Send a request with the retry policy and record its metrics.
+
+        :param call:       name of the service method the request is sent
+                           for
+        :param send:       callable without arguments returning a Response
+        :param idempotent: whether the request can be retried after the
+                           server may have processed it
+        :return:           Response of the last attempt
+        """
+        attempts = []
+        limiter = self.limiter
+
+        def attempt():
+            attempts.append(None)
+            if limiter is None:
+                return send()
+            started = limiter.acquire()
+            begin = time.time()
+            response = error = None
+            try:
+                response = send()
+                return response
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                request = getattr(response, "request", None)
+                limiter.release(started, time.time() - begin,
+                                status=getattr(response, "status_code", None),
+                                error=error, kind=call,
+                                size=body_size(getattr(request, "body",
+                                                       None)))
+
+        start = time.time()
+        response = None
+        try:
+            response = self.retry_policy.call(
+                attempt, wait=self._scheduler is not None,
+                idempotent=idempotent)
+            return response
+        finally:
+            sent = received = 0
+            if response is not None:
+                request = getattr(response, "request", None)
+                sent = body_size(getattr(request, "body", None)) * \
+                    len(attempts)
+                received = body_size(getattr(response, "content", None))
+            self.metrics.record_request(
+                call, time.time() - start,
+                retries=max(0, len(attempts) - 1),
+                bytes_sent=sent, bytes_received=received,
+                error=response is None or not response.ok)
+
+    @property
+    def queue_depth(self):
+        """Return the number of requests not sent yet in the async mode."""
+        if self._scheduler is None:
+            return 0
+        return self._scheduler.queue_depth
+
+    @property
+    def limits(self):
+        """Return the current request limits, None without a limiter."""
+        if self.limiter is None:
+            return None
+        return self.limiter.snapshot()
+
+    @property
+    def failed_requests(self):
+        """Return the number of requests failed in the async mode."""
+        if self._scheduler is None:
+            return 0
+        return self._scheduler.failed_count
+
+    def wait_queue(self, max_depth=0):
+        """Wait until at most max_depth requests are not sent yet.
+
+        Call it to keep a producer of many calls, e.g. an importer, from
+        queueing more requests than it is useful. Returns at once in the
+        sync mode.
+
+        :param max_depth: number of requests allowed to stay in the queue
+        """
+        if self._scheduler is not None:
+            self._scheduler.join(max_depth)
+
+    def _submit(self, func, after=(), barrier=False, priority=None,
+                size=0, discard=None, reserved=False, acknowledgements=()):
+        """Call func right away or schedule it in the async mode.
+
+        :param func:     callable without arguments which sends a request
+        :param after:    tasks which must be executed before this one
+        :param barrier:  execute after all the requests submitted before
+        :param priority: LOG or ATTACHMENT for the log requests, which are
+                         sent after the launch and item requests
+        :param size:     approximate payload size of a log request
+        :param discard:  callable releasing the payload of a log request
+                         dropped from a full queue
+        :param reserved: whether the room for the log request is reserved
+                         with _reserve() already
+        :param acknowledgements: journal entries of buffered log records
+                         sent by the request, besides the one of the call
+        :return:         value returned by func, Task in the async mode,
+                         None if the calls are only journaled
+        """
+        if self._journal_only:
+            return None
+        acknowledgements = list(acknowledgements)
+        current = getattr(self._acks, "current", None)
+        if current is not None:
+            acknowledgements.append(current)
+        if acknowledgements:
+            for acknowledgement in acknowledgements:
+                acknowledgement.add()
+            func = _AcknowledgedRequest(func, acknowledgements)
+        if self._scheduler is None:
+            return func()
+        return self._scheduler.schedule(func, after=after, barrier=barrier,
+                                        priority=priority, size=size,
+                                        discard=discard, reserved=reserved)
+
+    def _reserve(self, size):
+        """Wait for room for a log request in the async mode queue.
+
+        It is called before the bookkeeping lock is taken, so that the
+        launch and item requests of other threads do not wait for the
+        queued logs.
+
+        :param size: approximate payload size of the log request
+        :return:     callable giving the room back if the request is not
+                     submitted, None if nothing is reserved
+        """
+        if self._journal_only or self._scheduler is None:
+            return None
+        scheduler = self._scheduler
+        scheduler.reserve(size)
+        return partial(scheduler.release, size)
+
+    def _discard_logs(self, count, files=()):
+        """Count the dropped log records and remove their temporary files.
+
+        :param count: number of log records dropped
+        :param files: multipart attachment parts of the records
+        """
+        with self._counters_lock:
+            self._dropped_logs += count
+        for _, (_, data, _) in files:
+            if isinstance(data, TemporaryFilePath):
+                data.remove()
+
+    @property
+    def dropped_logs(self):
+        """Return the number of log records dropped from the full queue."""
+        dropped = self._dropped_logs
+        if self._log_batcher is not None:
+            dropped += self._log_batcher.dropped_count
+        return dropped
+
+    def _item_deps(self, item_id):
+        """Get the tasks a request referring to the item must wait for.
+
+        :param item_id: item UUID or None for the launch itself
+        :return:        list of tasks
+        """
+        return [self._item_tasks.get(item_id, self._launch_task)]
+
+    def _pending(self, item_id, result):
+        """Remember the task to finish the item after it.
+
+        :param item_id: item UUID the task refers to
+        :param result:  value returned by _submit()
+        :return:        the result in the sync mode, None in the async mode
+        """
+        if self._scheduler is None:
+            return result
+        if item_id and result is not None:
+            tasks = self._item_pending.setdefault(item_id, [])
+            if len(tasks) >= 64:
+                tasks[:] = [task for task in tasks if not task.done()]
+            tasks.append(result)
+
+    def _client_uuid(self, kwargs):
+        """Get the client side UUID for a new launch or item.
+
+        The UUID is taken from the 'uuid' keyword argument if given, or
+        generated in the async mode and stored into kwargs.
+
+        :param kwargs: keyword arguments of the start method
+        :return:       the UUID or None
+        """
+        if self._scheduler is not None and not kwargs.get("uuid"):
+            kwargs["uuid"] = str(uuid.uuid4())
+        return kwargs.get("uuid")
+
+    def _journal_call(self, call, **arguments):
+        """Write the call to the journal if journaling is enabled.
 
-    def terminate(self, *args, **kwargs):
-        """Call this to terminate the service."""
-        pass
+        The entry is acknowledged once the requests the call submits are
+        sent, see _acknowledging().
 
+        :param call:      name of the public method
+        :param arguments: keyword arguments of the call
+        """
+        if self._journal is not None:
+            position = self._journal.append(call, arguments)
+            if not self._journal_only:
+                self._acks.current = _Acknowledgement(self._journal,
+                                                      position)
+
+    @contextlib.contextmanager
+    def _acknowledging(self, journal=None, position=None):
+        """Acknowledge a journal entry once the requests of a call are sent.
+
+        The requests submitted within the block are the ones of the call.
+
+        :param journal:  Journal of the entry, None for the entry the call
+                         writes with _journal_call()
+        :param position: position of the entry in the journal
+        """
+        outer = getattr(self._acks, "current", None)
+        self._acks.current = None if journal is None else \
+            _Acknowledgement(journal, position)
+        try:
+            yield
+        except BaseException:
+            self._acks.current = outer
+            raise
+        acknowledgement = self._acks.current
+        self._acks.current = outer
+        if acknowledgement is not None:
+            acknowledgement.done()
+
+    @_instrumented
+    @_acknowledged
     def start_launch(self,
                      name,
                      start_time,
@@ -207,6 +1190,12 @@ class ReportPortalService(object):
                      mode=None,
                      **kwargs):
         """Start a new launch with the given parameters."""
+        launch_uuid = self._client_uuid(kwargs)
+        if self.retry_policy.budget is not None:
+            self.retry_policy.budget.reset()
+        self._journal_call("start_launch", name=name, start_time=start_time,
+                           description=description, attributes=attributes,
+                           mode=mode, **kwargs)
         if attributes and isinstance(attributes, dict):
             attributes = _dict_to_payload(attributes)
         data = {
@@ -216,27 +1205,60 @@ class ReportPortalService(object):
             "startTime": start_time,
             "mode": mode
         }
-        url = uri_join(self.base_url_v2, "launch")
-        r = self.session.post(url=url, json=data, verify=self.verify_ssl)
-        self.launch_id = _get_id(r)
+        if launch_uuid:
+            data["uuid"] = launch_uuid
+        with self._bookkeeping_lock:
+            launch_id = self._submit(
+                partial(self._request, "post", self._launch_url, _get_id,
+                        call="start_launch", json=data),
+                barrier=True)
+            self.item_id_cache.clear()
+            self.items.clear()
+            if self._scheduler is not None:
+                self._launch_task = launch_id
+                self._item_tasks.clear()
+                self._item_pending.clear()
+                launch_id = launch_uuid
+        self.launch_id = launch_id
         logger.debug("start_launch - ID: %s", self.launch_id)
         return self.launch_id
 
+    @_instrumented
+    @_acknowledged
     def finish_launch(self, end_time, status=None, **kwargs):
         """Finish a launch with the given parameters.
 
         Status can be one of the followings:
         (PASSED, FAILED, STOPPED, SKIPPED, RESETED, CANCELLED)
         """
+        if self.auto_finish_items and self.items:
+            # journaled before the launch finish, a replay sends them first
+            self.finish_open_items(end_time)
+        self._journal_call("finish_launch", end_time=end_time, status=status,
+                           **kwargs)
+        if self._log_batcher is not None:
+            self._log_batcher.flush()
         data = {
             "endTime": end_time,
             "status": status
         }
         url = uri_join(self.base_url_v1, "launch", self.launch_id, "finish")
-        r = self.session.put(url=url, json=data, verify=self.verify_ssl)
         logger.debug("finish_launch - ID: %s", self.launch_id)
-        return _get_msg(r)
-
+        with self._bookkeeping_lock:
+            result = self._submit(
+                partial(self._request, "put", url, _get_msg,
+                        call="finish_launch", json=data),
+                barrier=True)
+            self.item_id_cache.clear()
+            self.items.clear()
+            if self._scheduler is not None:
+                self._item_tasks.clear()
+                self._item_pending.clear()
+                return None
+        return result
+
+    @_instrumented
+    @_acknowledged
     def start_test_item(self,
                         name,
                         start_time,
@@ -262,6 +1284,13 @@ class ReportPortalService(object):
                 ...
             }
         """
+        item_uuid = self._client_uuid(kwargs)
+        self._journal_call("start_test_item", name=name,
+                           start_time=start_time, item_type=item_type,
+                           description=description, attributes=attributes,
+                           parameters=parameters,
+                           parent_item_id=parent_item_id,
+                           has_stats=has_stats, **kwargs)
         if attributes and isinstance(attributes, dict):
             attributes = _dict_to_payload(attributes)
         if parameters:
@@ -277,16 +1306,26 @@ class ReportPortalService(object):
             "parameters": parameters,
             "hasStats": has_stats
         }
+        if item_uuid:
+            data["uuid"] = item_uuid
+        url = self._item_url
         if parent_item_id:
-            url = uri_join(self.base_url_v2, "item", parent_item_id)
-        else:
-            url = uri_join(self.base_url_v2, "item")
-        r = self.session.post(url=url, json=data, verify=self.verify_ssl)
-
-        item_id = _get_id(r)
+            url = "{0}/{1}".format(url, parent_item_id)
+        with self._bookkeeping_lock:
+            item_id = self._submit(
+                partial(self._request, "post", url, _get_id,
+                        call="start_test_item", json=data),
+                after=self._item_deps(parent_item_id))
+            if self._scheduler is not None:
+                self._item_tasks[item_uuid] = item_id
+                item_id = item_uuid
+            if item_id:
+                self.items.start(item_id, parent_item_id, name, start_time)
         logger.debug("start_test_item - ID: %s", item_id)
         return item_id
 
+    @_instrumented
+    @_acknowledged
     def update_test_item(self, item_uuid, attributes=None, description=None):
         """Update existing test item at the Report Portal.
 
@@ -295,16 +1334,33 @@ class ReportPortalService(object):
         :param list attributes: Test item attributes
                                 [{'key': 'k_name', 'value': 'k_value'}, ...]
         """
+        self._journal_call("update_test_item", item_uuid=item_uuid,
+                           attributes=attributes, description=description)
         data = {
             "description": description,
             "attributes": attributes,
         }
+        with self._bookkeeping_lock:
+            result = self._submit(
+                partial(self._update_test_item, item_uuid, data),
+                after=self._item_deps(item_uuid))
+            return self._pending(item_uuid, result)
+
+    def _update_test_item(self, item_uuid, data):
+        """Look up the item ID and send the update request.
+
+        :param str item_uuid: Test item UUID returned on the item start
+        :param dict data:     update request payload
+        :return:              json message
+        """
         item_id = self.get_item_id_by_uuid(item_uuid)
-        url = uri_join(self.base_url_v1, "item", item_id, "update")
-        r = self.session.put(url=url, json=data, verify=self.verify_ssl)
+        url = "{0}/{1}/update".format(self._item_url_v1, item_id)
         logger.debug("update_test_item - Item: %s", item_id)
-        return _get_msg(r)
+        return self._request("put", url, _get_msg, call="update_test_item",
+                             json=data)
 
+    @_instrumented
+    @_acknowledged
     def finish_test_item(self,
                          item_id,
                          end_time,
@@ -323,6 +1379,9 @@ class ReportPortalService(object):
         :return:           json message
 
         """
+        self._journal_call("finish_test_item", item_id=item_id,
+                           end_time=end_time, status=status, issue=issue,
+                           attributes=attributes, **kwargs)
         # check if skipped test should not be marked as "TO INVESTIGATE"
         if issue is None and status == "SKIPPED" \
                 and not self.is_skipped_an_issue:
@@ -338,10 +1397,68 @@ class ReportPortalService(object):
             "launchUuid": self.launch_id,
             "attributes": attributes
         }
-        url = uri_join(self.base_url_v2, "item", item_id)
-        r = self.session.put(url=url, json=data, verify=self.verify_ssl)
+        url = "{0}/{1}".format(self._item_url, item_id)
         logger.debug("finish_test_item - ID: %s", item_id)
-        return _get_msg(r)
+        if self._log_batcher is not None:
+            # the buffered logs of the item are sent or queued before it
+            self._log_batcher.flush(item_id)
+        with self._bookkeeping_lock:
+            after = self._item_deps(item_id) + \
+                self._item_pending.pop(item_id, [])
+            result = self._submit(
+                partial(self._request, "put", url, _get_msg,
+                        call="finish_test_item", json=data),
+                after=after)
+            parent_item_id = self.items.finish(item_id)
+            if self._scheduler is None:
+                return result
+            self._item_tasks[item_id] = result
+            self._pending(parent_item_id, result)
+            if len(self._item_tasks) >= self._item_tasks_limit:
+                # an executed task orders nothing, the launch start task
+                # does the same for the items which are not in the map
+                self._item_tasks = dict(
+                    (key, task) for key, task in self._item_tasks.items()
+                    if task is not None and not task.done())
+                self._item_tasks_limit = max(ITEM_TASKS_LIMIT,
+                                             2 * len(self._item_tasks))
+
+    def finish_open_items(self, end_time, status="INTERRUPTED",
+                          item_id=None):
+        """Finish the open items, every item after its open children.
+
+        The items of different branches are finished concurrently: by the
+        async workers in the async mode, by up to pool_maxsize threads
+        otherwise.
+
+        :param end_time: time in UTC format
+        :param status:   status of the items
+        :param item_id:  finish the open descendants of this item only, by
+                         default all the open items
+        :return int:     number of the items finished
+        """
+        order = self.items.bottom_up(item_id)
+        if not order:
+            return 0
+        logger.debug("finish_open_items - %d items", len(order))
+        finish = partial(self.finish_test_item, end_time=end_time,
+                         status=status)
+        if self._scheduler is not None:
+            # the scheduler finishes the parents after their children
+            for open_item_id, _ in order:
+                finish(item_id=open_item_id)
+            return len(order)
+        scheduler = RequestScheduler(workers=self.pool_maxsize)
+        tasks = {}
+        for open_item_id, children in order:
+            tasks[open_item_id] = scheduler.schedule(
+                partial(finish, item_id=open_item_id),
+                after=[tasks[child] for child in children if child in tasks])
+        scheduler.stop()
+        if scheduler.failed_count:
+            logger.warning("Failed to finish %d of %d open items",
+                           scheduler.failed_count, len(order))
+        return len(order) - scheduler.failed_count
 
     def get_item_id_by_uuid(self, uuid):
         """Get test item ID by the given UUID.
@@ -349,9 +1466,41 @@ class ReportPortalService(object):
         :param str uuid: UUID returned on the item start
         :return str:     Test item id
         """
-        url = uri_join(self.base_url_v1, "item", "uuid", uuid)
-        return _get_json(self.session.get(
-            url=url, verify=self.verify_ssl))["id"]
+        item_id = self.item_id_cache.get(uuid)
+        if item_id is None:
+            url = "{0}/uuid/{1}".format(self._item_url_v1, uuid)
+            item_id = self._request("get", url, _get_json,
+                                    call="get_item_id_by_uuid")["id"]
+            self.item_id_cache.put(uuid, item_id)
+        return item_id
+
+    def prefetch_item_ids(self, uuids, page_size=100):
+        """Resolve test item IDs of many UUIDs with a few list requests.
+
+        The resolved IDs are cached, so the following get_item_id_by_uuid()
+        and update_test_item() calls for these items do not need a request.
+
+        :param uuids:     UUIDs returned on the item start
+        :param page_size: number of UUIDs resolved by one request
+        :return dict:     UUID to test item id mapping of the found items
+        """
+        missing = [item_uuid for item_uuid in uuids
+                   if item_uuid not in self.item_id_cache]
+        url = self._item_url_v1
+        for i in range(0, len(missing), page_size):
+            chunk = missing[i:i + page_size]
+            params = {"filter.in.uuid": ",".join(chunk),
+                      "page.size": len(chunk)}
+            data = self._request("get", url, _get_json,
+                                 call="prefetch_item_ids", params=params)
+            for item in data.get("content", []):
+                self.item_id_cache.put(item["uuid"], item["id"])
+        logger.debug("prefetch_item_ids - %d UUIDs", len(missing))
+        result = {}
+        for item_uuid in uuids:
+            if item_uuid in self.item_id_cache:
+                result[item_uuid] = self.item_id_cache.get(item_uuid)
+        return result
 
     def get_project_settings(self):
         """
@@ -360,10 +1509,12 @@ class ReportPortalService(object):
         :return: json body
         """
         url = uri_join(self.base_url_v1, "settings")
-        r = self.session.get(url=url, json={}, verify=self.verify_ssl)
         logger.debug("settings")
-        return _get_json(r)
+        return self._request("get", url, _get_json,
+                             call="get_project_settings", json={})
 
+    @_instrumented
+    @_acknowledged
     def log(self, time, message, level=None, attachment=None, item_id=None):
         """
         Create log for test.
@@ -373,8 +1524,16 @@ class ReportPortalService(object):
         :param level:
         :param attachment: files
         :param item_id:  id of item
-        :return: id of item from response
+        :return: id of item from response, None if logs are batched
         """
+        self._journal_call("log", time=time, message=message, level=level,
+                           attachment=attachment, item_id=item_id)
+        if self._journal_only:
+            return None
+        spilled = None
+        if self.max_message_size and message and \
+                len(message) > self.max_message_size:
+            message, spilled = self._spill_message(message)
         data = {
             "launchUuid": self.launch_id,
             "time": time,
@@ -383,15 +1542,74 @@ class ReportPortalService(object):
         }
         if item_id:
             data["itemUuid"] = item_id
+        records = [data]
         if attachment:
             data["attachment"] = attachment
-            return self.log_batch([data], item_id=item_id)
+        if spilled is not None:
+            if attachment:
+                # a record has one attachment, the message gets its own
+                records.append(dict(data, attachment=spilled))
+            else:
+                data["attachment"] = spilled
+        if self._log_batcher is not None:
+            current = getattr(self._acks, "current", None)
+            for record in records:
+                if current is not None:
+                    # released once the batch of the record is submitted,
+                    # never if the record is dropped
+                    current.add()
+                    record[_ACKNOWLEDGEMENT] = current
+                self._log_batcher.append(record)
+            return None
+        if "attachment" in data:
+            return self._log_batch(records, item_id=item_id)
         else:
-            url = uri_join(self.base_url_v2, "log")
-            r = self.session.post(url=url, json=data, verify=self.verify_ssl)
             logger.debug("log - ID: %s", item_id)
-            return _get_id(r)
-
+            size = len(message or "")
+            release = self._reserve(size)
+            try:
+                with self._bookkeeping_lock:
+                    result = self._submit(
+                        partial(self._request, "post", self._log_url,
+                                _get_id, call="log", json=data),
+                        after=self._item_deps(item_id), priority=LOG,
+                        size=size, discard=partial(self._discard_logs, 1),
+                        reserved=release is not None)
+                    release = None
+                    return self._pending(item_id, result)
+            finally:
+                if release is not None:
+                    release()
+
+    def _spill_message(self, message):
+        """Move a long log message into a temporary file.
+
+        The file is written in chunks, so the encoded message is never held
+        in memory as a whole, and it is removed once it is sent.
+
+        :param message: log message
+        :return:        (message preview, attachment dict) tuple
+        """
+        chunk = self.upload_chunk_size
+        with tempfile.NamedTemporaryFile(prefix="rp-message-", suffix=".txt",
+                                         delete=False) as f:
+            for i in range(0, len(message), chunk):
+                part = message[i:i + chunk]
+                if isinstance(part, six.text_type):
+                    part = part.encode("utf-8")
+                f.write(part)
+        name = "message-{0}.txt".format(uuid.uuid4().hex[:8])
+        preview = message[:self.message_preview_size]
+        preview += "\n... {0} characters more in {1}".format(
+            len(message) - len(preview), name)
+        logger.debug("log - message of %d characters sent as %s",
+                     len(message), name)
+        return preview, {"name": name,
+                         "data": TemporaryFilePath(f.name),
+                         "mime": "text/plain"}
+
+    @_instrumented
+    @_acknowledged
     def log_batch(self, log_data, item_id=None):
         """
         Log batch of messages with attachment.
@@ -402,13 +1620,38 @@ class ReportPortalService(object):
                 time, message, level, attachment
                 attachment is a dict of:
                     name: name of attachment
-                    data: fileobj or content
+                    data: fileobj, content or FilePath
                     mime: content type for attachment
+        The request body is streamed: file objects and FilePath attachments
+        are read in chunks of upload_chunk_size bytes while it is sent.
+
+        Records which do not fit into max_log_batch_payload_size bytes
+        together are split into several requests, an attachment bigger than
+        the limit is sent alone. The responses of these requests are merged
+        into one.
         """
-        url = uri_join(self.base_url_v2, "log")
+        self._journal_call("log_batch", log_data=log_data, item_id=item_id)
+        if self._journal_only:
+            return None
+        return self._log_batch(log_data, item_id)
+
+    def _log_batch(self, log_data, item_id=None):
+        """Send the log records, see log_batch().
 
-        attachments = []
+        :param log_data: list of log records
+        :param item_id:  id of item the records belong to
+        :return:         merged json data, None in the async mode
+        """
+        entries = []
+        # journal entries of the records buffered by log(), by id() of the
+        # records alive until the requests are submitted
+        acknowledgements = {}
         for log_item in log_data:
+            acknowledgement = log_item.pop(_ACKNOWLEDGEMENT, None)
+            if acknowledgement is not None:
+                acknowledgements[id(log_item)] = acknowledgement
+            if self._scheduler is not None:
+                _materialize(log_item)
             if item_id:
                 log_item["itemUuid"] = item_id
             log_item["launchUuid"] = self.launch_id
@@ -417,40 +1660,169 @@ class ReportPortalService(object):
             if "attachment" in log_item:
                 del log_item["attachment"]
 
+            field = None
             if attachment:
-                if not isinstance(attachment, collections.Mapping):
+                if not isinstance(attachment, collections_abc.Mapping):
                     attachment = {"data": attachment}
 
                 name = attachment.get("name", str(uuid.uuid4()))
                 log_item["file"] = {"name": name}
-                attachments.append(("file", (
+                field = ("file", (
                     name,
                     attachment["data"],
                     attachment.get("mime", "application/octet-stream")
-                )))
-
+                ))
+            # encoded once, to measure the record and to send it
+            entries.append((log_item, field, self._dumps(log_item)))
+
+        results = [
+            self._send_log_batch(self._log_url, batch, item_id,
+                                 acknowledgements)
+            for batch in _split_log_batch(entries,
+                                          self.max_log_batch_payload_size)
+        ]
+        if self._scheduler is not None:
+            return None
+        if len(results) == 1:
+            return results[0]
+        responses = []
+        for data in results:
+            responses.extend(data.get("responses", [data]))
+        return {"responses": responses}
+
+    def _send_log_batch(self, url, entries, item_id=None, record_acks=None):
+        """Send one log batch request or schedule it in the async mode.
+
+        :param url:         log endpoint url
+        :param entries:     list of (log record, attachment field, encoded
+                            log record) tuples
+        :param item_id:     id of item, used for debug logging only
+        :param record_acks: journal entries of the buffered log records by
+                            id() of the records
+        :return:            json data, Task in the async mode
+        """
+        acknowledgements = []
+        if record_acks:
+            acknowledgements = [record_acks[id(log_item)]
+                                for log_item, _, _ in entries
+                                if id(log_item) in record_acks]
+        if self.dedup_attachments:
+            entries = self._dedup_attachments(entries)
         files = [(
             "json_request_part", (
                 None,
-                json.dumps(log_data),
+                b"[" + b",".join(encoded for _, _, encoded in entries) + b"]",
                 "application/json"
             )
         )]
-        files.extend(attachments)
-        from reportportal_client import POST_LOGBATCH_RETRY_COUNT
-        for i in range(POST_LOGBATCH_RETRY_COUNT):
-            try:
-                r = self.session.post(
-                    url=url,
-                    files=files,
-                    verify=self.verify_ssl
-                )
-            except KeyError:
-                if i < POST_LOGBATCH_RETRY_COUNT - 1:
-                    continue
+        files.extend(field for _, field, _ in entries if field)
+        item_ids = set(log_item.get("itemUuid") for log_item, _, _ in entries)
+        attached = sum(data_size(data) for _, (_, data, _) in files[1:])
+        size = attached + data_size(files[0][1][1])
+        priority = ATTACHMENT if attached >= LARGE_ATTACHMENT_SIZE else LOG
+        release = self._reserve(size)
+        try:
+            with self._bookkeeping_lock:
+                after = []
+                if self._scheduler is not None:
+                    for log_item_id in item_ids:
+                        after.extend(self._item_deps(log_item_id))
+                result = self._submit(
+                    partial(self._post_log_batch, url, files, item_id),
+                    after=after, priority=priority, size=size,
+                    discard=partial(self._discard_logs, len(entries),
+                                    files[1:]),
+                    reserved=release is not None,
+                    acknowledgements=acknowledgements)
+                release = None
+                for log_item_id in item_ids:
+                    self._pending(log_item_id, result)
+        finally:
+            if release is not None:
+                release()
+        for acknowledgement in acknowledgements:
+            acknowledgement.done()
+        return result
+
+    def _dedup_attachments(self, entries):
+        """Keep one attachment of every content in a batch request.
+
+        The server matches the records to the attachment parts by name, so
+        a record with an already attached content refers to the name of
+        that attachment and its own part is dropped.
+
+        :param entries: list of (log record, attachment field, encoded log
+                        record) tuples
+        :return list:   entries with the repeated attachments removed
+        """
+        names = {}
+        result = []
+        saved = count = 0
+        for log_item, field, encoded in entries:
+            if field:
+                name, data, mime = field[1]
+                key = (content_digest(data, self.upload_chunk_size), mime)
+                if key in names:
+                    saved += data_size(data)
+                    if isinstance(data, TemporaryFilePath):
+                        data.remove()
+                    log_item["file"] = {"name": names[key]}
+                    encoded = self._dumps(log_item)
+                    count += 1
+                    field = None
                 else:
-                    raise
-            break
+                    names[key] = name
+            result.append((log_item, field, encoded))
+        if count:
+            with self._counters_lock:
+                self.attachments_deduplicated += count
+                self.attachment_bytes_saved += saved
+            logger.debug("log_batch - %d repeated attachments, %d bytes not "
+                         "sent", count, saved)
+        return result
+
+    def _post_log_batch(self, url, files, item_id=None):
+        """Send the multipart log batch request.
+
+        :param url:     log endpoint url
+        :param files:   multipart parts of the request
+        :param item_id: id of item, used for debug logging only
+        :return:        json data
+        """
+        body = MultipartEncoder(files, chunk_size=self.upload_chunk_size)
+        headers = {"Content-Type": body.content_type}
+        if self.compression:
+            compressible = sum(data_size(data)
+                               for _, (_, data, mime) in files
+                               if is_compressible(mime))
+            if compressible >= self.compression_threshold:
+                encoder = body
+                try:
+                    body = CompressedBody(encoder, self.compression,
+                                          chunk_size=self.upload_chunk_size)
+                finally:
+                    encoder.close()
+                headers["Content-Encoding"] = self.compression
+
+        def send():
+            body.rewind()
+            return self.session.post(
+                url=url,
+                data=body,
+                headers=headers,
+                verify=self.verify_ssl,
+                timeout=self.timeout
+            )
+
+        started = time.time()
+        r = None
+        try:
+            r = self._send("log_batch", send, idempotent=False)
+        finally:
+            if self.recorder is not None:
+                self._record("log_batch", "post", url, started, r,
+                             body_size(body), files=files)
+            body.close()
 
         logger.debug("log_batch - ID: %s", item_id)
         logger.debug("log_batch response: %s", r.text)
@@ -471,13 +1843,15 @@ class ReportPortalService(object):
                        'cpu': 'AMD',
                        'machine': "Windows10_pc"}
         """
-        try:
-            agent_version = pkg_resources.get_distribution(agent_name)
-            agent = '{0}-{1}'.format(agent_name, agent_version)
-        except pkg_resources.DistributionNotFound:
+        information = _system_information.get(agent_name)
+        if information is None:
+            agent_version = _agent_distribution(agent_name)
             agent = 'not found'
-
-        return {'agent': agent,
-                'os': platform.system(),
-                'cpu': platform.processor(),
-                'machine': platform.machine()}
+            if agent_version is not None:
+                agent = '{0}-{1}'.format(agent_name, agent_version)
+            information = {'agent': agent,
+                           'os': platform.system(),
+                           'cpu': platform.processor(),
+                           'machine': platform.machine()}
+            _system_information[agent_name] = information
+        return dict(information)
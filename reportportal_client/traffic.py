@@ -0,0 +1,438 @@
+"""
+Copyright (c) 2018 http://reportportal.io .
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from functools import partial
+
+import requests
+import six
+from requests.adapters import HTTPAdapter
+
+from .metrics import Metrics, body_size
+from .multipart import FilePath, MultipartEncoder, TemporaryFilePath
+from .scheduler import RequestScheduler
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FORMAT_VERSION = 1
+# calls whose requests create the ids the later requests refer to
+LAUNCH_CALLS = frozenset(["start_launch"])
+ITEM_CALLS = frozenset(["start_test_item"])
+# path and query tokens which may be ids, numbers in the query are not
+_TOKEN = re.compile(r"[^/?&=,]+")
+
+
+def _open(path, mode):
+    """Open a recording, gzip compressed if the path ends with .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _scrub(body):
+    """Replace the log messages of a request body with their length.
+
+    :param body: JSON payload, a dict or a list of log records
+    :return:     payload to record
+    """
+    if isinstance(body, list):
+        return [_scrub(record) for record in body]
+    if isinstance(body, dict) and body.get("message") is not None:
+        body = dict(body)
+        body["message_size"] = len(body.pop("message"))
+    return body
+
+
+def _restore(body):
+    """Make a payload with messages of the recorded length.
+
+    :param body: recorded payload
+    :return:     payload to send
+    """
+    if isinstance(body, list):
+        return [_restore(record) for record in body]
+    if isinstance(body, dict) and "message_size" in body:
+        body = dict(body)
+        body["message"] = "x" * body.pop("message_size")
+    return body
+
+
+def _response_ids(response):
+    """Get the ids a response defines, e.g. of a started item.
+
+    :param response: requests.Response
+    :return list:    ids in the order they appear, as strings
+    """
+    try:
+        data = response.json()
+    except ValueError:
+        return []
+    if not isinstance(data, dict):
+        return []
+    ids = [str(data["id"])] if "id" in data else []
+    for entry in data.get("content") or ():
+        if isinstance(entry, dict) and "id" in entry:
+            ids.append(str(entry["id"]))
+    return ids
+
+
+class TrafficRecorder(object):
+    """Record the requests a service sends to a JSON lines file.
+
+    Every line is a request: the service method it is sent for, the HTTP
+    method, the API version and path, the time since the recording
+    started, the latency, status and body sizes, and the ids the response
+    defines. The payloads are kept with the log messages replaced by their
+    length, attachments by their name, type, size and, for the files sent
+    from a path, the path. A path ending with .gz is compressed.
+    """
+
+    def __init__(self, path):
+        """Init the recorder, the file is overwritten.
+
+        :param path: file to record to
+        """
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._file = _open(path, "wb")
+        self._write({"version": FORMAT_VERSION, "started": self._started})
+
+    def _write(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        self._file.write(line.encode("utf-8") + b"\n")
+
+    def record(self, call, method, api, path, started, response=None,
+               sent=0, body=None, files=None):
+        """Record a request.
+
+        :param call:     name of the service method
+        :param method:   HTTP method
+        :param api:      API version, 'v1' or 'v2'
+        :param path:     url path after the project name, with the query
+        :param started:  time the request was started at
+        :param response: requests.Response, None if the request failed
+        :param sent:     request body size in bytes
+        :param body:     JSON payload
+        :param files:    multipart parts of a log batch request
+        """
+        entry = {"t": round(started - self._started, 6),
+                 "call": call,
+                 "method": method.upper(),
+                 "api": api,
+                 "path": path,
+                 "latency": round(time.time() - started, 6),
+                 "sent": sent}
+        if response is not None:
+            entry["status"] = response.status_code
+            entry["received"] = len(response.content)
+            if call in LAUNCH_CALLS | ITEM_CALLS or entry["method"] == "GET":
+                ids = _response_ids(response)
+                if ids:
+                    entry["ids"] = ids
+        if body is not None:
+            entry["body"] = _scrub(body)
+        if files:
+            entry["body"] = _scrub(json.loads(
+                files[0][1][1].decode("utf-8")))
+            entry["files"] = [self._attachment(field)
+                              for field in files[1:]]
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(entry)
+            self.count += 1
+
+    @staticmethod
+    def _attachment(field):
+        """Describe an attachment part without its content."""
+        name, data, mime = field[1]
+        attachment = {"name": name, "mime": mime, "size": body_size(data)}
+        if isinstance(data, FilePath) and \
+                not isinstance(data, TemporaryFilePath):
+            attachment["path"] = os.path.abspath(data.path)
+        return attachment
+
+    def close(self):
+        """Close the file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_traffic(path):
+    """Read a recording.
+
+    :param path: file written by TrafficRecorder
+    :return:     iterator of the request dicts
+    """
+    with _open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except ValueError:
+                # the tail of a recording written on a crash
+                logger.warning("Skipping a broken line in %s", path)
+                continue
+            if "version" not in entry:
+                yield entry
+
+
+class TrafficReplayer(object):
+    """Send recorded requests to a server to load test it.
+
+    The requests are sent at ``speed`` times the recorded pace, or as fast
+    as possible with speed None, by up to ``concurrency`` threads. The ids
+    of the recorded launches and items are replaced by the ones of the
+    replay. A request is sent after the ones creating the ids it refers
+    to, and an item is updated or finished after the requests referring to
+    it and to its children, so the server sees the same causal order.
+    """
+
+    def __init__(self, endpoint, project, token, speed=1.0,
+                 concurrency=8, verify_ssl=True, timeout=None):
+        """Init the replayer.
+
+        :param endpoint:    Report Portal URL
+        :param project:     project to report to
+        :param token:       API token
+        :param speed:       multiplier of the recorded pace, None for no
+                            waiting
+        :param concurrency: maximum number of requests sent at once
+        :param verify_ssl:  option to verify the SSL certificates
+        :param timeout:     timeout of the requests in seconds
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.project = project
+        self.speed = speed
+        self.concurrency = concurrency
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+        self.metrics = Metrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=concurrency)
+        for scheme in ("https://", "http://"):
+            self.session.mount(scheme, adapter)
+        self.session.headers["Authorization"] = "bearer {0}".format(token)
+        self._ids = {}
+        self._ids_lock = threading.Lock()
+
+    def _substitute(self, value):
+        """Replace the recorded ids in a path or a payload."""
+        if isinstance(value, six.string_types):
+            return self._ids.get(value, value)
+        if isinstance(value, list):
+            return [self._substitute(item) for item in value]
+        if isinstance(value, dict):
+            return dict((key, self._substitute(item))
+                        for key, item in value.items())
+        return value
+
+    def _url(self, entry):
+        """Make the url of a recorded request with the replay ids."""
+        path, mark, query = entry["path"].partition("?")
+        path = _TOKEN.sub(lambda match: self._ids.get(match.group(0),
+                                                      match.group(0)), path)
+        query = _TOKEN.sub(lambda match: match.group(0)
+                           if match.group(0).isdigit() else
+                           self._ids.get(match.group(0), match.group(0)),
+                           query)
+        return "/".join([self.endpoint, "api", entry["api"], self.project,
+                         path]).rstrip("/") + mark + query
+
+    def _request(self, entry):
+        """Send one recorded request and map the ids it defines.
+
+        :param entry: recorded request dict
+        """
+        url = self._url(entry)
+        body = self._substitute(_restore(entry.get("body")))
+        kwargs = {}
+        encoder = None
+        if "files" in entry:
+            files = [("json_request_part",
+                      (None, json.dumps(body).encode("utf-8"),
+                       "application/json"))]
+            for attachment in entry["files"]:
+                path = attachment.get("path")
+                if path and os.path.exists(path):
+                    data = FilePath(path)
+                else:
+                    data = b"\0" * attachment["size"]
+                files.append(("file", (attachment["name"], data,
+                                       attachment["mime"])))
+            encoder = MultipartEncoder(files)
+            kwargs["data"] = encoder
+            kwargs["headers"] = {"Content-Type": encoder.content_type}
+        elif body is not None:
+            kwargs["data"] = json.dumps(body).encode("utf-8")
+            kwargs["headers"] = {"Content-Type": "application/json"}
+        start = time.time()
+        response = None
+        try:
+            response = self.session.request(
+                entry["method"], url, verify=self.verify_ssl,
+                timeout=self.timeout, **kwargs)
+        finally:
+            if encoder is not None:
+                encoder.close()
+            self.metrics.record_request(
+                entry["call"], time.time() - start,
+                bytes_sent=body_size(kwargs.get("data")),
+                bytes_received=0 if response is None else
+                len(response.content),
+                error=response is None or not response.ok)
+        recorded = entry.get("ids") or []
+        if recorded and response is not None and response.ok:
+            with self._ids_lock:
+                for old, new in zip(recorded, _response_ids(response)):
+                    self._ids.setdefault(old, new)
+
+    def replay(self, entries):
+        """Send the recorded requests and wait for them.
+
+        :param entries: iterable of recorded request dicts
+        :return dict:   report with the number of requests, errors,
+                        elapsed seconds, requests per second, bytes sent
+                        and the latency of every service method
+        """
+        scheduler = RequestScheduler(workers=self.concurrency)
+        # tasks creating the recorded ids, the tasks referring to an item
+        # since it was last updated, and the parents of the items
+        creators = {}
+        pending = {}
+        parents = {}
+        launches = set()
+        started = time.time()
+        first = None
+        for entry in entries:
+            if self.speed:
+                if first is None:
+                    first = entry["t"]
+                delay = started + (entry["t"] - first) / self.speed - \
+                    time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            body = entry.get("body")
+            refs = set(_refs(entry["path"], creators))
+            refs.update(value for value in _strings(body)
+                        if value in creators)
+            defined = list(entry.get("ids") or ())
+            if isinstance(body, dict) and body.get("uuid") and \
+                    entry["call"] in LAUNCH_CALLS | ITEM_CALLS:
+                # generated on the client side, mapped right away
+                refs.discard(body["uuid"])
+                self._ids[body["uuid"]] = str(uuid.uuid4())
+                defined.append(body["uuid"])
+            items = refs - launches
+            after = [creators[ref] for ref in refs]
+            if entry["method"] == "PUT":
+                # an item is finished after its logs and children
+                for ref in items:
+                    after.extend(pending.pop(ref, ()))
+            task = scheduler.schedule(
+                partial(self._request, entry), after=after,
+                barrier=entry["call"] == "finish_launch")
+            for ref in items:
+                pending.setdefault(ref, []).append(task)
+                if entry["method"] == "PUT" and parents.get(ref):
+                    pending.setdefault(parents[ref], []).append(task)
+            for old in defined:
+                creators[old] = task
+                if entry["call"] in LAUNCH_CALLS:
+                    launches.add(old)
+                elif entry["call"] in ITEM_CALLS:
+                    parents[old] = next(iter(items), None)
+        scheduler.stop()
+        return self._report(time.time() - started)
+
+    def _report(self, elapsed):
+        stats = self.metrics.snapshot()
+        requests_count = sum(method["requests"] for method in stats.values())
+        return {"requests": requests_count,
+                "errors": sum(method["request_errors"]
+                              for method in stats.values()),
+                "elapsed_s": elapsed,
+                "requests_per_s": requests_count / elapsed if elapsed
+                else None,
+                "bytes_sent": sum(method["bytes_sent"]
+                                  for method in stats.values()),
+                "calls": dict(
+                    (call, {"count": method["requests"],
+                            "errors": method["request_errors"],
+                            "p50_ms": _ms(method["latency"]["p50"]),
+                            "p99_ms": _ms(method["latency"]["p99"])})
+                    for call, method in stats.items())}
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def _refs(path, ids):
+    """Get the recorded ids a path refers to.
+
+    :param path: recorded path with the query
+    :param ids:  known recorded ids
+    :return:     iterator of ids
+    """
+    path, _, query = path.partition("?")
+    for token in _TOKEN.findall(path):
+        if token in ids:
+            yield token
+    for token in _TOKEN.findall(query):
+        if token in ids and not token.isdigit():
+            yield token
+
+
+def _strings(value):
+    """Iterate over the strings of a payload."""
+    if isinstance(value, six.string_types):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            for string in _strings(item):
+                yield string
+    elif isinstance(value, dict):
+        for item in value.values():
+            for string in _strings(item):
+                yield string
+
+
+def replay_traffic(path, endpoint, project, token, **kwargs):
+    """Send a recording to a server.
+
+    :param path:     file written by TrafficRecorder
+    :param endpoint: Report Portal URL
+    :param project:  project to report to
+    :param token:    API token
+    :param kwargs:   other TrafficReplayer arguments
+    :return dict:    report of TrafficReplayer.replay()
+    """
+    replayer = TrafficReplayer(endpoint, project, token, **kwargs)
+    return replayer.replay(read_traffic(path))
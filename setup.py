@@ -6,7 +6,7 @@ __version__ = '5.0.2'
 
 setup(
     name='reportportal-client',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     version=__version__,
     description='Python client for Report Portal v5.',
     author_email='SupportEPMC-TSTReportPortal@epam.com',
@@ -22,5 +22,9 @@ setup(
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8'
     ],
-    install_requires=['requests>=2.4.2', 'six']
+    install_requires=['requests>=2.16', 'six>=1.13'],
+    extras_require={
+        'fast-json': ['orjson; python_version >= "3.6"',
+                      'ujson; python_version < "3.6"']
+    }
 )
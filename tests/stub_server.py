@@ -0,0 +1,236 @@
+"""This module contains an in-process stub of the Report Portal API.
+
+The stub implements the endpoints ReportPortalService calls, so the client
+can be tested and benchmarked over real HTTP without a server. Latency and
+failed responses can be injected.
+"""
+
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+
+def _json_part(body, content_type):
+    """Get the log records from a multipart log batch request.
+
+    :param body:         request body
+    :param content_type: Content-Type header of the request
+    :return list:        log records of the json_request_part
+    """
+    boundary = content_type.split("boundary=", 1)[1].strip('"')
+    for part in body.split(b"--" + boundary.encode("ascii")):
+        headers, _, content = part.partition(b"\r\n\r\n")
+        if b'name="json_request_part"' in headers:
+            return json.loads(content[:-2].decode("utf-8"))
+    return []
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Request handler which answers like Report Portal."""
+
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, do not let them
+    # wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """Count the new connection."""
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        stub = self.server.stub
+        with stub._lock:
+            stub.connection_count += 1
+
+    def log_message(self, format, *args):
+        """Do not print the requests to stderr."""
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _answer(self, status, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            # like real servers, so that the client does not reuse it
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        raw = self._read_body()
+        body = raw
+        server = self.server.stub
+        encoding = self.headers.get("Content-Encoding")
+        if encoding:
+            # gzip has its own header, HTTP deflate is the zlib format
+            body = zlib.decompress(raw, zlib.MAX_WBITS | 16
+                                   if encoding == "gzip" else zlib.MAX_WBITS)
+        url = urlparse(self.path)
+        # /api/<version>/<project>/<resource>/...
+        route = url.path.strip("/").split("/")[3:]
+        status, data = server.dispatch(
+            self.command, route, parse_qs(url.query), body,
+            self.headers.get("Content-Type", ""))
+        server.record(self.command, route, status,
+                      len(self.requestline) + len(str(self.headers)) +
+                      len(raw), encoding)
+        self._answer(status, data)
+
+    do_GET = do_POST = do_PUT = _handle
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class StubServer(object):
+    """Report Portal API stub served from a background thread.
+
+    Use it as a context manager or call start() and stop(). Every request
+    waits ``latency`` seconds before it is answered, and ``error_rate`` of
+    the requests are answered with ``error_status``.
+    """
+
+    def __init__(self, project="project", latency=0.0, error_rate=0.0,
+                 error_status=503, seed=None):
+        """Init the stub.
+
+        :param project:      project name in the API urls
+        :param latency:      delay of every response in seconds
+        :param error_rate:   share of the requests answered with an error
+        :param error_status: status code of the injected errors
+        :param seed:         seed of the error injection
+        """
+        self.project = project
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.connection_count = 0
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_received = 0
+        self.log_count = 0
+        self.compressed_requests = 0
+        self.routes = collections.Counter()
+        self._random = random.Random(seed)
+        self._items = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """Return the base url to pass to ReportPortalService."""
+        host, port = self._server.server_address[:2]
+        return "http://{0}:{1}".format(host, port)
+
+    def start(self):
+        """Start serving on a free local port.
+
+        :return: the stub itself
+        """
+        self._server = _HTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="rp-stub-server")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        """Start the stub."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the stub."""
+        self.stop()
+
+    def record(self, method, route, status, size, encoding=None):
+        """Count a handled request.
+
+        :param method:   HTTP method
+        :param route:    url path parts after the project name
+        :param status:   response status code
+        :param size:     request headers and body size in bytes as sent
+        :param encoding: Content-Encoding of the request body
+        """
+        with self._lock:
+            if encoding:
+                self.compressed_requests += 1
+            self.request_count += 1
+            self.bytes_received += size
+            self.routes[(method, route[0] if route else "")] += 1
+            if status >= 400:
+                self.error_count += 1
+
+    def _item_id(self, item_uuid):
+        with self._lock:
+            return self._items.setdefault(item_uuid, len(self._items) + 1)
+
+    def dispatch(self, method, route, query, body, content_type):
+        """Build the response of a request.
+
+        :param method:       HTTP method
+        :param route:        url path parts after the project name
+        :param query:        parsed query string
+        :param body:         request body
+        :param content_type: Content-Type header of the request
+        :return:             (status code, json data) tuple
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.error_status, {"errorCode": self.error_status,
+                                       "message": "Injected error"}
+        resource = route[0] if route else ""
+        if method == "POST" and resource in ("launch", "item"):
+            data = json.loads(body.decode("utf-8"))
+            item_uuid = data.get("uuid") or str(uuid.uuid4())
+            self._item_id(item_uuid)
+            return 201, {"id": item_uuid}
+        if method == "PUT" and resource in ("launch", "item"):
+            return 200, {"message": "Finished"}
+        if method == "GET" and route[:2] == ["item", "uuid"]:
+            return 200, {"id": self._item_id(route[2]), "uuid": route[2]}
+        if method == "GET" and resource == "item":
+            uuids = query.get("filter.in.uuid", [""])[0].split(",")
+            return 200, {"content": [{"id": self._item_id(item_uuid),
+                                      "uuid": item_uuid}
+                                     for item_uuid in uuids if item_uuid]}
+        if method == "GET" and resource == "settings":
+            return 200, {"project": self.project, "subTypes": {}}
+        if method == "POST" and resource == "log":
+            if content_type.startswith("multipart/"):
+                records = _json_part(body, content_type)
+            else:
+                records = [json.loads(body.decode("utf-8"))]
+            with self._lock:
+                self.log_count += len(records)
+            responses = [{"id": str(uuid.uuid4())} for _ in records]
+            if content_type.startswith("multipart/"):
+                return 201, {"responses": responses}
+            return 201, responses[0]
+        return 404, {"errorCode": 404, "message": "Not found"}
@@ -0,0 +1,73 @@
+"""This modules includes unit tests for the cache.py module."""
+
+from six.moves import mock
+
+from reportportal_client.cache import LRUCache
+from reportportal_client.service import ReportPortalService
+
+
+class TestLRUCache:
+    """This class contains test methods for LRUCache."""
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert 'b' not in cache
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_counters(self):
+        """Test hit and miss counters."""
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        assert cache.stats() == {'hits': 1, 'misses': 1,
+                                 'size': 1, 'maxsize': 1024}
+
+    def test_disabled_cache(self):
+        """Test that a cache of zero size stores nothing."""
+        cache = LRUCache(maxsize=0)
+        cache.put('a', 1)
+        assert cache.get('a') is None
+
+
+class TestServiceItemIdCache:
+    """This class contains test methods for cached item ID lookups."""
+
+    def test_update_uses_cached_id(self):
+        """Test that the item ID is requested once for several updates."""
+        service = ReportPortalService('http://endpoint', 'project', 'token')
+        service.session = mock.Mock()
+        service.session.get.return_value.json.return_value = {'id': 42}
+        service.session.put.return_value.json.return_value = {'message': 'ok'}
+        service.update_test_item('uuid', description='first')
+        service.update_test_item('uuid', description='second')
+        assert service.session.get.call_count == 1
+        assert service.session.put.call_args[1]['url'].endswith(
+            '/item/42/update')
+
+    def test_prefetch_item_ids(self):
+        """Test that many UUIDs are resolved by one list request."""
+        service = ReportPortalService('http://endpoint', 'project', 'token')
+        service.session = mock.Mock()
+        service.session.get.return_value.json.return_value = {
+            'content': [{'id': 1, 'uuid': 'a'}, {'id': 2, 'uuid': 'b'}]}
+        assert service.prefetch_item_ids(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+        params = service.session.get.call_args[1]['params']
+        assert params['filter.in.uuid'] == 'a,b,c'
+        assert service.get_item_id_by_uuid('b') == 2
+        assert service.session.get.call_count == 1
+
+    def test_cache_is_cleared_on_launch_start(self):
+        """Test that the cache is scoped to the current launch."""
+        service = ReportPortalService('http://endpoint', 'project', 'token')
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 'l'}
+        service.item_id_cache.put('a', 1)
+        service.start_launch('launch', 'time')
+        assert len(service.item_id_cache) == 0
@@ -0,0 +1,105 @@
+"""This modules includes unit tests for the compression.py module."""
+
+import io
+import os
+import zlib
+
+import pytest
+
+from reportportal_client.compression import (
+    CompressedBody,
+    compress,
+    is_compressible
+)
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+TEXT = b'Traceback (most recent call last):\n  File "test.py", line 1\n' * 200
+
+
+def _decompress(data, encoding):
+    """Decompress a body like a server does.
+
+    :param data:     compressed bytes
+    :param encoding: gzip or deflate
+    :return:         original bytes
+    """
+    return zlib.decompress(data, zlib.MAX_WBITS | 16
+                           if encoding == 'gzip' else zlib.MAX_WBITS)
+
+
+class TestCompression:
+    """This class contains test methods for the compression helpers."""
+
+    def test_is_compressible(self):
+        """Test that text-like types are compressible, media is not."""
+        assert is_compressible('text/plain')
+        assert is_compressible('application/json; charset=utf-8')
+        assert is_compressible('application/har+json')
+        assert not is_compressible('image/png')
+        assert not is_compressible('application/octet-stream')
+        assert not is_compressible(None)
+
+    @pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+    def test_round_trip(self, encoding):
+        """Test that compressed bodies decompress to the original.
+
+        :param encoding: content encoding
+        """
+        compressed = compress(TEXT, encoding)
+        assert len(compressed) < len(TEXT) / 5
+        assert _decompress(compressed, encoding) == TEXT
+
+    def test_unknown_encoding(self):
+        """Test that an unknown encoding is rejected."""
+        with pytest.raises(ValueError):
+            compress(TEXT, 'br')
+
+    def test_compressed_body_spooled(self):
+        """Test that a big body is spooled and can be read again."""
+        data = os.urandom(50000) + TEXT
+        body = CompressedBody(io.BytesIO(data), 'gzip', chunk_size=1000,
+                              spool_size=100)
+        compressed = body.read()
+        assert len(body) == len(compressed)
+        assert _decompress(compressed, 'gzip') == data
+
+        body.rewind()
+        assert b''.join(body) == compressed
+        body.close()
+
+
+class TestServiceCompression:
+    """This class contains tests of compressed requests to a server."""
+
+    @pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+    def test_bodies_round_trip(self, encoding):
+        """Test that the server reads the compressed requests.
+
+        :param encoding: content encoding
+        """
+        with StubServer() as stub:
+            service = ReportPortalService(
+                stub.endpoint, stub.project, 'token', compression=encoding,
+                compression_threshold=1000)
+            service.start_launch(name='launch', start_time='1')
+            item_id = service.start_test_item(
+                name='item', start_time='1', item_type='STEP',
+                description='x' * 2000)
+            service.log_batch([
+                {'time': '1', 'message': 'trace',
+                 'attachment': {'name': 'trace.txt', 'data': TEXT,
+                                'mime': 'text/plain'}},
+                {'time': '1', 'message': 'text'},
+            ], item_id=item_id)
+            service.log_batch([
+                {'time': '1', 'message': 'screenshot',
+                 'attachment': {'name': 'a.png', 'data': os.urandom(5000),
+                                'mime': 'image/png'}},
+            ], item_id=item_id)
+
+        # the item start and the text batch are compressed
+        assert stub.compressed_requests == 2
+        assert stub.log_count == 3
+        assert stub.error_count == 0
+        assert stub.bytes_received < len(TEXT) + 10000
@@ -0,0 +1,156 @@
+"""This modules includes unit tests for the coordinator.py module."""
+
+import multiprocessing
+import os
+import time
+
+import pytest
+from six.moves import mock
+
+from reportportal_client.coordinator import (
+    CoordinatorClient,
+    LaunchCoordinator
+)
+from reportportal_client.journal import Journal
+from reportportal_client.service import ReportPortalService
+
+
+def _report(address, authkey, results):
+    """Report a test item from a worker process.
+
+    :param address: coordinator address
+    :param authkey: coordinator authentication key
+    :param results: queue to put the results to
+    """
+    client = CoordinatorClient(address, authkey)
+    item_id = client.start_test_item('test', 'time', 'STEP')
+    client.log('time', 'message', 'INFO', item_id=item_id,
+               attachment={'name': 'a', 'data': b'data'})
+    client.finish_test_item(item_id, 'time', 'PASSED')
+    results.put((item_id, client.launch_id,
+                 client.get_item_id_by_uuid(item_id)))
+    client.terminate()
+
+
+def _wait_for(condition, timeout=5):
+    """Wait until the condition is true.
+
+    :param condition: callable without arguments
+    :param timeout:   maximum time to wait in seconds
+    :return:          the last value returned by the condition
+    """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestLaunchCoordinator:
+    """This class contains test methods for LaunchCoordinator."""
+
+    def test_worker_calls_reach_service(self):
+        """Test that calls of worker processes are made by the service."""
+        service = mock.Mock(launch_id='launch')
+        service.get_item_id_by_uuid.return_value = 42
+        coordinator = LaunchCoordinator(service)
+        results = multiprocessing.Queue()
+        args = (coordinator.address, coordinator.authkey, results)
+        workers = [multiprocessing.Process(target=_report, args=args)
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        reported = [results.get(timeout=10) for _ in workers]
+        for worker in workers:
+            worker.join(10)
+        assert _wait_for(lambda: service.finish_test_item.call_count == 2)
+        coordinator.close()
+
+        for item_id, launch_id, numeric_id in reported:
+            assert launch_id == 'launch'
+            assert numeric_id == 42
+            service.finish_test_item.assert_any_call(
+                item_id, 'time', 'PASSED', issue=None, attributes=None)
+        started = [call[1]['uuid'] for call
+                   in service.start_test_item.call_args_list]
+        assert sorted(started) == sorted(item[0] for item in reported)
+        assert service.log.call_args_list[0][1]['attachment'] == \
+            {'name': 'a', 'data': b'data'}
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'),
+                        reason='listens to a TCP port without fork')
+    def test_socket_directory_removed(self):
+        """Test that the directory of the Unix socket is removed on close."""
+        coordinator = LaunchCoordinator(mock.Mock())
+        directory = os.path.dirname(coordinator.address)
+        assert os.path.isdir(directory)
+        coordinator.close()
+        assert not os.path.exists(directory)
+
+
+class TestCoordinatorClient:
+    """This class contains test methods for CoordinatorClient."""
+
+    def test_service_signatures(self):
+        """Test that positional arguments are passed as to the service."""
+        client = CoordinatorClient('address', b'key')
+        with mock.patch.object(client, '_send') as send:
+            item_id = client.start_test_item('test', 'time', 'STEP',
+                                             'description')
+            client.finish_test_item(item_id, 'time', 'FAILED', 'issue')
+
+        service = mock.create_autospec(ReportPortalService, instance=True)
+        for call in send.call_args_list:
+            name, args = call[0][0], call[0][1:]
+            getattr(service, name)(*args, **call[1])
+        service.start_test_item.assert_called_once_with(
+            'test', 'time', 'STEP', description='description',
+            attributes=None, parameters=None, parent_item_id=None,
+            has_stats=True, uuid=item_id)
+        service.finish_test_item.assert_called_once_with(
+            item_id, 'time', 'FAILED', issue='issue', attributes=None)
+
+
+class TestServiceFork:
+    """This class contains test methods for the service in forked children."""
+
+    def test_after_fork_resets_connections_and_threads(self):
+        """Test that a child process gets a new session and queues."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True, log_batch_size=5)
+        session = service.session
+        scheduler = service._scheduler
+        batcher = service._log_batcher
+        service._after_fork()
+        assert service.session is not session
+        assert service.session.headers['Authorization'] == 'bearer token'
+        assert service._scheduler is not scheduler
+        assert service._scheduler.workers == scheduler.workers
+        assert service._log_batcher is not batcher
+        service.terminate()
+
+    def test_after_fork_detaches_journal_and_resets_locks(self, tmpdir):
+        """Test that a child leaves the journal and locks to the parent.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = str(tmpdir.join('journal'))
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      journal=path)
+        service.items.start('item')
+        # held by threads of the parent process at the fork
+        locks = [service.items._lock, service._counters_lock,
+                 service._terminate_lock]
+        for lock in locks:
+            lock.acquire()
+        service._after_fork()
+        assert service._journal is None
+        assert 'item' not in service.items
+        assert not any(lock is new for lock, new in zip(locks, [
+            service.items._lock, service._counters_lock,
+            service._terminate_lock]))
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 1}
+        service.start_launch(name='launch', start_time='1', uuid='launch')
+        service.terminate(timeout=0)
+        assert not Journal(path).complete
+        assert list(Journal(path)) == []
@@ -0,0 +1,173 @@
+"""This modules includes unit tests for the items.py module."""
+
+import threading
+
+import pytest
+
+from reportportal_client.items import ItemTree
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+@pytest.fixture
+def tree():
+    """Prepare a tree of a suite with two tests, one with a step."""
+    tree = ItemTree()
+    tree.start('suite', name='suite', start_time='1')
+    tree.start('test1', 'suite')
+    tree.start('test2', 'suite')
+    tree.start('step', 'test1')
+    return tree
+
+
+class TestItemTree:
+    """This class contains test methods for ItemTree."""
+
+    def test_queries(self, tree):
+        """Test the open items count, children and depth.
+
+        :param tree: Pytest fixture
+        """
+        assert tree.open_count == 4
+        assert 'step' in tree
+        assert tree.children() == ['suite']
+        assert sorted(tree.children('suite')) == ['test1', 'test2']
+        assert tree.depth() == 3
+        assert tree.depth('step') == 3
+        assert tree.depth('unknown') == 0
+        assert tree.get('suite') == {'name': 'suite', 'start_time': '1',
+                                     'parent': None,
+                                     'children': ['test1', 'test2']}
+
+    def test_finish(self, tree):
+        """Test that finished items leave the tree.
+
+        :param tree: Pytest fixture
+        """
+        assert tree.finish('step') == 'test1'
+        assert tree.get('test1')['children'] == []
+        assert tree.finish('unknown') is None
+        # the children of a finished item become roots
+        assert tree.finish('suite') is None
+        assert sorted(tree.children()) == ['test1', 'test2']
+        assert tree.depth() == 1
+        tree.clear()
+        assert len(tree) == 0
+
+    def test_bottom_up(self, tree):
+        """Test that every item is listed after its children.
+
+        :param tree: Pytest fixture
+        """
+        order = tree.bottom_up()
+        ids = [item_id for item_id, _ in order]
+        assert sorted(ids) == ['step', 'suite', 'test1', 'test2']
+        assert ids.index('step') < ids.index('test1') < ids.index('suite')
+        assert ids.index('test2') < ids.index('suite')
+        assert dict(order)['test1'] == ['step']
+        assert [item_id for item_id, _ in tree.bottom_up('test1')] == \
+            ['step']
+        assert tree.bottom_up('unknown') == []
+
+    def test_deep_tree(self):
+        """Test that a deep tree does not hit the recursion limit."""
+        tree = ItemTree()
+        parent = None
+        for i in range(5000):
+            tree.start(i, parent)
+            parent = i
+        assert tree.depth() == 5000
+        assert tree.bottom_up()[0][0] == 4999
+
+
+def _record_finishes(service):
+    """Record the ids of the items finished by the service requests.
+
+    :param service: ReportPortalService
+    :return list:   finished item ids, in the order they are sent
+    """
+    finished = []
+    lock = threading.Lock()
+    put = service.session.put
+
+    def recording_put(url, **kwargs):
+        with lock:
+            finished.append(url.rsplit('/', 1)[-1])
+        return put(url, **kwargs)
+
+    service.session.put = recording_put
+    return finished
+
+
+class TestServiceItems:
+    """This class contains tests of the ReportPortalService open items."""
+
+    def _start_items(self, service):
+        """Start a suite with 5 tests of 2 steps, finish one step.
+
+        :param service: ReportPortalService
+        :return dict:   item id to its parent id
+        """
+        service.start_launch(name='launch', start_time='1')
+        suite = service.start_test_item(name='suite', start_time='1',
+                                        item_type='SUITE')
+        parents = {suite: None}
+        for _ in range(5):
+            test = service.start_test_item(name='test', start_time='1',
+                                           item_type='TEST',
+                                           parent_item_id=suite)
+            parents[test] = suite
+            for _ in range(2):
+                step = service.start_test_item(name='step', start_time='1',
+                                               item_type='STEP',
+                                               parent_item_id=test)
+                parents[step] = test
+        service.finish_test_item(item_id=step, end_time='2',
+                                 status='PASSED')
+        del parents[step]
+        return parents
+
+    @pytest.mark.parametrize('async_requests', [False, True])
+    def test_finish_launch(self, async_requests):
+        """Test that the open items are finished before the launch.
+
+        :param async_requests: whether to test the async mode
+        """
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token',
+                                          async_requests=async_requests,
+                                          async_workers=4)
+            parents = self._start_items(service)
+            service.flush()
+            finished = _record_finishes(service)
+            assert service.items.open_count == 15
+            assert service.items.depth() == 3
+            service.finish_launch(end_time='3')
+            service.terminate()
+
+        assert service.items.open_count == 0
+        assert finished[-1] == 'finish'
+        order = finished[:-1]
+        assert sorted(order) == sorted(parents)
+        for item_id, parent in parents.items():
+            if parent is not None:
+                assert order.index(item_id) < order.index(parent)
+        assert stub.error_count == 0
+
+    def test_finish_descendants(self):
+        """Test finishing the open descendants of one item."""
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', auto_finish_items=False)
+            parents = self._start_items(service)
+            test = next(item_id for item_id, parent in parents.items()
+                        if parent is not None and
+                        service.items.children(item_id))
+            assert service.finish_open_items('2', item_id=test) == 2
+            assert service.items.children(test) == []
+            service.finish_launch(end_time='3')
+
+        assert service.items.open_count == 0
+        # the launch finish does not finish the items left open
+        assert stub.routes[('PUT', 'item')] == 3
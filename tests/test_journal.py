@@ -0,0 +1,239 @@
+"""This modules includes unit tests for the journal.py module."""
+
+import io
+
+import pytest
+from six.moves import mock
+
+from reportportal_client.__main__ import main
+from reportportal_client.journal import Journal, replay
+from reportportal_client.multipart import FilePath
+from reportportal_client.scheduler import DROP_OLDEST
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+def _read(data):
+    """Read the content of a FilePath attachment.
+
+    :param data: FilePath object
+    :return:     file content
+    """
+    with open(data.path, 'rb') as f:
+        return f.read()
+
+
+class TestJournal:
+    """This class contains test methods for Journal."""
+
+    def test_round_trip(self, tmpdir):
+        """Test that calls are read back in the written order.
+
+        :param tmpdir: Pytest fixture
+        """
+        journal = Journal(str(tmpdir))
+        journal.append('start_launch', {'name': 'launch', 'uuid': 'l'})
+        journal.append('log', {'message': 'm', 'attachment': {
+            'name': 'a.txt', 'data': io.BytesIO(b'file'), 'mime': 'text/x'}})
+        journal.append('log_batch', {'log_data': [
+            {'message': 'b', 'attachment': u'text'}]})
+        journal.close()
+
+        events = list(Journal(str(tmpdir)))
+        assert [call for call, _ in events] == \
+            ['start_launch', 'log', 'log_batch']
+        assert events[0][1] == {'name': 'launch', 'uuid': 'l'}
+        attachment = events[1][1]['attachment']
+        assert attachment['name'] == 'a.txt'
+        assert attachment['mime'] == 'text/x'
+        assert isinstance(attachment['data'], FilePath)
+        assert _read(attachment['data']) == b'file'
+        record = events[2][1]['log_data'][0]
+        assert _read(record['attachment']['data']) == b'text'
+
+    def test_segments_rotate(self, tmpdir):
+        """Test that a new segment is started over the segment size.
+
+        :param tmpdir: Pytest fixture
+        """
+        journal = Journal(str(tmpdir), segment_size=10)
+        for i in range(3):
+            journal.append('log', {'message': str(i)})
+        journal.close()
+        assert len(journal.segments()) == 3
+        assert [args['message'] for _, args in journal] == ['0', '1', '2']
+
+    def test_broken_tail_is_skipped(self, tmpdir):
+        """Test that a partially written last line is ignored.
+
+        :param tmpdir: Pytest fixture
+        """
+        journal = Journal(str(tmpdir))
+        journal.append('log', {'message': 'ok'})
+        journal.close()
+        with open(journal.segments()[-1], 'ab') as f:
+            f.write(b'{"call": "lo')
+        assert [args['message'] for _, args in journal] == ['ok']
+
+    def test_acknowledged(self, tmpdir):
+        """Test that the acknowledged entries are read back.
+
+        :param tmpdir: Pytest fixture
+        """
+        journal = Journal(str(tmpdir))
+        positions = [journal.append('log', {'message': str(i)})
+                     for i in range(3)]
+        journal.acknowledge(positions[1])
+        journal.close()
+        assert journal.acknowledged() == set([positions[1]])
+        assert [position for position, _, _ in journal.entries()] == \
+            positions
+
+
+class TestServiceJournal:
+    """This class contains test methods for the journaling service mode."""
+
+    def _report(self, service):
+        """Report a small launch with the given service.
+
+        :param service: ReportPortalService instance
+        :return:        UUID of the started item
+        """
+        service.start_launch('launch', 'time')
+        item_id = service.start_test_item('item', 'time', 'STEP',
+                                          attributes={'k': 'v'})
+        service.log('time', 'message', 'INFO', item_id=item_id,
+                    attachment={'name': 'a', 'data': b'data'})
+        service.finish_test_item(item_id, 'time', 'PASSED')
+        service.finish_launch('time')
+        service.terminate()
+        return item_id
+
+    def test_journal_only_and_replay(self, tmpdir):
+        """Test that journaled calls are not sent and replay sends them.
+
+        :param tmpdir: Pytest fixture
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      journal=str(tmpdir), journal_only=True)
+        service.session = mock.Mock()
+        item_id = self._report(service)
+        assert not service.session.method_calls
+        assert not Journal(str(tmpdir)).complete
+
+        target = mock.Mock()
+        assert replay(str(tmpdir), target) == 5
+        call = target.start_test_item.call_args[1]
+        assert call['uuid'] == item_id
+        assert call['attributes'] == {'k': 'v'}
+        target.finish_test_item.assert_called_once_with(
+            item_id=item_id, end_time='time', status='PASSED', issue=None,
+            attributes=None)
+
+    def test_sent_journal_is_complete(self, tmpdir):
+        """Test that a journal sent without errors is marked complete.
+
+        :param tmpdir: Pytest fixture
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      journal=str(tmpdir))
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 'x'}
+        service.session.put.return_value.json.return_value = {'message': 'x'}
+        self._report(service)
+        assert service.session.put.call_count == 2
+        assert Journal(str(tmpdir)).complete
+
+    @pytest.mark.parametrize('log_batch_size', [None, 10])
+    def test_replay_resumes(self, tmpdir, log_batch_size):
+        """Test that a replay sends the calls which were not sent only.
+
+        :param tmpdir:         Pytest fixture
+        :param log_batch_size: log batching option of the service
+        """
+        with StubServer(error_status=400) as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', journal=str(tmpdir),
+                                          log_batch_size=log_batch_size)
+            service.start_launch('launch', 'time')
+            item_id = service.start_test_item('item', 'time', 'STEP')
+            service.log('time', 'message', 'INFO', item_id=item_id)
+            service.start_test_item('failed', 'time', 'STEP',
+                                    parent_item_id=item_id)
+            service.flush()
+            # the server fails after the first calls
+            stub.error_rate = 1.0
+            service.finish_test_item(item_id, 'time', 'PASSED')
+            service.finish_launch('time')
+            service.terminate()
+            # the item, its open child and the launch finish
+            assert service.failed_requests == 3
+            assert len(Journal(str(tmpdir)).acknowledged()) == 4
+
+            stub.error_rate = 0.0
+            target = ReportPortalService(stub.endpoint, stub.project,
+                                         'token', async_requests=True)
+            assert replay(str(tmpdir), target) == 3
+            target.terminate()
+            assert target.failed_requests == 0
+            assert replay(str(tmpdir), target) == 0
+
+        assert stub.routes[('POST', 'launch')] == 1
+        assert stub.routes[('POST', 'item')] == 2
+        assert stub.log_count == 1
+        # failed once, then replayed
+        assert stub.routes[('PUT', 'item')] == 4
+        assert len(Journal(str(tmpdir)).acknowledged()) == 7
+
+    def test_dropped_log_not_acknowledged(self, tmpdir):
+        """Test that a log dropped from the batch buffer is replayed.
+
+        :param tmpdir: Pytest fixture
+        """
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', journal=str(tmpdir),
+                                          log_batch_size=10,
+                                          max_queued_log_bytes=10,
+                                          log_overflow_policy=DROP_OLDEST)
+            service._dumps = mock.Mock(wraps=service._dumps)
+            service.start_launch('launch', 'time')
+            for message in ('dropped!', 'buffered'):
+                service.log('time', message, 'INFO')
+            service.finish_launch('time')
+            service.terminate()
+
+        assert service.dropped_logs == 1
+        assert stub.log_count == 1
+        # the journal entry of a record is not sent with it
+        assert [call[0][0]['message'] for call
+                in service._dumps.call_args_list
+                if 'message' in call[0][0]] == ['buffered']
+        assert not any(key.startswith('_') for call
+                       in service._dumps.call_args_list
+                       for key in call[0][0])
+        target = mock.Mock()
+        assert replay(str(tmpdir), target) == 1
+        assert target.log.call_args_list == [mock.call(
+            time='time', message='dropped!', level='INFO', attachment=None,
+            item_id=None)]
+
+    @mock.patch('reportportal_client.__main__.ReportPortalService')
+    def test_replay_command(self, service_class, tmpdir):
+        """Test the replay command line.
+
+        :param service_class: Mocked ReportPortalService class
+        :param tmpdir:        Pytest fixture
+        """
+        service_class.return_value.failed_requests = 0
+        journal = Journal(str(tmpdir))
+        journal.append('start_launch', {'name': 'launch', 'uuid': 'l'})
+        journal.close()
+        argv = ['replay', str(tmpdir), '--endpoint', 'http://endpoint',
+                '--project', 'project', '--token', 'token', '--workers', '4']
+        assert main(argv) == 0
+        service = service_class.return_value
+        service.start_launch.assert_called_once_with(name='launch', uuid='l')
+        assert service_class.call_args[1]['async_workers'] == 4
+        assert journal.complete
+        assert main(argv) == 1
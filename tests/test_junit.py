@@ -0,0 +1,128 @@
+"""This modules includes unit tests for the junit.py module."""
+
+import io
+
+from six.moves import mock
+
+from reportportal_client.__main__ import main
+from reportportal_client.junit import JUnitImporter, import_junit
+from tests.stub_server import StubServer
+
+REPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="outer" time="3">
+    <properties><property name="os" value="linux"/></properties>
+    <testcase classname="pkg.Test" name="passes" time="1.5">
+      <system-out>output</system-out>
+    </testcase>
+    <testsuite name="inner">
+      <testcase classname="pkg.Inner" name="fails" time="0.25">
+        <failure type="AssertionError" message="1 != 2">trace</failure>
+        <system-err>warning</system-err>
+      </testcase>
+      <testcase name="skips"><skipped message="not today"/></testcase>
+    </testsuite>
+    <system-out>suite output</system-out>
+  </testsuite>
+</testsuites>
+"""
+
+
+def _service():
+    """Create a mock service returning numbered item IDs."""
+    service = mock.Mock()
+    service.start_test_item.side_effect = [
+        'item{0}'.format(i) for i in range(10)]
+    return service
+
+
+class TestJUnitImporter:
+    """This class contains test methods for the JUnit XML importer."""
+
+    def test_items(self):
+        """Test that suites and test cases are reported as items."""
+        service = _service()
+        importer = JUnitImporter(service)
+        importer.clock = 1000
+        importer.import_file(io.BytesIO(REPORT))
+
+        starts = [call[1] for call in service.start_test_item.call_args_list]
+        assert [(c['name'], c['item_type'], c['parent_item_id'],
+                 c['start_time']) for c in starts] == [
+            ('outer', 'SUITE', None, '1000'),
+            ('passes', 'STEP', 'item0', '1000'),
+            ('inner', 'SUITE', 'item0', '2500'),
+            ('fails', 'STEP', 'item2', '2500'),
+            ('skips', 'STEP', 'item2', '2750')]
+        assert starts[1]['attributes'] == {'classname': 'pkg.Test'}
+
+        finishes = [(c[1]['item_id'], c[1]['end_time'], c[1]['status'])
+                    for c in service.finish_test_item.call_args_list]
+        assert finishes == [('item1', '2500', 'PASSED'),
+                            ('item3', '2750', 'FAILED'),
+                            ('item4', '2750', 'SKIPPED'),
+                            ('item2', '2750', None),
+                            ('item0', '4000', None)]
+        assert importer.clock == 4000
+        assert importer.counts == {'suites': 2, 'tests': 3, 'failed': 1,
+                                   'skipped': 1}
+
+    def test_logs(self):
+        """Test that failures and outputs are reported as logs."""
+        service = _service()
+        JUnitImporter(service).import_file(io.BytesIO(REPORT))
+        logs = [(c[1]['item_id'], c[1]['level'], c[1]['message'])
+                for c in service.log.call_args_list]
+        assert logs == [('item1', 'INFO', 'output'),
+                        ('item3', 'ERROR', 'AssertionError: 1 != 2\n\ntrace'),
+                        ('item3', 'WARN', 'warning'),
+                        ('item4', 'INFO', 'not today'),
+                        ('item0', 'INFO', 'suite output')]
+
+    def test_backpressure(self):
+        """Test that the importer limits the queue after every test."""
+        service = _service()
+        JUnitImporter(service, max_pending=5).import_file(io.BytesIO(REPORT))
+        assert service.wait_queue.call_args_list == [mock.call(5)] * 3
+
+    def test_bare_suite(self, tmpdir):
+        """Test that a file with a single namespaced suite is imported.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = tmpdir.join('report.xml')
+        path.write('<testsuite xmlns="urn:x"><testcase name="t"/>'
+                   '</testsuite>')
+        service = _service()
+        counts = import_junit([str(path)], service, launch_name='junit')
+        assert counts['tests'] == 1
+        assert service.start_test_item.call_args_list[0][1]['name'] == \
+            'report.xml'
+        assert service.start_launch.call_args[1]['name'] == 'junit'
+        service.finish_launch.assert_called_once()
+
+
+class TestImportJUnitCommand:
+    """This class contains tests of the import-junit command."""
+
+    def test_upload(self, tmpdir, capsys):
+        """Test that the command uploads a report to a server.
+
+        :param tmpdir: Pytest fixture
+        :param capsys: Pytest fixture
+        """
+        path = tmpdir.join('report.xml')
+        path.write_binary(REPORT)
+        with StubServer() as stub:
+            code = main(['import-junit', str(path), '--endpoint',
+                         stub.endpoint, '--project', stub.project,
+                         '--token', 'token', '--attribute', 'ci:yes',
+                         '--workers', '4'])
+
+        assert code == 0
+        assert 'Imported 3 tests (1 failed, 1 skipped) in 2 suites' in \
+            capsys.readouterr().out
+        assert stub.routes[('POST', 'launch')] == 1
+        assert stub.routes[('POST', 'item')] == 5
+        assert stub.log_count == 5
+        assert stub.error_count == 0
@@ -0,0 +1,198 @@
+"""This modules includes unit tests for the limiter.py module."""
+
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+from requests.exceptions import ReadTimeout
+from six.moves import mock
+
+from reportportal_client.limiter import AdaptiveLimiter
+from reportportal_client.retry import RetryPolicy
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+class _Clock(object):
+    """Manually advanced time."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdaptiveLimiter:
+    """This class contains test methods for AdaptiveLimiter."""
+
+    def test_concurrency_grows_when_reached(self):
+        """Test that the limit grows by one per round of fast requests."""
+        limiter = AdaptiveLimiter(initial_concurrency=2, clock=_Clock())
+        for _ in range(2):
+            # only one request at a time does not need a higher limit
+            limiter.release(limiter.acquire(), 0.01)
+        assert limiter.snapshot()['concurrency_limit'] == 2
+
+        for _ in range(3):
+            started = [limiter.acquire(), limiter.acquire()]
+            limiter.release(started[0], 0.01)
+            limiter.release(started[1], 0.01)
+        assert limiter.snapshot()['concurrency_limit'] == 3
+
+    def test_overload_cuts_once_per_round(self):
+        """Test that overload responses cut the limits once per round."""
+        clock = _Clock()
+        limiter = AdaptiveLimiter(initial_concurrency=8, min_rate=2,
+                                  clock=clock)
+        started = [limiter.acquire() for _ in range(4)]
+        clock.now += 0.1
+        for start in started:
+            limiter.release(start, 0.1, status=429)
+
+        snapshot = limiter.snapshot()
+        assert snapshot['concurrency_limit'] == 4
+        assert snapshot['overloads'] == 1
+        # 4 requests of 0.1 s in flight were sending 40 requests per second
+        assert snapshot['rate_limit'] == 20.0
+
+        clock.now += 1
+        limiter.release(limiter.acquire(), 0.1, status=503)
+        assert limiter.snapshot()['concurrency_limit'] == 2
+        assert limiter.snapshot()['rate_limit'] == 10.0
+
+    def test_timeout_is_overload(self):
+        """Test that a timed out request cuts the limits."""
+        limiter = AdaptiveLimiter(initial_concurrency=4, clock=_Clock())
+        limiter.release(limiter.acquire(), 30, error=ReadTimeout())
+        assert limiter.snapshot()['concurrency_limit'] == 2
+        assert limiter.snapshot()['rate_limit'] is not None
+
+    def test_latency_growth_cuts_concurrency(self):
+        """Test that a rising latency cuts only the concurrency limit."""
+        clock = _Clock()
+        limiter = AdaptiveLimiter(initial_concurrency=8, clock=clock)
+        for latency in (0.1, 0.1, 1, 1, 1):
+            clock.now += 1
+            limiter.release(limiter.acquire(), latency, kind='log')
+        # another kind of request is compared with its own latency
+        limiter.release(limiter.acquire(), 0.5, kind='start_test_item')
+
+        snapshot = limiter.snapshot()
+        assert snapshot['concurrency_limit'] == 4
+        assert snapshot['rate_limit'] is None
+        assert snapshot['latency']['log']['base'] < 0.15
+        assert snapshot['latency']['start_test_item']['value'] == 0.5
+
+    def test_uploads_do_not_cut_concurrency(self):
+        """Test that slow large uploads are not taken for an overload."""
+        clock = _Clock()
+        limiter = AdaptiveLimiter(initial_concurrency=16, clock=clock)
+        for latency in (0.1, 0.1):
+            clock.now += 1
+            limiter.release(limiter.acquire(), latency, kind='log_batch',
+                            size=1000)
+        for latency in (4, 5, 8, 8, 8):
+            clock.now += 1
+            limiter.release(limiter.acquire(), latency, kind='log_batch',
+                            size=5 * 1024 * 1024 + latency)
+
+        snapshot = limiter.snapshot()
+        assert snapshot['concurrency_limit'] == 16
+        assert snapshot['latency']['log_batch']['value'] < 0.15
+        assert snapshot['latency']['log_batch/4194304']['value'] > 4
+        # an overload response of an upload still cuts the limits
+        limiter.release(limiter.acquire(), 8, kind='log_batch',
+                        size=5 * 1024 * 1024, status=503)
+        assert limiter.snapshot()['concurrency_limit'] == 8
+
+    def test_concurrency_enforced(self):
+        """Test that no more requests than the limit are in flight."""
+        limiter = AdaptiveLimiter(initial_concurrency=2, max_concurrency=2)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def request():
+            started = limiter.acquire()
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+            limiter.release(started, 0.01)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+    def test_rate_enforced(self):
+        """Test that requests are spaced by the rate limit."""
+        limiter = AdaptiveLimiter(max_rate=50)
+        start = time.time()
+        for _ in range(11):
+            limiter.release(limiter.acquire(), 0.001)
+        assert time.time() - start >= 0.15
+
+
+class TestServiceLimiter:
+    """This class contains tests of the ReportPortalService limiter."""
+
+    def test_overloaded_server(self):
+        """Test that server overload responses set a rate limit."""
+        with StubServer(error_rate=0.5, error_status=429, seed=1) as stub:
+            service = ReportPortalService(
+                stub.endpoint, stub.project, 'token',
+                limiter=AdaptiveLimiter(min_rate=1000),
+                retry_policy=RetryPolicy(max_attempts=10,
+                                         sleep=lambda delay: None))
+            service.start_launch(name='launch', start_time='1')
+            for _ in range(5):
+                service.start_test_item(name='item', start_time='1',
+                                        item_type='STEP')
+
+        assert stub.error_count > 0
+        assert service.limits['overloads'] > 0
+        assert service.limits['rate_limit'] >= 1000
+        assert service.limits['in_flight'] == 0
+
+    def test_disabled(self):
+        """Test that the limiter can be turned off."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      limiter=False)
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 1}
+        service.start_launch(name='launch', start_time='1')
+        assert service.limits is None
+
+    @pytest.mark.skipif(not hasattr(os, 'register_at_fork'),
+                        reason='the service is reset at fork on Python 3.7+')
+    def test_fork_with_requests_in_flight(self):
+        """Test that a forked child does not wait for the parent requests."""
+        with StubServer(latency=1.0) as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token')
+            threads = [threading.Thread(target=service.get_project_settings)
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            deadline = time.time() + 5
+            while service.limiter.in_flight < 8 and time.time() < deadline:
+                time.sleep(0.01)
+            assert service.limiter.in_flight == 8
+            child = multiprocessing.get_context('fork').Process(
+                target=service.get_project_settings)
+            child.start()
+            child.join(5)
+            for thread in threads:
+                thread.join()
+
+        if child.exitcode is None:
+            child.terminate()
+        assert child.exitcode == 0
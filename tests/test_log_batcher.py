@@ -0,0 +1,200 @@
+"""This modules includes unit tests for the log_batcher.py module."""
+
+import io
+import threading
+
+import pytest
+from six.moves import mock
+
+from reportportal_client.log_batcher import LogBatcher
+from reportportal_client.multipart import TemporaryFilePath
+from reportportal_client.scheduler import DROP_OLDEST
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+class TestLogBatcher:
+    """This class contains test methods for LogBatcher."""
+
+    def test_flush_on_batch_size(self):
+        """Test that a full batch is sent by the background thread."""
+        sent = threading.Event()
+        batches = []
+
+        def send(batch):
+            batches.append(batch)
+            sent.set()
+
+        batcher = LogBatcher(send, batch_size=2, flush_interval=60)
+        batcher.append({"message": "first"})
+        batcher.append({"message": "second"})
+        assert sent.wait(5)
+        assert batches == [[{"message": "first"}, {"message": "second"}]]
+        batcher.stop()
+
+    def test_flush_on_payload_size(self):
+        """Test that a batch is sent once its payload size is reached."""
+        sent = threading.Event()
+        batcher = LogBatcher(lambda batch: sent.set(), batch_size=100,
+                             payload_size=10, flush_interval=60)
+        batcher.append({"message": "x" * 10})
+        assert sent.wait(5)
+        batcher.stop()
+
+    def test_flush_on_interval(self):
+        """Test that a partial batch is sent after the flush interval."""
+        sent = threading.Event()
+        batcher = LogBatcher(lambda batch: sent.set(), batch_size=100,
+                             flush_interval=0.01)
+        batcher.append({"message": "lonely"})
+        assert sent.wait(5)
+        batcher.stop()
+
+    def test_stop_sends_remaining_records(self):
+        """Test that stop() sends the records left in the buffer."""
+        send = mock.Mock()
+        batcher = LogBatcher(send, batch_size=100, flush_interval=60)
+        batcher.append({"message": "tail"})
+        batcher.stop()
+        send.assert_called_once_with([{"message": "tail"}])
+        assert len(batcher) == 0
+
+    def test_flush_item(self):
+        """Test that flush(item_id) sends the records of the item only."""
+        send = mock.Mock()
+        batcher = LogBatcher(send, batch_size=10, flush_interval=60)
+        batcher.append({"message": "a", "itemUuid": "item1"})
+        batcher.flush("item2")
+        send.assert_not_called()
+        batcher.append({"message": "b", "itemUuid": "item2"})
+        batcher.flush("item2")
+        send.assert_called_once_with([{"message": "a", "itemUuid": "item1"},
+                                      {"message": "b", "itemUuid": "item2"}])
+        batcher.stop()
+
+    def test_file_attachment_is_read_on_append(self):
+        """Test that file-like attachments can be closed after append()."""
+        send = mock.Mock()
+        batcher = LogBatcher(send, batch_size=100, flush_interval=60)
+        with io.BytesIO(b"content") as fh:
+            batcher.append({"message": "file",
+                            "attachment": {"name": "a.txt", "data": fh}})
+        batcher.stop()
+        record = send.call_args[0][0][0]
+        assert record["attachment"] == {"name": "a.txt", "data": b"content"}
+
+    def test_full_buffer_blocks(self):
+        """Test that append() waits while a full buffer is being sent."""
+        release = threading.Event()
+        batches = []
+
+        def send(batch):
+            release.wait()
+            batches.append(batch)
+
+        batcher = LogBatcher(send, batch_size=1, flush_interval=60,
+                             max_buffer_bytes=10)
+        batcher.append({"message": "x" * 6})
+        appended = threading.Event()
+        thread = threading.Thread(target=lambda: [
+            batcher.append({"message": "y" * 6}),
+            batcher.append({"message": "z" * 6}),
+            appended.set()])
+        thread.start()
+        assert not appended.wait(0.1)
+        release.set()
+        assert appended.wait(5)
+        thread.join()
+        batcher.stop()
+        assert sum(len(batch) for batch in batches) == 3
+        assert batcher.dropped_count == 0
+
+    def test_full_buffer_drops_oldest(self, tmpdir):
+        """Test that the oldest records are dropped from a full buffer.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = tmpdir.join("message.txt")
+        path.write("x" * 5)
+        send = mock.Mock()
+        batcher = LogBatcher(send, batch_size=100, flush_interval=60,
+                             max_buffer_bytes=10,
+                             overflow_policy=DROP_OLDEST)
+        batcher.append({"message": "a", "attachment": {
+            "name": "message.txt", "data": TemporaryFilePath(str(path))}})
+        batcher.append({"message": "b" * 6})
+        batcher.append({"message": "c" * 6})
+        batcher.stop()
+        send.assert_called_once_with([{"message": "c" * 6}])
+        assert batcher.dropped_count == 2
+        assert not path.exists()
+
+
+def _record_requests(service):
+    """Record the POST and PUT requests of the service.
+
+    :param service: ReportPortalService
+    :return list:   (method, last url path part) of the sent requests
+    """
+    sent = []
+
+    def recording(method, request):
+        def send(url, **kwargs):
+            sent.append((method, url.rsplit("/", 1)[-1]))
+            return request(url=url, **kwargs)
+        return send
+
+    for method in ("post", "put"):
+        setattr(service.session, method,
+                recording(method, getattr(service.session, method)))
+    return sent
+
+
+class TestServiceLogBatching:
+    """This class contains test methods for batched service logging."""
+
+    @mock.patch.object(ReportPortalService, '_log_batch')
+    def test_log_is_buffered_until_terminate(self, log_batch):
+        """Test that log() does not post and terminate() sends the batch.
+
+        :param log_batch: Mocked ReportPortalService._log_batch() method
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      log_batch_size=10,
+                                      log_batch_interval=60)
+        service.session = mock.Mock()
+        service.launch_id = 'launch'
+        assert service.log('time', 'message', 'INFO', item_id='item') is None
+        service.session.post.assert_not_called()
+        service.terminate()
+        log_batch.assert_called_once_with([{
+            "launchUuid": "launch",
+            "time": "time",
+            "message": "message",
+            "level": "INFO",
+            "itemUuid": "item",
+        }])
+
+    @pytest.mark.parametrize("async_requests", [False, True])
+    def test_logs_sent_before_item_finish(self, async_requests):
+        """Test that the buffered logs of an item are sent before its finish.
+
+        :param async_requests: whether to test the async mode
+        """
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          "token", log_batch_size=10,
+                                          log_batch_interval=60,
+                                          async_requests=async_requests)
+            sent = _record_requests(service)
+            service.start_launch("launch", "1")
+            item_id = service.start_test_item("item", "1", "STEP")
+            service.log("1", "message", "INFO", item_id=item_id)
+            service.finish_test_item(item_id, "2", "PASSED")
+            service.finish_launch("3")
+            service.terminate()
+
+        assert [method for method, _ in sent] == \
+            ["post", "post", "post", "put", "put"]
+        assert sent[2] == ("post", "log")
+        assert stub.log_count == 1
@@ -0,0 +1,149 @@
+"""This modules includes unit tests for the logs.py module."""
+
+import logging
+import threading
+
+from six.moves import mock
+
+from reportportal_client.logs import (
+    RPLogHandler,
+    get_current_item,
+    set_current_item
+)
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+def _logger(handler, name='tests.logs'):
+    """Get a logger sending its records to the handler only.
+
+    :param handler: logging handler
+    :param name:    logger name
+    :return:        logging.Logger
+    """
+    log = logging.getLogger(name)
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    return log
+
+
+class TestCurrentItem:
+    """This class contains test methods for the current item."""
+
+    def test_set_current_item(self):
+        """Test that the current item is set for this thread only."""
+        assert set_current_item('item') is None
+        seen = []
+        thread = threading.Thread(
+            target=lambda: seen.append(get_current_item()))
+        thread.start()
+        thread.join()
+        assert seen == [None]
+        assert set_current_item(None) == 'item'
+
+
+class TestRPLogHandler:
+    """This class contains test methods for RPLogHandler."""
+
+    def test_records_sent_in_batches(self):
+        """Test that records are converted and sent on flush()."""
+        service = mock.Mock()
+        handler = RPLogHandler(service, batch_size=2, flush_interval=60)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        log = _logger(handler)
+        log.warning('first %s', 1)
+        set_current_item('item')
+        try:
+            log.debug('second')
+            log.critical('third')
+        finally:
+            set_current_item(None)
+        handler.close()
+
+        batches = [call[0][0] for call in service.log_batch.call_args_list]
+        assert [len(batch) for batch in batches] == [2, 1]
+        first, second, third = batches[0] + batches[1]
+        assert first['message'] == 'WARNING first 1'
+        assert first['level'] == 'WARN'
+        assert 'itemUuid' not in first
+        assert second['level'] == 'DEBUG'
+        assert second['itemUuid'] == 'item'
+        assert third['level'] == 'ERROR'
+        assert int(third['time']) >= int(first['time'])
+
+    def test_sent_by_background_thread(self):
+        """Test that a full batch is sent without flush()."""
+        sent = threading.Event()
+        service = mock.Mock()
+        service.log_batch.side_effect = lambda batch: sent.set()
+        handler = RPLogHandler(service, batch_size=2, flush_interval=60)
+        log = _logger(handler)
+        log.info('first')
+        log.info('second')
+        assert sent.wait(5)
+        handler.close()
+
+    def test_attachment(self):
+        """Test that the attachment of a record is sent with it."""
+        service = mock.Mock()
+        handler = RPLogHandler(service, flush_interval=60)
+        attachment = {'name': 'a.txt', 'data': b'content'}
+        _logger(handler).info('file', extra={'attachment': attachment})
+        handler.flush()
+        record = service.log_batch.call_args[0][0][0]
+        assert record['attachment'] == attachment
+        handler.close()
+
+    def test_ignored_records(self):
+        """Test that records of the client and dropped records are not sent."""
+        service = mock.Mock()
+        handler = RPLogHandler(service, flush_interval=60, max_queue_size=2)
+        _logger(handler, 'reportportal_client.service').info('ignored')
+        _logger(handler, 'urllib3.connectionpool').info('ignored')
+        log = _logger(handler, 'urllib3_extras')
+        for i in range(3):
+            log.info('record %d', i)
+        handler.close()
+
+        records = service.log_batch.call_args[0][0]
+        assert [record['message'] for record in records] == \
+            ['record 0', 'record 1']
+        assert handler.dropped_count == 1
+
+    def test_send_errors_are_logged(self):
+        """Test that a failed batch does not stop the handler."""
+        service = mock.Mock()
+        service.log_batch.side_effect = [ValueError('failed'), None]
+        handler = RPLogHandler(service, batch_size=1, flush_interval=60)
+        log = _logger(handler)
+        log.info('lost')
+        log.info('sent')
+        handler.close()
+        assert service.log_batch.call_count == 2
+
+    def test_service(self):
+        """Test that the records of an item reach the server."""
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token')
+            handler = RPLogHandler(service, flush_interval=60)
+            log = _logger(handler)
+            service.start_launch(name='launch', start_time='1')
+            item_id = service.start_test_item(name='item', start_time='1',
+                                              item_type='STEP')
+            set_current_item(item_id)
+            try:
+                for i in range(30):
+                    log.info('record %d', i)
+            finally:
+                set_current_item(None)
+            handler.flush()
+            service.finish_test_item(item_id=item_id, end_time='2',
+                                     status='PASSED')
+            service.finish_launch(end_time='2')
+            handler.close()
+            service.terminate()
+
+        assert stub.log_count == 30
+        assert stub.routes[('POST', 'log')] == 2
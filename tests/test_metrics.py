@@ -0,0 +1,147 @@
+"""This modules includes unit tests for the metrics.py module."""
+
+import json
+
+from reportportal_client.metrics import Histogram, Metrics, body_size
+from reportportal_client.retry import RetryPolicy
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+class TestHistogram:
+    """This class contains test methods for Histogram."""
+
+    def test_quantiles(self):
+        """Test that quantiles are estimated by the bucket bounds."""
+        histogram = Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 0.5, 1.5, 4, 7):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 5
+        assert snapshot['sum'] == 13.5
+        assert snapshot['max'] == 7
+        assert snapshot['buckets'] == [(1, 2), (2, 3), (5, 4)]
+        assert histogram.quantile(0.4) == 1
+        assert histogram.quantile(0.99) == 7
+
+    def test_empty(self):
+        """Test that an empty histogram has no quantiles."""
+        assert Histogram().quantile(0.5) is None
+
+    def test_body_size(self):
+        """Test the body size of the supported body types."""
+        assert body_size(None) == 0
+        assert body_size(b'abc') == 3
+        assert body_size(u'é') == 2
+
+
+class TestMetrics:
+    """This class contains test methods for Metrics."""
+
+    def test_snapshot(self):
+        """Test that calls and requests are counted by the method."""
+        metrics = Metrics()
+        metrics.record_call('log', 0.001)
+        metrics.record_call('log', 0.002, error=True)
+        metrics.record_request('log', 0.1, retries=2, bytes_sent=30,
+                               bytes_received=10)
+
+        stats = metrics.snapshot()['log']
+        assert stats['calls'] == 2
+        assert stats['errors'] == 1
+        assert stats['requests'] == 1
+        assert stats['retries'] == 2
+        assert stats['bytes_sent'] == 30
+        assert stats['bytes_received'] == 10
+        assert stats['blocked']['count'] == 2
+        assert stats['latency']['sum'] == 0.1
+
+        metrics.reset()
+        assert metrics.snapshot() == {}
+
+    def test_callbacks(self):
+        """Test that callbacks get every measurement."""
+        metrics = Metrics()
+        received = []
+
+        def failing(metric, method, value):
+            raise ValueError(metric)
+
+        metrics.add_callback(failing)
+        metrics.add_callback(lambda *args: received.append(args))
+        metrics.record_call('start_launch', 0.5)
+        metrics.record_request('start_launch', 0.25, retries=1)
+
+        assert ('calls', 'start_launch', 1) in received
+        assert ('blocked_seconds', 'start_launch', 0.5) in received
+        assert ('latency_seconds', 'start_launch', 0.25) in received
+        assert ('retries', 'start_launch', 1) in received
+
+    def test_prometheus(self):
+        """Test the Prometheus text format."""
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.record_request('log', 0.5, bytes_sent=7)
+
+        text = metrics.to_prometheus()
+        assert 'reportportal_client_bytes_sent_total{method="log"} 7\n' \
+            in text
+        assert 'reportportal_client_latency_seconds_bucket{method="log",' \
+            'le="1"} 1\n' in text
+        assert 'reportportal_client_latency_seconds_bucket{method="log",' \
+            'le="+Inf"} 1\n' in text
+        assert 'reportportal_client_latency_seconds_count{method="log"} 1' \
+            in text
+
+    def test_dump(self, tmpdir):
+        """Test that the metrics are dumped as JSON or Prometheus text.
+
+        :param tmpdir: Pytest fixture
+        """
+        metrics = Metrics()
+        metrics.record_call('log', 0.01)
+        metrics.dump(str(tmpdir.join('metrics.json')))
+        metrics.dump(str(tmpdir.join('metrics.prom')))
+
+        data = json.loads(tmpdir.join('metrics.json').read())
+        assert data['log']['calls'] == 1
+        assert 'calls_total{method="log"} 1' in \
+            tmpdir.join('metrics.prom').read()
+        assert sorted(f.basename for f in tmpdir.listdir()) == \
+            ['metrics.json', 'metrics.prom']
+
+
+class TestServiceMetrics:
+    """This class contains tests of the ReportPortalService metrics."""
+
+    def test_requests_measured(self, tmpdir):
+        """Test that the service records its calls and requests.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = str(tmpdir.join('metrics.json'))
+        with StubServer(error_rate=0.5, seed=3) as stub:
+            service = ReportPortalService(
+                stub.endpoint, stub.project, 'token', metrics_file=path,
+                limiter=False,
+                retry_policy=RetryPolicy(max_attempts=10,
+                                         sleep=lambda delay: None))
+            service.start_launch(name='launch', start_time='1')
+            item_id = service.start_test_item(name='item', start_time='1',
+                                              item_type='STEP')
+            for i in range(5):
+                service.log(time='1', message='text', item_id=item_id,
+                            attachment={'name': 'a', 'data': b'x' * 100})
+            service.finish_test_item(item_id=item_id, end_time='2',
+                                     status='PASSED')
+            service.finish_launch(end_time='2')
+            service.terminate()
+
+        stats = service.metrics.snapshot()
+        assert stats['log']['calls'] == 5
+        assert stats['log_batch']['requests'] == 5
+        assert stats['log_batch']['bytes_sent'] >= 500
+        assert stats['start_test_item']['bytes_received'] > 0
+        retries = sum(method['retries'] for method in stats.values())
+        assert retries == stub.error_count
+        assert json.loads(open(path).read())['log']['calls'] == 5
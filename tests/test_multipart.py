@@ -0,0 +1,124 @@
+"""This modules includes unit tests for the multipart.py module."""
+
+import io
+
+from reportportal_client.multipart import (
+    FilePath,
+    MultipartEncoder,
+    TemporaryFilePath,
+    content_digest,
+    data_size
+)
+
+
+def _fields(data):
+    """Prepare multipart fields with one attachment.
+
+    :param data: attachment data
+    :return:     list of fields for MultipartEncoder
+    """
+    return [
+        ("json_request_part", (None, '[{"message": "m"}]',
+                               "application/json")),
+        ("file", ("a.txt", data, "text/plain")),
+    ]
+
+
+EXPECTED = (
+    b'--bnd\r\n'
+    b'Content-Disposition: form-data; name="json_request_part"\r\n'
+    b'Content-Type: application/json\r\n'
+    b'\r\n'
+    b'[{"message": "m"}]\r\n'
+    b'--bnd\r\n'
+    b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'\r\n'
+    b'0123456789\r\n'
+    b'--bnd--\r\n'
+)
+
+
+class TestMultipartEncoder:
+    """This class contains test methods for MultipartEncoder."""
+
+    def test_encode_bytes(self):
+        """Test encoding of in-memory content."""
+        body = MultipartEncoder(_fields(b'0123456789'), boundary='bnd')
+        assert len(body) == len(EXPECTED)
+        assert body.read() == EXPECTED
+        assert body.content_type == 'multipart/form-data; boundary=bnd'
+
+    def test_file_is_read_in_chunks(self):
+        """Test that file objects are never read beyond the chunk size."""
+        fileobj = io.BytesIO(b'0123456789')
+        body = MultipartEncoder(_fields(fileobj), boundary='bnd',
+                                chunk_size=4)
+        chunks = list(body)
+        assert max(len(chunk) for chunk in chunks) <= 4
+        assert b''.join(chunks) == EXPECTED
+
+    def test_rewind(self):
+        """Test that the body can be read again after rewind()."""
+        fileobj = io.BytesIO(b'xx0123456789')
+        fileobj.seek(2)
+        body = MultipartEncoder(_fields(fileobj), boundary='bnd')
+        body.read()
+        body.rewind()
+        assert body.read() == EXPECTED
+
+    def test_text_stream(self):
+        """Test that a text stream is sized in utf-8 encoded bytes."""
+        text = u'h\u00e9llo \u2603' * 10
+        fileobj = io.StringIO(text)
+        assert data_size(fileobj) == len(text.encode('utf-8'))
+        body = MultipartEncoder(_fields(fileobj), boundary='bnd',
+                                chunk_size=4)
+        encoded = body.read()
+        assert len(body) == len(encoded)
+        assert text.encode('utf-8') in encoded
+
+    def test_file_path(self, tmpdir):
+        """Test that FilePath attachments are read from the disk.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = tmpdir.join('a.txt')
+        path.write_binary(b'0123456789')
+        attachment = FilePath(str(path))
+        assert len(attachment) == 10
+        body = MultipartEncoder(_fields(attachment), boundary='bnd')
+        assert body.read() == EXPECTED
+
+    def test_content_digest(self, tmpdir):
+        """Test that equal contents get one digest whatever their type.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = tmpdir.join('a.txt')
+        path.write_binary(b'0123456789')
+        fileobj = io.BytesIO(b'xx0123456789')
+        fileobj.seek(2)
+
+        digest = content_digest(b'0123456789')
+        assert content_digest(u'0123456789') == digest
+        assert content_digest(FilePath(str(path)), chunk_size=3) == digest
+        assert content_digest(fileobj, chunk_size=3) == digest
+        assert fileobj.tell() == 2
+        assert content_digest(b'012345678') != digest
+
+    def test_temporary_file_removed(self, tmpdir):
+        """Test that a temporary file is removed on close, not on rewind.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = tmpdir.join('a.txt')
+        path.write_binary(b'0123456789')
+        attachment = TemporaryFilePath(str(path))
+        body = MultipartEncoder(_fields(attachment), boundary='bnd')
+        assert content_digest(attachment)
+        body.read()
+        body.rewind()
+        assert body.read() == EXPECTED
+        body.close()
+        assert not path.check()
@@ -0,0 +1,216 @@
+"""This modules includes unit tests for the retry.py module."""
+
+import pytest
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError,
+    ReadTimeout
+)
+from six.moves import mock
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from reportportal_client.errors import CircuitOpenError, ResponseError
+from reportportal_client.retry import (
+    CircuitBreaker,
+    RetryBudget,
+    RetryPolicy
+)
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+def _response(status_code, headers=None):
+    """Make a mocked response with the given status.
+
+    :param status_code: HTTP status code
+    :param headers:     response headers
+    :return:            Mock object
+    """
+    response = mock.Mock(status_code=status_code)
+    response.headers = headers or {}
+    return response
+
+
+class TestRetryPolicy:
+    """This class contains test methods for RetryPolicy."""
+
+    def test_retry_until_success(self):
+        """Test that failed statuses and errors are retried."""
+        sleep = mock.Mock()
+        policy = RetryPolicy(max_attempts=4, sleep=sleep)
+        ok = _response(200)
+        send = mock.Mock(side_effect=[_response(503), ConnectionError(), ok])
+        assert policy.call(send) is ok
+        assert send.call_count == 3
+        assert sleep.call_count == 2
+        assert policy.retries == 2
+
+    def test_last_response_returned(self):
+        """Test that the last failed response is returned."""
+        policy = RetryPolicy(max_attempts=2, sleep=mock.Mock())
+        failed = _response(502)
+        assert policy.call(mock.Mock(return_value=failed)) is failed
+
+    def test_last_error_raised(self):
+        """Test that the last error is raised after the last attempt."""
+        policy = RetryPolicy(max_attempts=2, sleep=mock.Mock())
+        with pytest.raises(ConnectionError):
+            policy.call(mock.Mock(side_effect=ConnectionError()))
+
+    def test_client_errors_not_retried(self):
+        """Test that 4xx responses other than 429 are not retried."""
+        send = mock.Mock(return_value=_response(404))
+        RetryPolicy(sleep=mock.Mock()).call(send)
+        assert send.call_count == 1
+
+    def test_backoff_with_jitter(self):
+        """Test that the delay grows exponentially and is capped."""
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+        for _ in range(20):
+            assert 0 <= policy.backoff(1) <= 2
+            assert 0 <= policy.backoff(10) <= 5
+
+    def test_retry_after_honoured(self):
+        """Test that the Retry-After header sets the delay."""
+        sleep = mock.Mock()
+        policy = RetryPolicy(sleep=sleep)
+        send = mock.Mock(side_effect=[
+            _response(429, {'Retry-After': '7'}), _response(200)])
+        policy.call(send)
+        sleep.assert_called_once_with(7.0)
+
+    def test_too_long_retry_after_not_waited(self):
+        """Test that a Retry-After over max_backoff stops retrying."""
+        sleep = mock.Mock()
+        policy = RetryPolicy(max_backoff=5, sleep=sleep)
+        send = mock.Mock(return_value=_response(503, {'Retry-After': '60'}))
+        policy.call(send)
+        assert send.call_count == 1
+        sleep.assert_not_called()
+
+    def test_budget(self):
+        """Test that retries stop when the budget is exhausted."""
+        budget = RetryBudget(max_retries=1)
+        policy = RetryPolicy(max_attempts=5, budget=budget,
+                             sleep=mock.Mock())
+        send = mock.Mock(return_value=_response(503))
+        policy.call(send)
+        policy.call(send)
+        assert send.call_count == 3
+        budget.reset()
+        assert budget.acquire()
+
+    def test_not_idempotent_retried_if_not_processed(self):
+        """Test that a request which may be processed is not retried."""
+        policy = RetryPolicy(max_attempts=3, sleep=mock.Mock())
+        send = mock.Mock(return_value=_response(502))
+        assert policy.call(send, idempotent=False).status_code == 502
+        with pytest.raises(ReadTimeout):
+            policy.call(mock.Mock(side_effect=ReadTimeout()),
+                        idempotent=False)
+        assert policy.retries == 0
+
+        refused = ConnectionError(MaxRetryError(
+            None, '/', NewConnectionError(None, 'refused')))
+        send = mock.Mock(side_effect=[refused, _response(503),
+                                      _response(201)])
+        assert policy.call(send, idempotent=False).status_code == 201
+        assert policy.retries == 2
+
+        send = mock.Mock(side_effect=[KeyError(), _response(201)])
+        assert policy.call(send, idempotent=False).status_code == 201
+        assert policy.retries == 3
+
+
+class TestCircuitBreaker:
+    """This class contains test methods for CircuitBreaker."""
+
+    def test_open_after_failures(self):
+        """Test that the breaker opens and then lets one probe through."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_open_breaker_fails_fast(self):
+        """Test that requests are not sent while the breaker is open."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        policy = RetryPolicy(max_attempts=1, breaker=breaker,
+                             sleep=mock.Mock())
+        send = mock.Mock(return_value=_response(503))
+        policy.call(send)
+        with pytest.raises(CircuitOpenError):
+            policy.call(send)
+        assert send.call_count == 1
+
+    def test_open_breaker_waits(self):
+        """Test that waiting calls are sent when the probe is allowed."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        sleep = mock.Mock(side_effect=lambda delay: setattr(
+            breaker, 'reset_timeout', 0))
+        policy = RetryPolicy(breaker=breaker, sleep=sleep)
+        response = policy.call(lambda: _response(200), wait=True)
+        assert response.status_code == 200
+        assert sleep.call_count == 1
+
+    def test_probe_error_opens_breaker(self):
+        """Test that an unexpected error of the probe opens the breaker."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        policy = RetryPolicy(breaker=breaker, sleep=mock.Mock())
+        with pytest.raises(ChunkedEncodingError):
+            policy.call(mock.Mock(side_effect=ChunkedEncodingError()))
+        assert breaker.state == CircuitBreaker.OPEN
+        assert policy.call(lambda: _response(200)).status_code == 200
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestServiceRetries:
+    """This class contains test methods for service request retries."""
+
+    def test_request_retried(self):
+        """Test that service calls go through the retry policy."""
+        policy = RetryPolicy(sleep=mock.Mock())
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      retry_policy=policy)
+        service.session = mock.Mock()
+        ok = _response(200)
+        ok.json.return_value = {'id': 'launch'}
+        service.session.post.side_effect = [_response(503), ok]
+        assert service.start_launch('launch', 'time') == 'launch'
+        assert policy.retries == 1
+
+    def test_post_without_uuid_not_retried(self):
+        """Test that an item without a client UUID is not created twice."""
+        policy = RetryPolicy(sleep=mock.Mock())
+        with StubServer(error_rate=1.0, error_status=502) as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', retry_policy=policy,
+                                          limiter=False)
+            service.launch_id = 'launch'
+            with pytest.raises(ResponseError):
+                service.start_test_item('item', 'time', 'STEP')
+            service.get_project_settings()
+        assert stub.routes[('POST', 'item')] == 1
+        assert stub.routes[('GET', 'settings')] == 3
+
+    def test_log_batch_retried_on_dropped_connection(self):
+        """Test that a log batch is sent again on a keep-alive KeyError."""
+        policy = RetryPolicy(sleep=mock.Mock())
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      retry_policy=policy, limiter=False)
+        service.session = mock.Mock()
+        ok = _response(201)
+        ok.text = '{"responses": [{"id": "log"}]}'
+        ok.json.return_value = {'responses': [{'id': 'log'}]}
+        service.session.post.side_effect = [KeyError(), ok]
+        service.log_batch([{'time': '1', 'message': 'm', 'level': 'INFO'}])
+        assert service.session.post.call_count == 2
+        assert policy.retries == 1
@@ -0,0 +1,467 @@
+"""This modules includes unit tests for the scheduler.py module."""
+
+import json
+import threading
+import time
+from functools import partial
+
+import pytest
+from six.moves import mock
+
+from reportportal_client.errors import RequestDroppedError
+from reportportal_client.scheduler import (
+    ATTACHMENT,
+    DROP_OLDEST,
+    LOG,
+    RequestScheduler,
+    Task
+)
+from reportportal_client.service import ReportPortalService
+
+
+class TestRequestScheduler:
+    """This class contains test methods for RequestScheduler."""
+
+    def test_tasks_run_in_submission_order(self):
+        """Test that tasks are executed one by one in FIFO order."""
+        scheduler = RequestScheduler()
+        executed = []
+        for i in range(50):
+            scheduler.submit(executed.append, i)
+        scheduler.stop()
+        assert executed == list(range(50))
+
+    def test_submit_does_not_wait_for_execution(self):
+        """Test that submit() returns before the task is executed."""
+        scheduler = RequestScheduler()
+        release = threading.Event()
+        task = scheduler.submit(release.wait)
+        assert not task.done()
+        release.set()
+        assert task.wait(5) is True
+        scheduler.stop()
+
+    def test_task_exception_is_stored(self):
+        """Test that a failed task keeps its exception for wait()."""
+        task = Task(int, ('not a number',), {})
+        task.run()
+        assert task.done()
+        with pytest.raises(ValueError):
+            task.wait()
+
+    def test_dependent_task_waits(self):
+        """Test that a task is not started before its dependencies."""
+        scheduler = RequestScheduler(workers=4)
+        release = threading.Event()
+        executed = []
+        parent = scheduler.submit(
+            lambda: release.wait() and executed.append('parent'))
+        child = scheduler.schedule(lambda: executed.append('child'),
+                                   after=[parent])
+        sibling = scheduler.submit(executed.append, 'sibling')
+        sibling.wait(5)
+        assert not child.done()
+        assert scheduler.queue_depth == 2
+        release.set()
+        scheduler.stop()
+        assert executed == ['sibling', 'parent', 'child']
+
+    def test_barrier_waits_for_everything(self):
+        """Test that a barrier task runs after all the previous tasks."""
+        scheduler = RequestScheduler(workers=4)
+        executed = []
+        for i in range(20):
+            scheduler.submit(executed.append, i)
+        scheduler.schedule(lambda: executed.append('last'), barrier=True)
+        scheduler.stop()
+        assert executed[-1] == 'last'
+        assert sorted(executed[:-1]) == list(range(20))
+
+    def test_independent_tasks_run_concurrently(self):
+        """Test that several workers execute tasks at the same time."""
+        scheduler = RequestScheduler(workers=3)
+        started = []
+        all_started = threading.Event()
+
+        def task():
+            started.append(1)
+            if len(started) == 3:
+                all_started.set()
+            return all_started.wait(5)
+
+        tasks = [scheduler.submit(task) for _ in range(3)]
+        scheduler.stop()
+        assert all(task.result for task in tasks)
+
+    def test_join_max_depth(self):
+        """Test that join returns once the queue is short enough."""
+        scheduler = RequestScheduler(workers=1)
+        release = threading.Event()
+        blocked = scheduler.submit(release.wait)
+        tasks = [scheduler.submit(int) for _ in range(3)]
+        threading.Timer(0.1, release.set).start()
+        scheduler.join(max_depth=2)
+        assert blocked.done()
+        scheduler.stop()
+        assert all(task.done() for task in tasks)
+
+    def test_task_releases_arguments(self):
+        """Test that an executed task does not keep its payload."""
+        scheduler = RequestScheduler()
+        task = scheduler.submit(len, b'x' * 100)
+        scheduler.stop()
+        assert task.result == 100
+        assert task.args == ()
+        assert task.name == 'len'
+
+    def test_task_wait(self):
+        """Test waiting for a task before and after it is executed."""
+        task = Task(len, (b'xy',))
+        assert not hasattr(task, '__dict__')
+        waiter = threading.Thread(target=task.wait)
+        waiter.start()
+        with pytest.raises(RuntimeError):
+            task.wait(0.01)
+        task.run()
+        waiter.join(5)
+        assert not waiter.is_alive()
+        assert task.wait() == 2
+        assert Task(len, (b'',)).run() is None
+
+    def _blocked(self, **kwargs):
+        """Create a scheduler with its only worker busy until released.
+
+        :return: scheduler and the event releasing the worker
+        """
+        scheduler = RequestScheduler(workers=1, **kwargs)
+        started = threading.Event()
+        release = threading.Event()
+        scheduler.submit(lambda: started.set() or release.wait())
+        started.wait(5)
+        return scheduler, release
+
+    def test_priority_classes(self):
+        """Test that item requests go before logs before attachments."""
+        scheduler, release = self._blocked()
+        executed = []
+        scheduler.schedule(partial(executed.append, 'attachment'),
+                           priority=ATTACHMENT)
+        scheduler.schedule(partial(executed.append, 'log'), priority=LOG)
+        scheduler.schedule(partial(executed.append, 'item'))
+        release.set()
+        scheduler.stop()
+        assert executed == ['item', 'log', 'attachment']
+
+    def test_starvation_protection(self):
+        """Test that a log is not passed over more than the limit."""
+        scheduler, release = self._blocked(starvation_limit=3)
+        executed = []
+        scheduler.schedule(partial(executed.append, 'log'), priority=LOG)
+        for i in range(10):
+            scheduler.submit(executed.append, i)
+        release.set()
+        scheduler.stop()
+        assert executed.index('log') == 3
+
+    def test_dependency_is_promoted(self):
+        """Test that the attachment an item finish waits for goes sooner."""
+        scheduler, release = self._blocked()
+        executed = []
+        scheduler.schedule(partial(executed.append, 'log'), priority=LOG)
+        scheduler.schedule(partial(executed.append, 'other'),
+                           priority=ATTACHMENT)
+        own = scheduler.schedule(partial(executed.append, 'own'),
+                                 priority=ATTACHMENT)
+        scheduler.schedule(partial(executed.append, 'finish'), after=[own])
+        assert scheduler.ready_count == 3
+        release.set()
+        scheduler.stop()
+        assert executed == ['log', 'own', 'finish', 'other']
+
+    def test_log_bytes_block(self):
+        """Test that a log waits for room in a full queue."""
+        scheduler, release = self._blocked(max_log_bytes=10)
+        scheduler.schedule(int, priority=LOG, size=6)
+        scheduled = threading.Event()
+        thread = threading.Thread(target=lambda: scheduled.set() if
+                                  scheduler.schedule(int, priority=LOG,
+                                                     size=6) else None)
+        thread.start()
+        assert not scheduled.wait(0.1)
+        # item requests are not bounded
+        scheduler.schedule(int, priority=None, size=100)
+        release.set()
+        assert scheduled.wait(5)
+        thread.join()
+        scheduler.stop()
+        assert scheduler.log_bytes == 0
+        assert scheduler.dropped_count == 0
+
+    def test_reserve(self):
+        """Test that the reserved room is counted until it is used."""
+        scheduler, release = self._blocked(max_log_bytes=10)
+        scheduler.reserve(6)
+        scheduler.reserve(4)
+        assert scheduler.log_bytes == 10
+        scheduler.release(4)
+        scheduler.schedule(int, priority=LOG, size=6, reserved=True)
+        assert scheduler.log_bytes == 6
+        release.set()
+        scheduler.stop()
+        assert scheduler.log_bytes == 0
+
+    def test_log_bytes_drop_oldest(self):
+        """Test that the oldest queued logs are dropped from a full queue."""
+        scheduler, release = self._blocked(max_log_bytes=10,
+                                           overflow_policy=DROP_OLDEST)
+        discard = mock.Mock()
+        first = scheduler.schedule(int, priority=LOG, size=6,
+                                   discard=discard)
+        second = scheduler.schedule(int, priority=ATTACHMENT, size=6)
+        third = scheduler.schedule(int, priority=LOG, size=6)
+        release.set()
+        scheduler.stop()
+
+        with pytest.raises(RequestDroppedError):
+            first.wait()
+        discard.assert_called_once_with()
+        with pytest.raises(RequestDroppedError):
+            second.wait()
+        assert third.wait() == 0
+        assert scheduler.dropped_count == 2
+        assert scheduler.failed_count == 0
+
+    def test_needed_logs_are_not_dropped(self):
+        """Test that a log an item request waits for is kept."""
+        scheduler, release = self._blocked(max_log_bytes=10,
+                                           overflow_policy=DROP_OLDEST)
+        first = scheduler.schedule(int, priority=LOG, size=6)
+        finish = scheduler.schedule(lambda: 'finished', after=[first])
+        scheduled = threading.Event()
+        thread = threading.Thread(target=lambda: scheduled.set() if
+                                  scheduler.schedule(int, priority=LOG,
+                                                     size=6) else None)
+        thread.start()
+        # nothing can be dropped, so the new log waits for room
+        assert not scheduled.wait(0.1)
+        release.set()
+        assert scheduled.wait(5)
+        thread.join()
+        scheduler.stop()
+        assert first.wait() == 0
+        assert finish.wait() == 'finished'
+        assert scheduler.dropped_count == 0
+
+    def test_unknown_overflow_policy(self):
+        """Test that an unknown overflow policy is rejected."""
+        with pytest.raises(ValueError):
+            RequestScheduler(overflow_policy='drop_newest')
+
+    def test_stop_deadline(self):
+        """Test that the tasks not started in time are dropped."""
+        scheduler, release = self._blocked()
+        tasks = [scheduler.submit(int) for _ in range(3)]
+        assert not scheduler.join(timeout=0.01)
+        assert scheduler.stop(timeout=0.01) == 4
+        for task in tasks:
+            with pytest.raises(RequestDroppedError):
+                task.wait()
+        release.set()
+        assert scheduler.join(timeout=5)
+
+    def test_submit_after_stop(self):
+        """Test that a stopped scheduler rejects new tasks."""
+        scheduler = RequestScheduler()
+        scheduler.stop()
+        with pytest.raises(RuntimeError):
+            scheduler.submit(int)
+
+
+class TestServiceAsyncRequests:
+    """This class contains test methods for the async service mode."""
+
+    @pytest.fixture()
+    def async_service(self):
+        """Prepare ReportPortalService in the async mode."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True)
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 'x'}
+        service.session.put.return_value.json.return_value = {'message': 'x'}
+        return service
+
+    def test_start_methods_return_client_uuids(self, async_service):
+        """Test that launch and item UUIDs are generated on the client.
+
+        :param async_service: Pytest fixture
+        """
+        launch_id = async_service.start_launch('launch', 'time')
+        item_id = async_service.start_test_item('item', 'time', 'STEP')
+        async_service.terminate()
+
+        assert async_service.launch_id == launch_id
+        launch_rq, item_rq = [json.loads(call[1]['data'].decode('utf-8'))
+                              for call in
+                              async_service.session.post.call_args_list]
+        assert launch_rq['uuid'] == launch_id
+        assert item_rq['uuid'] == item_id
+        assert item_rq['launchUuid'] == launch_id
+
+    def test_requests_are_sent_in_background(self, async_service):
+        """Test that calls return before their requests are sent.
+
+        :param async_service: Pytest fixture
+        """
+        release = threading.Event()
+        response = async_service.session.post.return_value
+        async_service.session.post.side_effect = \
+            lambda *args, **kwargs: release.wait() and response
+        item_id = async_service.start_test_item('item', 'time', 'STEP')
+        assert async_service.finish_test_item(item_id, 'time',
+                                              'PASSED') is None
+        assert async_service.log('time', 'message', item_id=item_id) is None
+        async_service.session.put.assert_not_called()
+
+        release.set()
+        async_service.terminate()
+        url = async_service.session.put.call_args[1]['url']
+        assert url.endswith('/item/' + item_id)
+
+    def test_item_requests_follow_causal_order(self):
+        """Test causal order of requests sent by several workers."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True, async_workers=8)
+        sent = []
+
+        def request(method, url, handler, **kwargs):
+            target = kwargs['json'].get('uuid') or url.rsplit('/', 1)[-1]
+            if target == 'log':
+                method, target = target, kwargs['json']['itemUuid']
+            sent.append((method, target))
+
+        service._request = request
+        service.start_launch('launch', 'time', uuid='launch')
+        service.start_test_item('suite', 'time', 'SUITE', uuid='suite')
+        tests = ['test{0}'.format(i) for i in range(5)]
+        for test in tests:
+            service.start_test_item(test, 'time', 'STEP', uuid=test,
+                                    parent_item_id='suite')
+            service.log('time', 'message', item_id=test)
+            service.finish_test_item(test, 'time', 'PASSED')
+        service.finish_test_item('suite', 'time', 'PASSED')
+        service.finish_launch('time')
+        service.terminate()
+
+        assert sent[0] == ('post', 'launch')
+        assert sent[1] == ('post', 'suite')
+        assert sent[-2:] == [('put', 'suite'), ('put', 'finish')]
+        for test in tests:
+            assert sent.index(('post', test)) < sent.index(('log', test)) \
+                < sent.index(('put', test))
+
+    def test_given_uuid_is_used(self, async_service):
+        """Test that the 'uuid' keyword argument overrides generation.
+
+        :param async_service: Pytest fixture
+        """
+        assert async_service.start_launch('launch', 'time',
+                                          uuid='my-uuid') == 'my-uuid'
+        async_service.terminate()
+
+    def _record_requests(self, service, delay):
+        """Replace the requests of the service with a slow recorder.
+
+        :param service: ReportPortalService in the async mode
+        :param delay:   time every request takes in seconds
+        :return list:   (method, item UUID) of the sent requests
+        """
+        sent = []
+
+        def request(method, url, handler, **kwargs):
+            time.sleep(delay)
+            target = kwargs['json'].get('uuid') or url.rsplit('/', 1)[-1]
+            if target == 'log':
+                method, target = target, kwargs['json']['itemUuid']
+            sent.append((method, target))
+
+        service._request = request
+        return sent
+
+    def test_items_are_not_stuck_behind_logs(self):
+        """Test that item requests overtake the logs of other items."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True)
+        sent = self._record_requests(service, 0.001)
+        service.start_launch('launch', 'time', uuid='launch')
+        service.start_test_item('noisy', 'time', 'STEP', uuid='noisy')
+        for _ in range(50):
+            service.log('time', 'debug', item_id='noisy')
+        service.start_test_item('quiet', 'time', 'STEP', uuid='quiet')
+        service.finish_test_item('quiet', 'time', 'PASSED')
+        service.finish_test_item('noisy', 'time', 'PASSED')
+        service.finish_launch('time')
+        service.terminate()
+
+        assert sent.index(('put', 'quiet')) < 10
+        assert sent.count(('log', 'noisy')) == 50
+        assert sent[-2:] == [('put', 'noisy'), ('put', 'finish')]
+
+    def test_items_do_not_wait_for_log_room(self):
+        """Test that a log waiting for room does not hold item requests."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True,
+                                      max_queued_log_bytes=10)
+        sent = self._record_requests(service, 0)
+        opened = threading.Event()
+        request = service._request
+        service._request = lambda *args, **kwargs: (
+            opened.wait(), request(*args, **kwargs))
+        service.start_launch('launch', 'time', uuid='launch')
+        service.start_test_item('noisy', 'time', 'STEP', uuid='noisy')
+        service.log('time', 'x' * 8, item_id='noisy')
+        thread = threading.Thread(target=service.log,
+                                  args=('time', 'x' * 8),
+                                  kwargs={'item_id': 'noisy'})
+        thread.start()
+        thread.join(0.1)
+        # the second log waits for room, the item requests do not
+        assert thread.is_alive()
+        items = threading.Thread(target=lambda: (
+            service.start_test_item('quiet', 'time', 'STEP', uuid='quiet'),
+            service.finish_test_item('quiet', 'time', 'PASSED')))
+        items.start()
+        items.join(5)
+        items_waited = items.is_alive()
+        opened.set()
+        thread.join()
+        items.join()
+        assert not items_waited
+        service.finish_test_item('noisy', 'time', 'PASSED')
+        service.finish_launch('time')
+        service.terminate()
+
+        assert sent.count(('log', 'noisy')) == 2
+        assert service.dropped_logs == 0
+
+    def test_logs_dropped_from_full_queue(self):
+        """Test that the oldest logs are dropped, items are not."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True,
+                                      max_queued_log_bytes=100,
+                                      log_overflow_policy=DROP_OLDEST)
+        sent = self._record_requests(service, 0.005)
+        service.start_launch('launch', 'time', uuid='launch')
+        for i in range(5):
+            item = 'item{0}'.format(i)
+            service.start_test_item(item, 'time', 'STEP', uuid=item)
+            for _ in range(10):
+                service.log('time', 'x' * 30, item_id=item)
+            service.finish_test_item(item, 'time', 'PASSED')
+        service.finish_launch('time')
+        service.terminate()
+
+        logs = sum(1 for method, _ in sent if method == 'log')
+        assert service.dropped_logs > 0
+        assert logs + service.dropped_logs == 50
+        assert sum(1 for method, _ in sent if method == 'put') == 6
+        assert service.failed_requests == 0
@@ -0,0 +1,58 @@
+"""This modules includes unit tests for the serializer.py module."""
+
+import json
+import sys
+
+import pytest
+from six.moves import mock
+
+from reportportal_client.serializer import SERIALIZERS, get_serializer
+from reportportal_client.service import ReportPortalService
+
+
+class TestSerializer:
+    """This class contains test methods for get_serializer()."""
+
+    @pytest.mark.parametrize('name', SERIALIZERS)
+    def test_round_trip(self, name):
+        """Test that every installed serializer produces the same JSON.
+
+        :param name: serializer name
+        """
+        try:
+            dumps = get_serializer(name)
+        except ImportError:
+            pytest.skip('{0} is not installed'.format(name))
+        data = {'message': u'é "quoted"', 'level': None, 'n': [1, 2.5]}
+        encoded = dumps(data)
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded.decode('utf-8')) == data
+
+    def test_fallback(self):
+        """Test that the standard library is used if nothing is installed."""
+        with mock.patch.dict(sys.modules, {'orjson': None, 'ujson': None}):
+            dumps = get_serializer()
+        assert dumps({'a': 1}) == b'{"a":1}'
+
+    def test_callable(self):
+        """Test that a custom serializer is used as is."""
+        dumps = mock.Mock()
+        assert get_serializer(dumps) is dumps
+
+    def test_unknown(self):
+        """Test that an unknown serializer name is rejected."""
+        with pytest.raises(ValueError):
+            get_serializer('yaml')
+
+    def test_service_sends_bytes(self):
+        """Test that the service sends payloads encoded by the serializer."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      json_serializer='json')
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 1}
+        service.start_test_item('item', 'time', 'STEP', parent_item_id='p')
+
+        kwargs = service.session.post.call_args[1]
+        assert kwargs['url'] == 'http://endpoint/api/v2/project/item/p'
+        assert kwargs['headers'] == {'Content-Type': 'application/json'}
+        assert json.loads(kwargs['data'].decode('utf-8'))['name'] == 'item'
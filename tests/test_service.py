@@ -1,13 +1,18 @@
 """This modules includes unit tests for the service.py module."""
 
+import socket
+import subprocess
+import sys
+import threading
 from datetime import datetime
-from pkg_resources import DistributionNotFound
 
 from delayed_assert import expect, assert_expectations
 import pytest
 from six.moves import mock
 
+from reportportal_client.retry import RetryPolicy
 from reportportal_client.service import (
+    _agent_distribution,
     _convert_string,
     _dict_to_payload,
     _get_data,
@@ -15,8 +20,10 @@ from reportportal_client.service import (
     _get_json,
     _get_messages,
     _get_msg,
+    _split_log_batch,
     ReportPortalService
 )
+from tests.stub_server import StubServer
 
 
 class TestServiceFunctions:
@@ -36,6 +43,18 @@ class TestServiceFunctions:
                          {'key': 'b', 'value': '2', 'system': system}]
         assert _dict_to_payload(initial_dict) == expected_list
 
+    def test_dict_to_payload_is_memoised(self):
+        """Test that equal dicts share one payload and are not modified."""
+        attributes = {"os": "linux", "system": True}
+        payload = _dict_to_payload(attributes)
+        assert payload == [{'key': 'os', 'value': 'linux', 'system': True}]
+        assert attributes == {"os": "linux", "system": True}
+        assert _dict_to_payload(dict(attributes)) is payload
+        # equal values of another type are converted on their own
+        assert _dict_to_payload({"a": 1})[0]['value'] == '1'
+        assert _dict_to_payload({"a": True})[0]['value'] == 'True'
+        assert _dict_to_payload({"a": [1]})[0]['value'] == '[1]'
+
     def test_get_id(self, response):
         """Test for the get_id function."""
         assert _get_id(response(200, {"id": 123})) == 123
@@ -60,6 +79,31 @@ class TestServiceFunctions:
         data = {"responses": [{"errorCode": 422, "message": "error"}]}
         assert _get_messages(data) == ['422: error']
 
+    def test_split_log_batch_under_limit(self):
+        """Test that a batch under the limit is not split."""
+        entries = [({"message": "m"}, None) for _ in range(10)]
+        assert _split_log_batch(entries, 10000) == [entries]
+
+    def test_split_log_batch_packing(self):
+        """Test that attachments are packed into the fewest batches."""
+        entries = [
+            ({"message": str(i)}, ("file", (str(i), b"x" * size, None)))
+            for i, size in enumerate([600, 300, 600, 300])
+        ]
+        batches = _split_log_batch(entries, 1400)
+        assert [[e[0]["message"] for e in batch] for batch in batches] == \
+            [["0", "1"], ["2", "3"]]
+
+    def test_split_log_batch_oversized_attachment(self):
+        """Test that an attachment over the limit is sent alone."""
+        entries = [
+            ({"message": "small"}, None),
+            ({"message": "big"}, ("file", ("big", b"x" * 5000, None))),
+            ({"message": "small"}, None),
+        ]
+        batches = _split_log_batch(entries, 1000)
+        assert batches == [[entries[0], entries[2]], [entries[1]]]
+
 
 class TestReportPortalService:
     """This class stores methods which test ReportPortalService."""
@@ -86,11 +130,92 @@ class TestReportPortalService:
         _get_msg = rp_service.finish_launch('name', datetime.now().isoformat())
         assert _get_msg == {"id": 111}
 
+    @mock.patch('reportportal_client.service._get_data')
+    def test_log_batch_split_responses_merged(self, mock_get):
+        """Test that responses of a split log batch are merged.
+
+        :param mock_get: Mocked _get_data() function
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      max_log_batch_payload_size=2000)
+        service.session = mock.Mock()
+        mock_get.side_effect = [{"responses": [{"id": 1}]},
+                                {"responses": [{"id": 2}]}]
+        log_data = [{"message": str(i), "attachment": b"x" * 1500}
+                    for i in range(2)]
+        result = service.log_batch(log_data)
+        assert service.session.post.call_count == 2
+        assert result == {"responses": [{"id": 1}, {"id": 2}]}
+
+    @mock.patch('reportportal_client.service._get_data')
+    def test_log_batch_dedup_attachments(self, mock_get):
+        """Test that a repeated attachment content is sent once per batch.
+
+        :param mock_get: Mocked _get_data() function
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      dedup_attachments=True)
+        service.session = mock.Mock()
+        bodies = []
+
+        def post(data, **kwargs):
+            bodies.append(data.read())
+            return mock.Mock()
+
+        service.session.post.side_effect = post
+        log_data = [
+            {"message": "1", "attachment": {"name": "a", "data": b"x" * 50}},
+            {"message": "2", "attachment": {"name": "b", "data": b"x" * 50}},
+            {"message": "3", "attachment": {"name": "c", "data": b"y" * 50}},
+            {"message": "4", "attachment": {"name": "d", "data": b"y" * 50,
+                                            "mime": "text/plain"}},
+        ]
+        service.log_batch(log_data)
+
+        assert [record["file"]["name"] for record in log_data] == \
+            ["a", "a", "c", "d"]
+        assert bodies[0].count(b"x" * 50) == 1
+        assert bodies[0].count(b"y" * 50) == 2
+        assert service.attachments_deduplicated == 1
+        assert service.attachment_bytes_saved == 50
+
+    @mock.patch('reportportal_client.service._get_data')
+    def test_log_long_message_spilled(self, mock_get, tmpdir):
+        """Test that a long message is sent as a text attachment.
+
+        :param mock_get: Mocked _get_data() function
+        :param tmpdir:   Pytest fixture
+        """
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      max_message_size=100,
+                                      message_preview_size=10)
+        service.session = mock.Mock()
+        bodies = []
+
+        def post(data, **kwargs):
+            bodies.append(data.read())
+            return mock.Mock()
+
+        service.session.post.side_effect = post
+        message = u'\u00e9' + u'0123456789' * 50
+        with mock.patch('tempfile.tempdir', str(tmpdir)):
+            service.log('time', message, item_id='item')
+            service.log('time', message, item_id='item',
+                        attachment={'name': 'a.png', 'data': b'png'})
+
+        part = b'\r\n\r\n' + message.encode('utf-8') + b'\r\n'
+        assert bodies[0].count(part) == 1
+        assert b'... 491 characters more in message-' in bodies[0]
+        assert b'png' in bodies[1] and part in bodies[1]
+        assert tmpdir.listdir() == []
+
     @mock.patch('platform.system', mock.Mock(return_value='linux'))
     @mock.patch('platform.machine', mock.Mock(return_value='Windows-PC'))
     @mock.patch('platform.processor', mock.Mock(return_value='amd'))
-    @mock.patch('pkg_resources.get_distribution',
+    @mock.patch('reportportal_client.service._agent_distribution',
                 mock.Mock(return_value='pytest 5.0'))
+    @mock.patch.dict('reportportal_client.service._system_information',
+                     clear=True)
     def test_get_system_information(self):
         """Test for validate get_system_information."""
 
@@ -106,8 +231,10 @@ class TestReportPortalService:
     @mock.patch('platform.system', mock.Mock(return_value='linux'))
     @mock.patch('platform.machine', mock.Mock(return_value='Windows-PC'))
     @mock.patch('platform.processor', mock.Mock(return_value='amd'))
-    @mock.patch('pkg_resources.get_distribution',
-                mock.Mock(side_effect=DistributionNotFound))
+    @mock.patch('reportportal_client.service._agent_distribution',
+                mock.Mock(return_value=None))
+    @mock.patch.dict('reportportal_client.service._system_information',
+                     clear=True)
     def test_get_system_information_without_pkg(self):
         """Test in negative form for validate get_system_information."""
 
@@ -119,3 +246,212 @@ class TestReportPortalService:
         cond = (ReportPortalService.get_system_information('pytest')
                 == expected_result)
         assert cond
+
+    @mock.patch('platform.processor')
+    @mock.patch.dict('reportportal_client.service._system_information',
+                     clear=True)
+    def test_get_system_information_memoized(self, mock_processor):
+        """Test that the system information is collected once per agent.
+
+        :param mock_processor: Mocked platform.processor() function
+        """
+        mock_processor.return_value = 'amd'
+        first = ReportPortalService.get_system_information('pytest')
+        first['cpu'] = 'changed'
+        second = ReportPortalService.get_system_information('pytest')
+
+        assert second['cpu'] == 'amd'
+        assert mock_processor.call_count == 1
+
+    def test_agent_distribution(self):
+        """Test that installed distributions are found with their version."""
+        assert _agent_distribution('pytest') == \
+            'pytest {0}'.format(pytest.__version__)
+        assert _agent_distribution('not-installed-agent') is None
+
+    def test_import_is_lazy(self):
+        """Test that the package import does not load pkg_resources."""
+        code = ('import sys, reportportal_client; '
+                'sys.exit("pkg_resources" in sys.modules)')
+        assert subprocess.call([sys.executable, '-c', code]) == 0
+
+
+def _report_concurrently(service, threads=8, items=10):
+    """Report items with logs from several threads at once.
+
+    :param service: ReportPortalService with a started launch
+    :param threads: number of threads
+    :param items:   number of items reported by every thread
+    """
+    def report():
+        for _ in range(items):
+            item_id = service.start_test_item(name='item', start_time='1',
+                                              item_type='STEP')
+            for _ in range(3):
+                service.log(time='1', message='text', item_id=item_id)
+            service.finish_test_item(item_id=item_id, end_time='2',
+                                     status='PASSED')
+
+    workers = [threading.Thread(target=report) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+class TestConnectionPooling:
+    """This class contains tests of the service used from many threads."""
+
+    def test_adapters(self):
+        """Test that both schemes get the pool and keep-alive settings."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      pool_connections=3, pool_maxsize=32,
+                                      retries=2)
+        for scheme in ('http://', 'https://'):
+            adapter = service.session.get_adapter(scheme + 'endpoint')
+            assert adapter._pool_connections == 3
+            assert adapter._pool_maxsize == 32
+            assert adapter.max_retries.total == 2
+            assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in \
+                adapter.poolmanager.connection_pool_kw['socket_options']
+        assert service.session.headers['Connection'] == 'keep-alive'
+
+    def test_pool_follows_workers(self):
+        """Test that the default pool fits the async workers."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      async_requests=True, async_workers=16)
+        adapter = service.session.get_adapter('http://endpoint')
+        assert adapter._pool_maxsize == 16
+        service.terminate()
+
+    def test_keep_alive_off(self):
+        """Test that connections are closed after every request."""
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', keep_alive=False)
+            service.start_launch(name='launch', start_time='1')
+            service.start_test_item(name='item', start_time='1',
+                                    item_type='STEP')
+        assert service.session.headers['Connection'] == 'close'
+        assert stub.connection_count == 2
+
+    def test_timeout(self):
+        """Test that the timeout is passed with every request."""
+        service = ReportPortalService('http://endpoint', 'project', 'token',
+                                      timeout=(3, 30))
+        service.session = mock.Mock()
+        service.session.post.return_value.json.return_value = {'id': 1}
+        service.start_launch(name='launch', start_time='1')
+        assert service.session.post.call_args[1]['timeout'] == (3, 30)
+
+    def test_sync_threads_reuse_connections(self):
+        """Test that concurrent callers share a few kept-alive connections.
+
+        Every thread sends its requests by itself in the sync mode.
+        """
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', pool_maxsize=8)
+            service.start_launch(name='launch', start_time='1')
+            _report_concurrently(service)
+            service.finish_launch(end_time='2')
+
+        assert stub.error_count == 0
+        assert stub.routes[('POST', 'item')] == 80
+        assert stub.log_count == 240
+        assert stub.connection_count <= 8
+
+    def test_async_threads(self):
+        """Test that concurrent callers of an async service lose nothing."""
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', async_requests=True,
+                                          async_workers=4, log_batch_size=7)
+            service.start_launch(name='launch', start_time='1')
+            _report_concurrently(service)
+            service.finish_launch(end_time='2')
+            service.terminate()
+
+        assert service.failed_requests == 0
+        assert stub.error_count == 0
+        assert stub.routes[('PUT', 'item')] == 80
+        assert stub.log_count == 240
+        assert stub.connection_count <= 4
+
+
+_EXIT_SCRIPT = """
+import signal, sys, time
+from reportportal_client import ReportPortalService
+service = ReportPortalService(sys.argv[1], 'project', 'token',
+                              async_requests=True, exit_timeout=10,
+                              exit_signals=[signal.SIGTERM])
+service.start_launch(name='launch', start_time='1')
+for _ in range(5):
+    service.start_test_item(name='item', start_time='1', item_type='STEP')
+if sys.argv[2] == 'signal':
+    print('ready')
+    sys.stdout.flush()
+    time.sleep(60)
+"""
+
+
+class TestTermination:
+    """This class contains tests of flush() and terminate()."""
+
+    def test_report(self):
+        """Test that terminate() reports the requests once."""
+        with StubServer(error_rate=0.3, seed=2) as stub:
+            service = ReportPortalService(
+                stub.endpoint, stub.project, 'token', async_requests=True,
+                async_workers=4, limiter=False,
+                retry_policy=RetryPolicy(max_attempts=10,
+                                         sleep=lambda delay: None))
+            service.start_launch(name='launch', start_time='1')
+            _report_concurrently(service, threads=2, items=5)
+            assert service.flush(timeout=10)['pending'] == 0
+            service.finish_launch(end_time='2')
+            report = service.terminate(timeout=10)
+            assert service.terminate() is report
+
+        assert report['sent'] == stub.request_count - stub.error_count
+        assert report['retried'] == stub.error_count
+        assert report['failed'] == report['dropped'] == 0
+        assert report['pending'] == 0
+
+    def test_deadline(self):
+        """Test that terminate() does not wait for a slow server."""
+        with StubServer(latency=0.2) as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', async_requests=True)
+            service.start_launch(name='launch', start_time='1')
+            item_id = service.start_test_item(name='item', start_time='1',
+                                              item_type='STEP')
+            for _ in range(10):
+                service.log(time='1', message='text', item_id=item_id)
+            assert service.flush(timeout=0.05)['pending'] > 0
+            report = service.terminate(timeout=0.3)
+
+        assert report['elapsed'] < 1
+        assert 0 < report['pending'] < 12
+        assert report['dropped'] == report['pending'] - 1
+
+    @pytest.mark.parametrize('how', ['exit', 'signal'])
+    def test_terminated_at_exit(self, how):
+        """Test that the queue is sent when the process exits.
+
+        :param how: 'exit' to end the script, 'signal' to send it SIGTERM
+        """
+        if how == 'signal' and sys.platform.startswith('win'):
+            pytest.skip('SIGTERM kills the process on Windows')
+        with StubServer(latency=0.01) as stub:
+            process = subprocess.Popen(
+                [sys.executable, '-c', _EXIT_SCRIPT, stub.endpoint, how],
+                stdout=subprocess.PIPE)
+            if how == 'signal':
+                assert process.stdout.readline().strip() == b'ready'
+                process.terminate()
+            code = process.wait()
+            process.stdout.close()
+
+        assert code == (-15 if how == 'signal' else 0)
+        assert stub.routes[('POST', 'item')] == 5
@@ -0,0 +1,98 @@
+"""This modules includes tests of the service against the stub server."""
+
+import pytest
+
+from benchmarks.workload import benchmark, percentile
+from reportportal_client.errors import ResponseError
+from reportportal_client.retry import RetryPolicy
+from reportportal_client.service import ReportPortalService
+from tests.stub_server import StubServer
+
+
+@pytest.fixture()
+def stub():
+    """Run a stub server for the test."""
+    with StubServer() as server:
+        yield server
+
+
+class TestStubServer:
+    """This class contains tests of ReportPortalService over HTTP."""
+
+    def test_launch(self, stub):
+        """Test that every service call gets a valid response.
+
+        :param stub: Stub server fixture
+        """
+        service = ReportPortalService(stub.endpoint, stub.project, 'token')
+        service.start_launch(name='launch', start_time='1')
+        item_id = service.start_test_item(name='item', start_time='1',
+                                          item_type='STEP')
+        service.log(time='1', message='text', item_id=item_id)
+        response = service.log(time='1', message='file', item_id=item_id,
+                               attachment={'name': 'a.txt', 'data': b'a'})
+        service.update_test_item(item_id, description='changed')
+        service.finish_test_item(item_id=item_id, end_time='2',
+                                 status='PASSED')
+        service.finish_launch(end_time='2')
+
+        assert len(response['responses']) == 1
+        assert service.get_project_settings()['project'] == stub.project
+        assert stub.log_count == 2
+        assert stub.error_count == 0
+        assert stub.routes[('GET', 'item')] == 1
+
+    def test_async_batched(self, stub):
+        """Test that batched logs of an async service all arrive.
+
+        :param stub: Stub server fixture
+        """
+        service = ReportPortalService(stub.endpoint, stub.project, 'token',
+                                      async_requests=True, async_workers=4,
+                                      log_batch_size=10)
+        service.start_launch(name='launch', start_time='1')
+        for i in range(5):
+            item_id = service.start_test_item(name='item', start_time='1',
+                                              item_type='STEP')
+            for j in range(10):
+                service.log(time='1', message='m', item_id=item_id)
+            service.finish_test_item(item_id=item_id, end_time='2',
+                                     status='PASSED')
+        service.finish_launch(end_time='2')
+        service.terminate()
+
+        assert stub.log_count == 50
+        assert service.failed_requests == 0
+
+    def test_error_injection(self):
+        """Test that injected errors reach the client."""
+        with StubServer(error_rate=1.0, error_status=503) as stub:
+            service = ReportPortalService(
+                stub.endpoint, stub.project, 'token',
+                retry_policy=RetryPolicy(max_attempts=2,
+                                         sleep=lambda delay: None))
+            with pytest.raises(ResponseError):
+                service.start_launch(name='launch', start_time='1')
+        assert stub.request_count == 2
+        assert stub.error_count == 2
+
+
+class TestBenchmark:
+    """This class contains tests of the benchmark harness."""
+
+    def test_report(self):
+        """Test that the workload report counts the requests."""
+        report = benchmark(3, 2, attachments=1, attachment_size=16)
+
+        # launch and 3 items started and finished, 6 logs
+        assert report['requests'] == 14
+        assert report['logs_received'] == 6
+        assert report['bytes_sent'] > 3 * 16
+        assert report['calls']['log']['count'] == 6
+
+    def test_percentile(self):
+        """Test the nearest-rank percentile."""
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) is None
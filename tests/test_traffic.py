@@ -0,0 +1,180 @@
+"""This modules includes unit tests for the traffic.py module."""
+
+import json
+import time
+
+import pytest
+
+from reportportal_client.__main__ import main
+from reportportal_client.multipart import FilePath
+from reportportal_client.service import ReportPortalService
+from reportportal_client.traffic import (
+    TrafficRecorder,
+    TrafficReplayer,
+    _scrub,
+    read_traffic,
+    replay_traffic
+)
+from tests.stub_server import StubServer
+
+
+def _report_launch(service, path):
+    """Report a launch of a suite with steps, logs and attachments.
+
+    :param service: ReportPortalService
+    :param path:    path of a file to attach
+    """
+    service.start_launch(name='launch', start_time='1')
+    suite = service.start_test_item(name='suite', start_time='1',
+                                    item_type='SUITE')
+    for i in range(5):
+        step = service.start_test_item(name='step', start_time='1',
+                                       item_type='STEP',
+                                       parent_item_id=suite)
+        service.log(time='1', message='message %d' % i, level='INFO',
+                    item_id=step)
+        service.log_batch([{'time': '1', 'message': 'batch', 'level': 'INFO',
+                            'item_id': step},
+                           {'time': '1', 'message': 'file', 'level': 'INFO',
+                            'item_id': step,
+                            'attachment': {'name': 'a.txt',
+                                           'data': FilePath(path),
+                                           'mime': 'text/plain'}}])
+        service.finish_test_item(item_id=step, end_time='2',
+                                 status='PASSED')
+    service.finish_test_item(item_id=suite, end_time='2', status='PASSED')
+    service.finish_launch(end_time='3')
+    service.terminate()
+
+
+class TestTrafficRecorder:
+    """This class contains test methods for TrafficRecorder."""
+
+    def test_scrub(self):
+        """Test that the log messages are replaced by their length."""
+        body = {'message': 'secret', 'level': 'INFO'}
+        assert _scrub([body]) == [{'message_size': 6, 'level': 'INFO'}]
+        assert body['message'] == 'secret'
+        assert _scrub({'name': 'item'}) == {'name': 'item'}
+
+    @pytest.mark.parametrize('name', ['traffic.jsonl', 'traffic.jsonl.gz'])
+    def test_record(self, tmpdir, name):
+        """Test that the requests of a service are recorded.
+
+        :param tmpdir: Pytest fixture
+        :param name:   name of the recording
+        """
+        path = str(tmpdir.join(name))
+        attachment = tmpdir.join('a.txt')
+        attachment.write('content')
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', record_traffic=path)
+            _report_launch(service, str(attachment))
+
+        entries = list(read_traffic(path))
+        assert service.recorder.count == len(entries) == stub.request_count
+        launch = entries[0]
+        assert launch['call'] == 'start_launch'
+        assert (launch['method'], launch['api'], launch['path']) == \
+            ('POST', 'v2', 'launch')
+        assert launch['status'] == 201
+        assert len(launch['ids']) == 1
+        log = next(entry for entry in entries if entry['call'] == 'log')
+        assert log['body']['message_size'] == len('message 0')
+        assert 'message' not in log['body']
+        batch = next(entry for entry in entries
+                     if entry['call'] == 'log_batch')
+        assert batch['files'] == [{'name': 'a.txt', 'mime': 'text/plain',
+                                   'size': 7,
+                                   'path': str(attachment)}]
+        assert batch['sent'] > 0
+        assert entries[-1]['call'] == 'finish_launch'
+        assert entries[-1]['api'] == 'v1'
+        assert 'message 0' not in json.dumps(entries)
+
+    def test_broken_line(self, tmpdir):
+        """Test that the tail of a recording written on a crash is skipped.
+
+        :param tmpdir: Pytest fixture
+        """
+        path = str(tmpdir.join('traffic.jsonl'))
+        recorder = TrafficRecorder(path)
+        recorder.record('request', 'get', 'v1', 'settings', time.time())
+        recorder.close()
+        with open(path, 'ab') as f:
+            f.write(b'{"t": 1, "ca')
+        assert [entry['path'] for entry in read_traffic(path)] == \
+            ['settings']
+
+
+class TestTrafficReplayer:
+    """This class contains test methods for TrafficReplayer."""
+
+    @pytest.mark.parametrize('async_requests', [False, True])
+    def test_replay(self, tmpdir, async_requests):
+        """Test that a replay sends the recorded requests in order.
+
+        :param tmpdir:         Pytest fixture
+        :param async_requests: whether to record the async mode
+        """
+        path = str(tmpdir.join('traffic.jsonl'))
+        attachment = tmpdir.join('a.txt')
+        attachment.write('content')
+        with StubServer() as stub:
+            service = ReportPortalService(stub.endpoint, stub.project,
+                                          'token', record_traffic=path,
+                                          async_requests=async_requests,
+                                          async_workers=4)
+            _report_launch(service, str(attachment))
+
+        with StubServer() as target:
+            report = replay_traffic(path, target.endpoint, target.project,
+                                    'token', speed=None, concurrency=4)
+
+        assert target.routes == stub.routes
+        assert target.log_count == stub.log_count == 15
+        assert target.error_count == 0
+        assert report['requests'] == stub.request_count
+        assert report['errors'] == 0
+        assert report['calls']['start_test_item']['count'] == 6
+        assert report['calls']['log_batch']['p99_ms'] > 0
+        # the recorded items are not reused, new ones are created
+        assert not set(stub._items) & set(target._items)
+
+    def test_pace(self):
+        """Test that the requests are sent at the recorded pace."""
+        entries = [{'t': t, 'call': 'request', 'method': 'GET',
+                    'api': 'v1', 'path': 'settings'}
+                   for t in (10.0, 10.2, 10.4)]
+        with StubServer() as target:
+            timings = []
+            for speed in (1.0, 2.0, None):
+                replayer = TrafficReplayer(target.endpoint, target.project,
+                                           'token', speed=speed)
+                timings.append(replayer.replay(entries)['elapsed_s'])
+
+        assert timings[0] >= 0.4
+        assert 0.2 <= timings[1] < timings[0]
+        assert timings[2] < 0.2
+        assert target.routes[('GET', 'settings')] == 9
+
+    def test_replay_command(self, tmpdir, capsys):
+        """Test that the command prints the report of a replay.
+
+        :param tmpdir: Pytest fixture
+        :param capsys: Pytest fixture
+        """
+        path = str(tmpdir.join('traffic.jsonl.gz'))
+        recorder = TrafficRecorder(path)
+        recorder.record('request', 'get', 'v1', 'settings', time.time())
+        recorder.close()
+        with StubServer() as target:
+            code = main(['replay-traffic', path, '--speed', '0',
+                         '--endpoint', target.endpoint, '--project',
+                         target.project, '--token', 'token'])
+
+        assert code == 0
+        report = json.loads(capsys.readouterr().out)
+        assert report['requests'] == 1
+        assert report['calls']['request']['errors'] == 0